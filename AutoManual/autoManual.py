@@ -1,186 +1,232 @@
 import json
 import os
+import sys
 import argparse
-from firecrawl import FirecrawlApp, ScrapeOptions ,AsyncFirecrawlApp
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_openai import AzureOpenAI,OpenAI,AzureChatOpenAI,ChatOpenAI
 
+# 以腳本方式執行時，讓專案根目錄的共用模組可被匯入
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rate_limiter import configure_from_args, invoke_with_rate_limit
+from AutoManual.crawler import crawl_sites, LocalScrapeApp
+from AutoManual.scrape_cache import ScrapeCache, content_hash
 
-transform_manual_prompt = """
-你是一個專業分析網頁內容並生成網頁操作指南的機器人。根據提供的網頁內容Markdown和部分截圖，分析每個網站的使用方法，並撰寫以Markdown為基礎的網站使用指南。
 
-輸入格式：列表，其中包含多個字典，每個字典代表一個網頁。
+page_section_prompt = """
+你是一個專業分析網頁內容並生成網頁操作指南的機器人。根據提供的單一網頁內容Markdown，撰寫此頁面在網站使用指南中的段落。
 
-- `isHome`: Boolean，表示該頁是否是首頁。
-- `url`: 字符串，網頁的URL。
-- `title`: 字符串，網頁的標題 (可以為空)。
-- `description`: 字符串，網頁的描述 (可以為空)。
-- `markdown`: 字符串，網頁的Markdown內容 (用於分析使用)。
-
-# 步驟
-
-1. **分析首頁**: 確認首頁URL，分析其`markdown`內容以生成網站總體概述。
-2. **分析各非首頁頁面**: 每個非首頁頁面的`url`應該有自己獨立的分析。
-    - 描述頁面的內容和功能。
-    - 指導用戶如何從首頁導航到這些頁面。
-3. **整合信息**: 將分析過的內容整合為一份全面的使用指南文檔。
+輸入格式：JSON 物件，包含 `isHome`、`url`、`title`、`description`、`markdown` (與完整指南相同)，以及首頁網址 `homeUrl`。
 
 # 輸出格式
 
-此使用指南應以Markdown格式呈現，包含以下結構：
-
-# 文件標題: 此份文件的內容標題
+只回傳以下 JSON 物件：
 
-## 內容概述
-- 概述: 此網站的內容概述
+{
+  "overview": "若 isHome 為 true，以一到兩句話概述整個網站的內容；否則為空字串",
+  "section": "此頁面的 Markdown 段落"
+}
 
-## 各頁面功能
-1. **首頁**
+首頁的 section 格式：
+**首頁**
    - URL: `[首頁URL]`
    - 主要功能: [對首頁的功能進行簡要描述]
 
-2. **其他頁面**
+其他頁面的 section 格式：
+**[頁面名稱]**
    - URL: `[頁面URL]`
    - 內容與功能: [對頁面內容和功能的詳細介紹]
    - 導航: 從首頁到達此頁的步驟
 
-# 範例
-
-**Input**
-
-```json
-[
-	{
-		"isHome" : true,
-		"url" : "https://exampleHome.com/",
-		"title" : "Home",
-		"description" : "This is the homepage.",
-		"markdown" : "Welcome to the homepage, your starting point to explore."
-	},
-	{
-		"isHome" : false,
-		"url" : "https://example.com/contact",
-		"title" : "Contact",
-		"description" : "Contact us page.",
-		"markdown" : "Find our contact details here."
-	}
-]
-```
-
-**Output**
-
-# 文件標題: 網站使用指南
+# 注意事項
 
-## 內容概述
-- 概述: 這個網站是一個展示其產品和服務的起點頁面，並提供了聯繫資訊。
+- 確保導航指引具體且可操作。
+- section 中的 Markdown 需符合標準，不要加上編號。
+"""
 
-## 各頁面功能
-1. **首頁**
-   - URL: `https://exampleHome.com/`
-   - 主要功能: 主頁歡迎用戶並提供網站的總覽。
+reduce_sections_prompt = """
+你是一個專業整理網站使用指南的機器人。輸入為同一網站多個頁面的手冊段落 (Markdown)，請將它們整合為使用指南中「各頁面功能」章節的內容。
 
-2. **聯繫頁面**
-   - URL: `https://example.com/contact`
-   - 內容與功能: 提供聯繫方式和表單供用戶交互。
-   - 導航: 用戶可以從首頁通過網站頂部的導航欄訪問聯繫頁。
+# 步驟
 
+1. 保留每個頁面的 URL、內容與功能以及導航資訊，不可遺漏任何頁面。
+2. 合併重複或高度相似的頁面段落，統一用詞與格式。
+3. 讓各頁面的導航步驟一致且具體可操作 (例如都以首頁的導航欄為起點)。
 
-# 注意事項
+# 輸出格式
 
-- 請确保每個頁面的分析內容清晰且完整。
-- 確保導航指引具體且可操作。
-- 輸出中的所有Markdown需符合標準，確保格式正確。
+只輸出頁面段落，每個頁面一段、段落之間空一行，不要加上文件標題、概述或編號：
 
+**[頁面名稱]**
+   - URL: `[頁面URL]`
+   - 內容與功能: [對頁面內容和功能的詳細介紹]
+   - 導航: 從首頁到達此頁的步驟
 """
 
-def get_manual(llm, markdown_content_list):
-
-    # Convert the markdown_content_list to the required format
-    formatted_content = []
-    
-    for item in markdown_content_list:
-        formatted_item = {
-            "isHome": item['doc_id'] == 0, # Assuming the first item is the homepage
-            "url": item['url'],
-            "title": item.get('title', ''),
-            "description": item.get('description', ''),
-            "markdown": item.get('markdown', '')
-        }
-        formatted_content.append(formatted_item)
-    
-    user_prompt = json.dumps(formatted_content, ensure_ascii=False, indent=2)
-    
+def text_tokens(text):
+    """估計文字的 token 數：ASCII 約 4 字元一個 token，中文等其他字元以一字一 token 計"""
+    text = text or ''
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii
+
+def truncate_to_tokens(text, budget):
+    """將文字截斷到約 budget 個 token，避免單一頁面超過模型的 context"""
+    if not budget or text_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if text_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "\n\n[內容過長，已截斷]"
+
+def batch_by_token_budget(items, budget):
+    """依序把段落分批，每批的 token 總數不超過 budget；單一段落超過預算時自成一批"""
+    batches, current, used = [], [], 0
+    for item in items:
+        tokens = text_tokens(item)
+        if current and used + tokens > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def split_sections(text):
+    """把合併後的 Markdown 拆回以 ** 開頭的頁面段落"""
+    sections, current = [], []
+    for line in (text or '').splitlines():
+        if line.startswith('**') and current:
+            sections.append("\n".join(current).strip())
+            current = []
+        if line.strip() or current:
+            current.append(line)
+    if current:
+        sections.append("\n".join(current).strip())
+    return [section for section in sections if section]
+
+def summarize_page(llm, page, home_url, page_budget=None):
+    """map 步驟：產生單一頁面的手冊段落，回傳 (section, overview)"""
+    is_home = page['url'] == home_url
+    user_prompt = json.dumps({
+        "isHome": is_home,
+        "url": page['url'],
+        "title": page.get('title', ''),
+        "description": page.get('description', ''),
+        "markdown": truncate_to_tokens(page.get('markdown', ''), page_budget),
+        "homeUrl": home_url
+    }, ensure_ascii=False, indent=2)
     messages = [
-        {"role": "system", "content": transform_manual_prompt},
+        {"role": "system", "content": page_section_prompt},
         {"role": "user", "content": user_prompt}
     ]
-
-    response = llm.invoke(messages)
-
-    return response.content
-
-def get_md_from_web(app, url_list):
-    scrape_options = ScrapeOptions(
-        #includeTags=None,  # 可選：用於包含特定路徑的正規表示式模式
-        #excludeTags=None,  # 可選：用於排除特定路徑的正規表示式模式
-        #blockAds=True,  # 可選：阻止廣告
-        #onlyMainContent=True,  # 可選：僅爬取主要內容
-        formats=['markdown', 'screenshot'],  # 可選：指定返回的格式為 URL 列表
-        #removeBase64Images=True,  # 可選：移除 Base64 圖像
-    )
-
-    doc = []
-    doc_count = 0
-    for url in url_list:
-        # 執行爬取
-        #crawled_data = app.crawl_url(
-        #    url=url,
-        #    limit=1,
-        #    max_depth=0,
-        #    scrape_options=scrape_options
-        #)
-
-        scraped_data = app.scrape_url(
-            url=url,
-            formats=['markdown', 'screenshot'],  # 可選：指定返回的格式為 URL 列表
-            removeBase64Images=True,
-            blockAds=True,  # 可選：阻止廣告
-            #scrape_options=scrape_options
-        )
-
-        if scraped_data:
-            markdown = scraped_data.markdown
-            screenshot_url = scraped_data.screenshot
-            metadata = scraped_data.metadata
-            # 如果有截圖，則下載並轉換為 Base64
-            if screenshot_url:
-                import requests
-                from base64 import b64encode
-
-                response = requests.get(screenshot_url)
-                if response.status_code == 200:
-                    screenshot = b64encode(response.content).decode('utf-8')
-                else:
-                    screenshot = ''
-                    
-            doc.append({
-                'doc_id': doc_count,
-                'url': url,
-                'title': metadata.get('title', 'No Title'),
-                'description': metadata.get('description', 'No Description'),
-                'language': metadata.get('language', ''),
-                'markdown': markdown,
-                'screenshot_url': screenshot_url,
-                'llm_desc': ''
-            })
-            doc_count += 1
-        else:
-            print("未發現 URL 或回應格式非預期。")
-
-        # 爬取網站後間隔60秒，以避免過於頻繁的請求
-        import time
-        time.sleep(30)
-    
-    return doc
+    response = invoke_with_rate_limit(llm, messages, response_format={"type": "json_object"})
+    try:
+        result = json.loads(response.content)
+        return result.get('section', '').strip(), result.get('overview', '').strip() if is_home else ''
+    except json.JSONDecodeError:
+        # 模型沒有回傳 JSON 時，直接把回覆當作段落
+        return response.content.strip(), ''
+
+def merge_sections(llm, web, sections):
+    """reduce 步驟：整合一批頁面段落，無法解析時保留原本的段落"""
+    messages = [
+        {"role": "system", "content": reduce_sections_prompt},
+        {"role": "user", "content": f"網站: {web}\n\n" + "\n\n".join(sections)}
+    ]
+    merged = split_sections(invoke_with_rate_limit(llm, messages).content)
+    return merged or sections
+
+def reduce_sections(llm, web, sections, reduce_budget, workers=4):
+    """以 token 預算分批並行整合段落；reduce_budget 為 0 時不呼叫模型直接沿用"""
+    if not reduce_budget or not sections:
+        return sections
+    batches = batch_by_token_budget(sections, reduce_budget)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        merged = list(executor.map(lambda batch: merge_sections(llm, web, batch), batches))
+    print(f"{web}: {len(sections)} 個段落分 {len(batches)} 批整合")
+    return [section for batch in merged for section in batch]
+
+def assemble_manual(web, overview, sections):
+    """組合出完整手冊，格式與原本一次生成的手冊相同"""
+    lines = [f"# 文件標題: {web} 網站使用指南", "", "## 內容概述", f"- 概述: {overview}", "", "## 各頁面功能"]
+    for number, section in enumerate(sections, 1):
+        lines.append(f"{number}. {section.strip()}")
+        lines.append("")
+    return "\n".join(lines)
+
+def iter_page_summaries(llm, pages, home_url, workers=4, page_budget=None):
+    """並行摘要多個頁面，依完成順序產生 (page, (section, overview) 或 None)；單一頁面失敗不影響其他頁面"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(summarize_page, llm, page, home_url, page_budget): page for page in pages}
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                yield page, future.result()
+            except Exception as e:
+                print(f"摘要頁面失敗 {page['url']}: {type(e).__name__}: {e}")
+                yield page, None
+
+def map_pages(llm, pages, home_url, workers=4, page_budget=None):
+    """並行摘要多個頁面，回傳與 pages 同順序的 (section, overview)，失敗的頁面為 None"""
+    results = {id(page): result for page, result in iter_page_summaries(llm, pages, home_url, workers, page_budget)}
+    return [results[id(page)] for page in pages]
+
+def build_manual_incremental(llm, web, urls, cache, scraped_docs, force_summary=False,
+                             workers=4, reduce_budget=6000, page_budget=12000):
+    """更新快取中的頁面，只重新摘要內容有變動的頁面，再以 map-reduce 組合手冊"""
+    changed = sum(cache.update_page(doc) for doc in scraped_docs)
+    pages = cache.pages(urls)
+    if not pages:
+        cache.save()
+        return None
+    # 首頁為網站的起始網址，即使首頁這次爬取失敗也不會把其他頁面當成首頁
+    home_url = urls[0]
+    todo = [page for page in pages if force_summary or cache.needs_summary(page['url'])]
+    failed = 0
+    try:
+        # 每完成一頁就寫入快取，部分頁面失敗時已完成的摘要與爬取更新仍會保存
+        for page, result in iter_page_summaries(llm, todo, home_url, workers, page_budget):
+            if result is None:
+                failed += 1
+                continue
+            section, overview = result
+            cache.set_section(page['url'], section, overview)
+    finally:
+        cache.save()
+    print(f"{web}: 爬取 {len(scraped_docs)} 頁，內容變動 {changed} 頁，重新摘要 {len(todo) - failed} 頁，"
+          f"摘要失敗 {failed} 頁，沿用快取 {len(pages) - len(todo)} 頁")
+
+    pages = cache.pages(urls)
+    overview = next((page.get('overview') for page in pages if page.get('overview')), '')
+    sections = [page['section'] for page in pages if page.get('section')]
+    # 段落都沒有變動時沿用上次 reduce 的結果
+    sections_hash = content_hash("\n".join(sections) + f"|{reduce_budget}")
+    reduced = cache.get_reduced(sections_hash)
+    if reduced is None:
+        reduced = reduce_sections(llm, web, sections, reduce_budget, workers)
+        cache.set_reduced(sections_hash, reduced)
+    cache.save()
+    return assemble_manual(web, overview, reduced)
+
+def get_manual(llm, markdown_content_list, web='', workers=4, reduce_budget=6000, page_budget=12000):
+    """不使用快取的 map-reduce：每頁並行摘要，再依 token 預算分批整合"""
+    if not markdown_content_list:
+        return ''
+    home_url = min(markdown_content_list, key=lambda item: item['doc_id'])['url']
+    results = [result for result in map_pages(llm, markdown_content_list, home_url, workers, page_budget) if result]
+    overview = next((overview for _, overview in results if overview), '')
+    sections = reduce_sections(llm, web, [section for section, _ in results if section], reduce_budget, workers)
+    return assemble_manual(web or markdown_content_list[0].get('title', ''), overview, sections)
+
+def get_md_from_web(app, url_list, concurrency=4, per_host_rpm=6, global_rpm=None):
+    """同步介面：並行爬取單一網站的網址列表，回傳 doc 列表"""
+    docs = asyncio.run(crawl_sites(app, {'site': url_list}, concurrency, per_host_rpm, global_rpm))
+    return docs['site']
 
 def save_to_json(webname, data):
 
@@ -199,8 +245,23 @@ def main():
     parser.add_argument("--firecrawl-api-key", default="key", type=str, help="YOUR_FIRECRAWL_API_KEY")
     parser.add_argument("--api_model", default="gpt-4.1", type=str, help="api model name")
     parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--webs", type=str, nargs='*', default=['Google Search'], help="Sites to build manuals for ('all' for every site in the test file)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pages scraped at the same time")
+    parser.add_argument("--per_host_rpm", type=float, default=6, help="Requests per minute to the same host")
+    parser.add_argument("--firecrawl_rpm", type=int, default=None, help="Requests per minute allowed by the Firecrawl plan")
+    parser.add_argument("--scraper", type=str, default="firecrawl", choices=["firecrawl", "local"], help="local: offline stand-in for testing")
+    parser.add_argument("--fixtures_dir", type=str, default=None, help="Markdown fixtures for the local scraper")
+    parser.add_argument("--cache_dir", type=str, default="./AutoManual/cache", help="Per-site scrape cache (must not be inside AutoManual/results)")
+    parser.add_argument("--max_age_hours", type=float, default=24, help="Re-scrape cached pages older than this")
+    parser.add_argument("--full_rebuild", action='store_true', help="Ignore the scrape cache: re-scrape and re-summarize every page")
+    parser.add_argument("--summary_workers", type=int, default=4, help="Pages summarized concurrently (map step)")
+    parser.add_argument("--reduce_budget", type=int, default=6000, help="Token budget of sections per reduce call (0 = no reduce call)")
+    parser.add_argument("--page_budget", type=int, default=12000, help="Page markdown is truncated to this many tokens before summarizing")
+    parser.add_argument("--rpm_limit", type=int, default=None, help="Requests per minute shared by all LLM calls of a model")
+    parser.add_argument("--tpm_limit", type=int, default=None, help="Tokens per minute shared by all LLM calls of a model")
 
     args = parser.parse_args()
+    configure_from_args(args)
 
     llm = ChatOpenAI(
         #base_url="https://openrouter.ai/api/v1",
@@ -210,11 +271,12 @@ def main():
     )
 
     # 使用您的 Firecrawl API 金鑰進行初始化
-    app = FirecrawlApp(api_key=args.firecrawl_api_key)
+    if args.scraper == 'local':
+        app = LocalScrapeApp(args.fixtures_dir)
+    else:
+        from firecrawl import AsyncFirecrawlApp
+        app = AsyncFirecrawlApp(api_key=args.firecrawl_api_key)
 
-    webs = ['Amazon', 'Apple', 'ArXiv', 'BBC News', 'Cambridge Dictionary',
-            'Coursera', 'ESPN', 'GitHub', 'Google Map', 'Huggingface', 'Wolfram Alpha','Booking','Google Flights', 'Google Search']
-    webs = ['Google Search']
     # read url list from file
     web_list = []
     with open(args.test_file, 'r', encoding='utf-8') as f:
@@ -224,19 +286,33 @@ def main():
                 (item['web_name'], item['urls'])
             )
 
+    webs = [name for name, _ in web_list] if args.webs == ['all'] else args.webs
+    urls_by_site = {}
     for web in webs :
         if web not in [item[0] for item in web_list]:
             print(f"Web {web} not found in the test file.")
             continue
+        urls_by_site[web] = [url for name, urls in web_list if name == web for url in urls]
 
-        url_list = [url for name, urls in web_list if name == web for url in urls]
+    # 只爬取快取中沒有或已過期的頁面
+    caches = {web: ScrapeCache(args.cache_dir, web) for web in urls_by_site}
+    max_age_hours = None if args.full_rebuild else args.max_age_hours
+    stale_urls = {web: [url for url in urls if not caches[web].is_fresh(url, max_age_hours)]
+                  for web, urls in urls_by_site.items()}
 
-        doc = get_md_from_web(app, url_list)
+    # 所有網站一起並行爬取，各主機分別節流
+    docs_by_site = asyncio.run(crawl_sites(app, stale_urls, args.concurrency, args.per_host_rpm, args.firecrawl_rpm))
 
+    for web, urls in urls_by_site.items():
         output_dir = "./AutoManual/results/" + web
-        # 生成使用手冊
-        automanual = ''
-        automanual = get_manual(llm , doc)
+        # 生成使用手冊，只重新摘要內容有變動的頁面
+        automanual = build_manual_incremental(
+            llm, web, urls, caches[web], docs_by_site.get(web, []), args.full_rebuild,
+            args.summary_workers, args.reduce_budget, args.page_budget
+        )
+        if automanual is None:
+            print(f"Web {web}: no page could be scraped.")
+            continue
         manual_output_file = os.path.join(output_dir, web + '_manual.md')
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
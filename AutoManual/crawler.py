@@ -0,0 +1,207 @@
+"""
+AutoManual 非同步爬蟲
+以 asyncio 同時爬取多個網址：
+- Semaphore 限制同時進行的爬取數量
+- 每個網站主機各自一個 token bucket，取代每頁固定等待 30 秒
+- 可選的全域 bucket，對應 Firecrawl 方案的每分鐘請求上限
+- 截圖以共用連線池的 HTTP session 並行下載
+
+另提供 LocalScrapeApp 作為 Firecrawl 的本地替身，不需網路與 API 金鑰即可測試整個流程。
+"""
+
+import asyncio
+import inspect
+import os
+import sys
+import time
+from base64 import b64encode
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rate_limiter import TokenBucket
+
+
+class HostRateLimiter:
+    """每個主機各自的 token bucket，另可加上所有請求共用的全域上限"""
+
+    def __init__(self, per_host_rpm=6, burst=1, global_rpm=None):
+        self.per_host_rpm = per_host_rpm
+        self.burst = burst
+        self.buckets = {}
+        self.global_bucket = TokenBucket(global_rpm, capacity=max(1, global_rpm // 10)) if global_rpm else None
+        self.throttled_seconds = 0.0
+
+    def _bucket(self, host):
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.per_host_rpm, capacity=self.burst)
+        return self.buckets[host]
+
+    async def acquire(self, url):
+        host = urlparse(url).netloc.lower()
+        wait = self._bucket(host).reserve(1)
+        if self.global_bucket is not None:
+            wait = max(wait, self.global_bucket.reserve(1))
+        if wait > 0:
+            self.throttled_seconds += wait
+            await asyncio.sleep(wait)
+
+
+class _RequestsSession:
+    """沒有 aiohttp 時，以 requests.Session 的連線池在執行緒中下載"""
+
+    def __init__(self):
+        import requests
+        self._session = requests.Session()
+
+    async def get_bytes(self, url, timeout):
+        def fetch():
+            response = self._session.get(url, timeout=timeout)
+            return response.content if response.status_code == 200 else None
+        return await asyncio.to_thread(fetch)
+
+    async def close(self):
+        self._session.close()
+
+
+class _AiohttpSession:
+    def __init__(self, limit):
+        import aiohttp
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit))
+
+    async def get_bytes(self, url, timeout):
+        import aiohttp
+        async with self._session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                return None
+            return await response.read()
+
+    async def close(self):
+        await self._session.close()
+
+
+class ScreenshotFetcher:
+    """以共用連線池下載截圖並轉為 Base64；第一次需要時才建立 HTTP session"""
+
+    def __init__(self, limit=16, timeout=60):
+        self.limit = limit
+        self.timeout = timeout
+        self._session = None
+
+    async def fetch(self, url):
+        """失敗時回傳空字串"""
+        if self._session is None:
+            try:
+                self._session = _AiohttpSession(self.limit)
+            except ImportError:
+                self._session = _RequestsSession()
+        try:
+            content = await self._session.get_bytes(url, self.timeout)
+        except Exception as e:
+            print(f"截圖下載失敗: {url} ({type(e).__name__})")
+            return ''
+        return b64encode(content).decode('utf-8') if content else ''
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def _scrape(app, url, **kwargs):
+    """同時支援 AsyncFirecrawlApp 與同步的 FirecrawlApp"""
+    if inspect.iscoroutinefunction(app.scrape_url):
+        return await app.scrape_url(url=url, **kwargs)
+    return await asyncio.to_thread(app.scrape_url, url=url, **kwargs)
+
+
+async def scrape_page(app, url, limiter, semaphore, fetcher, retries=2):
+    scraped_data = None
+    for attempt in range(retries + 1):
+        # 在 semaphore 之外等待節流，等待中的頁面不佔用爬取名額
+        await limiter.acquire(url)
+        try:
+            async with semaphore:
+                scraped_data = await _scrape(
+                    app, url,
+                    formats=['markdown', 'screenshot'],  # 可選：指定返回的格式為 URL 列表
+                    removeBase64Images=True,
+                    blockAds=True,  # 可選：阻止廣告
+                )
+            break
+        except Exception as e:
+            print(f"爬取失敗 ({attempt + 1}/{retries + 1}): {url} ({type(e).__name__}: {e})")
+
+    if not scraped_data:
+        print(f"未發現 URL 或回應格式非預期: {url}")
+        return None
+
+    metadata = scraped_data.metadata or {}
+    screenshot_url = scraped_data.screenshot
+    # 截圖以共用 session 下載，不佔用爬取名額
+    screenshot = await fetcher.fetch(screenshot_url) if screenshot_url else ''
+    return {
+        'url': url,
+        'title': metadata.get('title', 'No Title'),
+        'description': metadata.get('description', 'No Description'),
+        'language': metadata.get('language', ''),
+        'markdown': scraped_data.markdown,
+        'screenshot_url': screenshot_url,
+        'screenshot': screenshot,
+        'llm_desc': ''
+    }
+
+
+async def crawl_sites(app, urls_by_site, concurrency=4, per_host_rpm=6, global_rpm=None):
+    """
+    並行爬取多個網站，回傳 {網站: doc 列表}。
+    doc_id 依原本網址順序對成功的頁面重新編號，第一個成功的頁面 (首頁) 為 0。
+    """
+    limiter = HostRateLimiter(per_host_rpm, global_rpm=global_rpm)
+    semaphore = asyncio.Semaphore(concurrency)
+    fetcher = ScreenshotFetcher(limit=concurrency * 2)
+    start = time.monotonic()
+    try:
+        jobs = [(site, url) for site, urls in urls_by_site.items() for url in urls]
+        pages = await asyncio.gather(*(scrape_page(app, url, limiter, semaphore, fetcher) for _, url in jobs))
+    finally:
+        await fetcher.close()
+
+    docs = {site: [] for site in urls_by_site}
+    for (site, _), page in zip(jobs, pages):
+        if page is not None:
+            docs[site].append(dict(page, doc_id=len(docs[site])))
+    print(f"爬取 {len(jobs)} 個網址耗時 {time.monotonic() - start:.1f}s，節流等待累計 {limiter.throttled_seconds:.1f}s")
+    return docs
+
+
+class LocalScrapeApp:
+    """
+    Firecrawl 的本地替身：從 fixtures 目錄讀取 <主機>/<路徑>.md，找不到時產生簡單的內容，
+    並以 latency 秒模擬網路延遲
+    """
+
+    def __init__(self, fixtures_dir=None, latency=0.2):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.calls = 0
+
+    def _fixture(self, url):
+        if not self.fixtures_dir:
+            return None
+        parsed = urlparse(url)
+        path = parsed.path.strip('/') or 'index'
+        fixture = os.path.join(self.fixtures_dir, parsed.netloc, path + '.md')
+        if os.path.exists(fixture):
+            with open(fixture, 'r', encoding='utf-8') as f:
+                return f.read()
+        return None
+
+    async def scrape_url(self, url, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        markdown = self._fixture(url) or f"# {url}\n\nLocal stand-in content for {url}."
+        return SimpleNamespace(
+            markdown=markdown,
+            screenshot=None,
+            metadata={'title': urlparse(url).path or url, 'description': 'Local stand-in page', 'language': 'en'},
+        )
@@ -0,0 +1,89 @@
+"""
+AutoManual 爬取快取
+每個網站一個 JSON 檔，以 URL 為鍵記錄頁面內容 hash、爬取時間以及該頁在手冊中的段落。
+重新建置時只爬取過期的頁面、只重新摘要內容有變動的頁面，手冊再由快取的段落組合而成。
+
+快取預設放在 AutoManual/cache/，不可放在 AutoManual/results/<網站>/，
+因為 local_rag 會把該目錄下的所有檔案當成知識庫載入。
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+
+# 存放 reduce 結果的保留鍵，不會與 URL 衝突
+REDUCED_KEY = '_reduced'
+
+
+def content_hash(markdown):
+    """忽略空白差異的內容 hash"""
+    normalized = re.sub(r'\s+', ' ', markdown or '').strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ScrapeCache:
+    def __init__(self, cache_dir, site):
+        self.site = site
+        self.path = os.path.join(cache_dir, f'{site}.json')
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def is_fresh(self, url, max_age_hours):
+        """快取的頁面在 max_age_hours 內爬取過時不需重新爬取"""
+        entry = self.entries.get(url)
+        if not entry or max_age_hours is None:
+            return False
+        return time.time() - entry['fetched_at'] < max_age_hours * 3600
+
+    def update_page(self, doc):
+        """記錄新爬取的頁面，回傳內容是否有變動"""
+        new_hash = content_hash(doc.get('markdown'))
+        entry = self.entries.get(doc['url'], {})
+        changed = entry.get('content_hash') != new_hash
+        entry.update({
+            'url': doc['url'],
+            'title': doc.get('title', ''),
+            'description': doc.get('description', ''),
+            'language': doc.get('language', ''),
+            'markdown': doc.get('markdown', ''),
+            'content_hash': new_hash,
+            'fetched_at': time.time(),
+        })
+        self.entries[doc['url']] = entry
+        return changed
+
+    def needs_summary(self, url):
+        entry = self.entries.get(url)
+        return entry is not None and entry.get('section_hash') != entry['content_hash']
+
+    def set_section(self, url, section, overview=''):
+        entry = self.entries[url]
+        entry['section'] = section
+        entry['overview'] = overview
+        entry['section_hash'] = entry['content_hash']
+        entry['summarized_at'] = time.time()
+
+    def get_reduced(self, sections_hash):
+        """段落未變動時回傳上次 reduce 的結果"""
+        reduced = self.entries.get(REDUCED_KEY)
+        if reduced and reduced['sections_hash'] == sections_hash:
+            return reduced['sections']
+        return None
+
+    def set_reduced(self, sections_hash, sections):
+        self.entries[REDUCED_KEY] = {'sections_hash': sections_hash, 'sections': sections}
+
+    def pages(self, urls):
+        """依 urls 順序回傳已有快取的頁面"""
+        return [self.entries[url] for url in urls if url in self.entries]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
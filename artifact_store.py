@@ -0,0 +1,171 @@
+"""
+內容定址的觀察檔案儲存
+截圖與 accessibility tree 以內容的 SHA-256 存成 <root>/objects/<前兩碼>/<hash><副檔名>，
+相同的頁面 (首頁、動作失敗後未改變的畫面) 在不同步驟與任務之間只存一份。
+task_dir 中原本的檔名 (screenshotN.png、accessibility_treeN.json/.txt) 改為指向物件的相對符號連結
+(不支援時改用硬連結或複製)，評估等讀取端不需修改；每次寫入另追加一行到 task_dir/artifacts.jsonl。
+
+accessibility tree 的 JSON 以精簡格式寫入；--compress_trees 時以 zstd 壓縮 (需要 zstandard 套件)，
+連結名稱加上 .zst，可用 read_artifact 讀回。
+
+未設定 (--artifact_store) 時 save_screenshot / save_accessibility_tree 與原本的寫檔方式相同。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+MANIFEST_FILE = 'artifacts.jsonl'
+# 放在儲存區根目錄的標記檔，讓掃描結果目錄的程式略過整個儲存區
+STORE_MARKER = '.artifact_store'
+ZSTD_SUFFIX = '.zst'
+
+
+class ArtifactStore:
+    def __init__(self, root, compress_trees=False, zstd_level=10):
+        self.root = os.path.abspath(root)
+        self.compressor = None
+        if compress_trees:
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError('--compress_trees requires the zstandard package (pip install zstandard)') from e
+            self.compressor = zstandard.ZstdCompressor(level=zstd_level)
+        self.stats = {'objects_written': 0, 'dedup_hits': 0, 'bytes_in': 0, 'bytes_written': 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+        marker = os.path.join(self.root, STORE_MARKER)
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+
+    def object_path(self, digest, ext):
+        return os.path.join(self.root, 'objects', digest[:2], digest + ext)
+
+    def put(self, data, ext, compress=False):
+        """寫入內容並回傳 (hash, 物件路徑, 是否為重複內容)；已存在的物件不重寫"""
+        digest = hashlib.sha256(data).hexdigest()
+        if compress and self.compressor is not None:
+            ext += ZSTD_SUFFIX
+        path = self.object_path(digest, ext)
+        with self._lock:
+            self.stats['bytes_in'] += len(data)
+            if os.path.exists(path):
+                self.stats['dedup_hits'] += 1
+                return digest, path, True
+        if ext.endswith(ZSTD_SUFFIX):
+            data = self.compressor.compress(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stats['objects_written'] += 1
+            self.stats['bytes_written'] += len(data)
+        return digest, path, False
+
+    def link(self, object_path, dest):
+        """在 dest 建立指向物件的相對符號連結，覆寫既有的檔案 (例如 RAG 重試時同名的截圖)"""
+        tmp_path = f'{dest}.{threading.get_ident()}.tmp'
+        try:
+            os.symlink(os.path.relpath(object_path, os.path.dirname(os.path.abspath(dest))), tmp_path)
+        except (OSError, NotImplementedError):
+            try:
+                os.link(object_path, tmp_path)
+            except OSError:
+                import shutil
+                shutil.copyfile(object_path, tmp_path)
+        os.replace(tmp_path, dest)
+
+    def add(self, dest, data, compress=False):
+        """把內容寫入儲存區，在 dest 建立連結並記錄到所在目錄的 artifacts.jsonl，回傳實際的連結路徑"""
+        ext = os.path.splitext(dest)[1]
+        digest, path, dedup = self.put(data, ext, compress)
+        if path.endswith(ZSTD_SUFFIX):
+            dest += ZSTD_SUFFIX
+        self.link(path, dest)
+        record = {
+            'name': os.path.basename(dest),
+            'sha256': digest,
+            'size': len(data),
+            'object': os.path.relpath(path, self.root),
+            'compression': 'zstd' if path.endswith(ZSTD_SUFFIX) else None,
+            'dedup': dedup,
+            'ts': time.time(),
+        }
+        with open(os.path.join(os.path.dirname(dest), MANIFEST_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return dest
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_written']
+        return stats
+
+
+_store = None
+
+
+def configure_artifact_store(root=None, compress_trees=False):
+    global _store
+    _store = ArtifactStore(root, compress_trees) if root else None
+    return _store
+
+
+def configure_artifact_store_from_args(args, result_dir):
+    """--artifact_store 啟用；儲存區預設為 <result_dir>/artifacts，可用 --artifact_dir 讓多次執行共用"""
+    if not getattr(args, 'artifact_store', False):
+        return configure_artifact_store(None)
+    return configure_artifact_store(getattr(args, 'artifact_dir', None) or os.path.join(result_dir, 'artifacts'),
+                                    getattr(args, 'compress_trees', False))
+
+
+def get_artifact_store():
+    return _store
+
+
+def save_screenshot(driver, img_path):
+    if _store is None:
+        driver.save_screenshot(img_path)
+        return img_path
+    return _store.add(img_path, driver.get_screenshot_as_png())
+
+
+def save_accessibility_tree(save_file, content, obs_nodes_info):
+    """寫出 <save_file>.json 與 <save_file>.txt，與 get_webarena_accessibility_tree 的 save_file 相同"""
+    if _store is None:
+        with open(save_file + '.json', 'w', encoding='utf-8') as fw:
+            json.dump(obs_nodes_info, fw, indent=2, ensure_ascii=False)
+        with open(save_file + '.txt', 'w', encoding='utf-8') as fw:
+            fw.write(content)
+        return
+    compact = json.dumps(obs_nodes_info, ensure_ascii=False, separators=(',', ':'))
+    _store.add(save_file + '.json', compact.encode('utf-8'), compress=True)
+    _store.add(save_file + '.txt', content.encode('utf-8'), compress=True)
+
+
+def read_artifact(path):
+    """讀回觀察檔案的原始內容，.zst 會自動解壓縮"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith(ZSTD_SUFFIX):
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def write_artifact_summary(filename='stats.json'):
+    if _store is None:
+        return None
+    summary = _store.summary()
+    with open(os.path.join(_store.root, filename), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    line = (f"Artifacts: {summary['objects_written']} objects written, {summary['dedup_hits']} deduplicated, "
+            f"{summary['bytes_written'] / 1e6:.1f} MB written of {summary['bytes_in'] / 1e6:.1f} MB")
+    logging.info(line)
+    print(line)
+    return summary
@@ -0,0 +1,160 @@
+"""
+純 Python 熱點路徑的微基準測試 (pytest-benchmark)
+輸入取自錄製的資料：results/examples 的對話紀錄、AutoManual/results 的操作手冊，
+以及 benchmarks/data/ax_trees 中的 AX tree (可用 bench_observation.py --record_ax_trees 錄製)；
+沒有錄製的 AX tree 時使用固定種子產生的樹。
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks/bench_hot_paths.py --benchmark-autosave
+    python -m pytest benchmarks/bench_hot_paths.py --benchmark-compare --benchmark-compare-fail=median:20%
+
+檔名不以 test_ 開頭，一般的 pytest 執行不會收集這些基準測試。
+"""
+
+import glob
+import json
+import logging
+import os
+import random
+import sys
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_DIR)
+from utils_webarena import parse_accessibility_tree, clean_accesibility_tree
+
+AX_TREE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ax_trees')
+# 近似一張 1024x768 PNG 截圖 base64 後的大小
+FAKE_SCREENSHOT_B64 = 'iVBORw0KGgo' + 'A' * 200_000
+ROLES = ['link', 'button', 'StaticText', 'textbox', 'checkbox', 'generic', 'listitem', 'heading', 'img', 'combobox']
+WORDS = 'search result price rating hotel flight course recipe stars review guest room update news'.split()
+
+
+def synthetic_ax_tree(nodes=3000, fanout=6, seed=0):
+    """與 fetch_page_accessibility_tree 輸出相同結構的 AX tree"""
+    rng = random.Random(seed)
+    tree = []
+    for i in range(nodes):
+        role = 'RootWebArea' if i == 0 else rng.choice(ROLES)
+        name = '' if role in ('generic', 'listitem') and rng.random() < 0.6 else \
+            ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+        properties = [{'name': 'focusable', 'value': {'value': True}}] if role in ('link', 'button', 'textbox') else []
+        if role == 'checkbox':
+            properties.append({'name': 'checked', 'value': {'value': 'false'}})
+        tree.append({
+            'nodeId': str(i),
+            'ignored': False,
+            'role': {'value': role},
+            'name': {'value': name},
+            'properties': properties,
+            'childIds': [str(c) for c in range(i * fanout + 1, min(i * fanout + fanout + 1, nodes))],
+            'parentId': str((i - 1) // fanout) if i else 'Root',
+            'backendDOMNodeId': str(1000 + i),
+            'union_bound': [rng.randint(0, 1000), rng.randint(0, 700), rng.randint(10, 300), rng.randint(10, 40)],
+        })
+    return tree
+
+
+def load_ax_trees():
+    trees = {}
+    for path in sorted(glob.glob(os.path.join(AX_TREE_DIR, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            trees[os.path.basename(path)] = json.load(f)
+    return trees or {'synthetic': synthetic_ax_tree()}
+
+
+def load_history(repeat=4):
+    """把 results/examples 的對話紀錄串接成長歷史，並為觀察訊息補回截圖，與執行時的訊息結構相同"""
+    messages = []
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, 'results', 'examples', '*', 'interact_messages.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            messages.extend(msg for msg in json.load(f) if msg['role'] != 'system')
+    if not messages:
+        pytest.skip('no recorded histories in results/examples')
+    history = []
+    for msg in messages * repeat:
+        if msg['role'] == 'user' and isinstance(msg['content'], str) and 'Observation:' in msg['content']:
+            msg = {'role': 'user', 'content': [
+                {'type': 'text', 'text': msg['content']},
+                {'type': 'image_url', 'image_url': {'url': f'data:image/png;base64,{FAKE_SCREENSHOT_B64}'}},
+            ]}
+        history.append(msg)
+    return history
+
+
+def load_manual_documents():
+    documents = []
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, 'AutoManual', 'results', '*', '*_manual.md'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            documents.append({'content': f.read(), 'source': os.path.basename(path), 'type': 'markdown'})
+    if not documents:
+        pytest.skip('no manuals in AutoManual/results')
+    return documents
+
+
+@pytest.fixture(scope='module')
+def ax_trees():
+    return load_ax_trees()
+
+
+@pytest.fixture(scope='module')
+def history():
+    return load_history()
+
+
+@pytest.fixture(scope='module')
+def manual_documents():
+    return load_manual_documents()
+
+
+@pytest.fixture(scope='module')
+def utils():
+    for module in ('numpy', 'PIL', 'langchain_core'):
+        pytest.importorskip(module)
+    import utils
+    return utils
+
+
+@pytest.fixture(scope='module')
+def local_rag():
+    for module in ('numpy', 'sklearn', 'google.generativeai', 'langchain'):
+        pytest.importorskip(module)
+    import local_rag
+    return local_rag
+
+
+def test_parse_accessibility_tree(benchmark, ax_trees):
+    def run():
+        for tree in ax_trees.values():
+            parse_accessibility_tree(tree)
+    benchmark(run)
+
+
+def test_clean_accesibility_tree(benchmark, ax_trees):
+    parsed = [parse_accessibility_tree(tree)[0] for tree in ax_trees.values()]
+    benchmark(lambda: [clean_accesibility_tree(content) for content in parsed])
+
+
+def test_clip_message_and_obs(benchmark, utils, history):
+    benchmark(utils.clip_message_and_obs, history, 3)
+
+
+def test_extract_information(benchmark, utils, history):
+    replies = [msg['content'] for msg in history if msg['role'] == 'assistant' and isinstance(msg['content'], str)]
+    benchmark(lambda: [utils.extract_information(reply) for reply in replies])
+
+
+def test_print_message(benchmark, utils, history, tmp_path):
+    logging.getLogger().setLevel(logging.WARNING)
+    benchmark(utils.print_message, history, str(tmp_path))
+
+
+def test_extract_document_content(benchmark, local_rag, manual_documents):
+    benchmark(lambda: [local_rag.extract_document_content(doc) for doc in manual_documents])
+
+
+def test_chunk_documents(benchmark, local_rag, manual_documents):
+    benchmark(local_rag.chunk_documents, manual_documents)
@@ -0,0 +1,207 @@
+"""
+觀察流程基準測試
+以 headless Chrome 開啟本地伺服器提供的固定網頁，量測每種觀察方式的
+每次耗時 (p50 / p95)、WebDriver 指令與 CDP 往返次數、元素數量與輸出大小，並可與儲存的基準值比較。
+
+    python benchmarks/observation/bench_observation.py --runs 5 --save_baseline benchmarks/observation/baseline.json
+    python benchmarks/observation/bench_observation.py --runs 5 --baseline benchmarks/observation/baseline.json
+
+基準值與機器有關，請在同一台機器上產生與比較。
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from fixtures import write_fixtures
+from server import FixtureServer
+from tracing import percentile
+
+DEFAULT_FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class RoundTripCounter:
+    """計算 WebDriver 指令次數；WebElement 的操作也經由 driver.execute，因此一併計入"""
+
+    def __init__(self, driver):
+        self.counts = Counter()
+        original = driver.execute
+
+        def execute(command, params=None):
+            if command == 'executeCdpCommand':
+                self.counts['cdp:' + (params or {}).get('cmd', '')] += 1
+            else:
+                self.counts[command] += 1
+            return original(command, params)
+
+        driver.execute = execute
+
+    def reset(self):
+        self.counts.clear()
+
+    def snapshot(self):
+        total = sum(self.counts.values())
+        cdp = sum(count for name, count in self.counts.items() if name.startswith('cdp:'))
+        return total, cdp
+
+
+def observe_som(driver, work_dir, detect_all=False):
+    from utils import get_web_element_rect
+    _, elements, text = get_web_element_rect(driver, fix_color=True, detect_all=detect_all)
+    return len(elements), len(text.encode('utf-8'))
+
+
+def observe_accessibility_tree(driver, work_dir):
+    from utils import get_webarena_accessibility_tree
+    content, obs_nodes_info = get_webarena_accessibility_tree(driver)
+    return len(obs_nodes_info), len(content.encode('utf-8'))
+
+
+def observe_screenshot(driver, work_dir):
+    path = os.path.join(work_dir, 'screenshot.png')
+    driver.save_screenshot(path)
+    return None, os.path.getsize(path)
+
+
+def observe_screenshot_encode(driver, work_dir):
+    from utils import encode_image
+    path = os.path.join(work_dir, 'screenshot.png')
+    driver.save_screenshot(path)
+    return None, len(encode_image(path))
+
+
+PIPELINES = {
+    'som': observe_som,
+    'som_all': lambda driver, work_dir: observe_som(driver, work_dir, detect_all=True),
+    'accessibility_tree': observe_accessibility_tree,
+    'screenshot': observe_screenshot,
+    'screenshot_encode': observe_screenshot_encode,
+}
+
+
+def create_driver(width, height):
+    from selenium import webdriver
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--force-device-scale-factor=1')
+    options.add_argument('--disable-gpu')
+    driver = webdriver.Chrome(options=options)
+    driver.set_window_size(width, height)
+    return driver
+
+
+def bench_one(driver, counter, url, pipeline, runs, warmup, work_dir):
+    """每次量測前重新載入頁面，避免上一輪的 SoM 標記影響結果"""
+    observe = PIPELINES[pipeline]
+    durations, trips, cdp_trips = [], [], []
+    elements = output_bytes = None
+    for i in range(warmup + runs):
+        driver.get(url)
+        counter.reset()
+        start = time.perf_counter()
+        elements, output_bytes = observe(driver, work_dir)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            total, cdp = counter.snapshot()
+            durations.append(elapsed * 1000)
+            trips.append(total)
+            cdp_trips.append(cdp)
+    durations.sort()
+    return {
+        'runs': runs,
+        'mean_ms': round(sum(durations) / len(durations), 2),
+        'p50_ms': round(percentile(durations, 50), 2),
+        'p95_ms': round(percentile(durations, 95), 2),
+        'round_trips': max(trips),
+        'cdp_calls': max(cdp_trips),
+        'elements': elements,
+        'output_bytes': output_bytes,
+    }
+
+
+def record_ax_tree(driver, path):
+    """存下未解析的可視範圍 AX tree，供 benchmarks/bench_hot_paths.py 作為錄製輸入"""
+    from utils_webarena import fetch_browser_info, fetch_page_accessibility_tree
+    tree = fetch_page_accessibility_tree(fetch_browser_info(driver), driver, current_viewport_only=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tree, f, ensure_ascii=False)
+
+
+def run_benchmarks(fixtures_dir, pipelines, runs=5, warmup=1, width=1024, height=768, record_dir=None):
+    fixtures = write_fixtures(fixtures_dir)
+    results = {}
+    driver = create_driver(width, height)
+    counter = RoundTripCounter(driver)
+    try:
+        with FixtureServer(fixtures_dir) as base_url, tempfile.TemporaryDirectory() as work_dir:
+            for fixture in fixtures:
+                if record_dir:
+                    os.makedirs(record_dir, exist_ok=True)
+                    driver.get(f'{base_url}/{fixture}')
+                    record_ax_tree(driver, os.path.join(record_dir, fixture.replace('.html', '.axtree.json')))
+                for pipeline in pipelines:
+                    key = f'{fixture}:{pipeline}'
+                    results[key] = bench_one(driver, counter, f'{base_url}/{fixture}', pipeline, runs, warmup, work_dir)
+                    print(f'{key:<45} p50 {results[key]["p50_ms"]:>9.1f} ms  '
+                          f'round trips {results[key]["round_trips"]:>5}  elements {results[key]["elements"]}')
+    finally:
+        driver.quit()
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance=0.2):
+    """回傳退步的項目：p50 超過基準值 (1 + tolerance) 倍，或往返次數增加"""
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = current['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1.0
+        line = (f'{key:<45} p50 {base["p50_ms"]:>9.1f} -> {current["p50_ms"]:>9.1f} ms ({ratio:5.2f}x)  '
+                f'round trips {base["round_trips"]} -> {current["round_trips"]}')
+        regressed = ratio > 1 + tolerance or current['round_trips'] > base['round_trips']
+        print(('REGRESSION ' if regressed else '           ') + line)
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the observation pipeline against local HTML fixtures")
+    parser.add_argument('--fixtures_dir', type=str, default=DEFAULT_FIXTURES_DIR,
+                        help='Directory of .html snapshots; built-in fixtures are generated here if missing')
+    parser.add_argument('--pipelines', type=str, nargs='+', default=list(PIPELINES), choices=list(PIPELINES))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--window_width', type=int, default=1024)
+    parser.add_argument('--window_height', type=int, default=768)
+    parser.add_argument('--output', type=str, default=None, help='Write results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare against this baseline JSON')
+    parser.add_argument('--save_baseline', type=str, default=None, help='Store results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown before flagging a regression')
+    parser.add_argument('--record_ax_trees', type=str, default=None,
+                        help='Also save the raw accessibility tree of every fixture into this directory')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.fixtures_dir, args.pipelines, args.runs, args.warmup,
+                             args.window_width, args.window_height, args.record_ax_trees)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s) against {args.baseline}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+觀察流程基準測試用的固定網頁
+產生與 results/examples 中常見頁面相近的高密度 HTML：搜尋結果、日期選擇器、長表格。
+內容以固定種子產生，每次執行完全相同，結果才能與基準值比較。
+也可以把以 driver.page_source 存下的真實頁面 (.html) 放進 fixtures 目錄一起測試。
+"""
+
+import os
+import random
+
+WORDS = ('flight hotel recipe review price rating course lecture update search result news score '
+         'travel cheap family dinner vegetarian stars guest room weekly popular latest').split()
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 0; }}
+header, nav {{ background: #f4f4f4; padding: 8px; }}
+.card {{ border: 1px solid #ddd; margin: 8px; padding: 8px; }}
+.grid {{ display: grid; grid-template-columns: repeat(7, 40px); gap: 4px; margin: 12px; }}
+td, th {{ border: 1px solid #ccc; padding: 2px 6px; }}
+</style></head>
+<body>
+<header><a href="#">Home</a> <a href="#">Deals</a> <a href="#">Account</a>
+<input type="search" placeholder="Search" aria-label="Search"> <button>Search</button></header>
+{body}
+</body></html>
+"""
+
+
+def _text(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def search_results_page(results=60, seed=0):
+    """搜尋結果：篩選側欄加上大量結果卡片，每張卡片有連結、按鈕與評分"""
+    rng = random.Random(seed)
+    filters = ''.join(
+        f'<label><input type="checkbox" name="f{i}"> {_text(rng, 2)}</label><br>' for i in range(30)
+    )
+    cards = ''.join(
+        f'<div class="card"><a href="#r{i}"><h3>{_text(rng, 6)}</h3></a>'
+        f'<p>{_text(rng, 30)}</p><span>{rng.randint(1, 5)} stars ({rng.randint(10, 9000)} reviews)</span> '
+        f'<button>Save</button> <button>Compare</button> <a href="#d{i}">Details</a></div>'
+        for i in range(results)
+    )
+    body = f'<div style="display:flex"><nav style="width:220px">{filters}</nav><main>{cards}</main></div>'
+    return PAGE_TEMPLATE.format(title='Search results', body=body)
+
+
+def calendar_page(months=3, seed=0):
+    """日期選擇器：每個月 6x7 個日期按鈕，類似 Booking / Google Flights"""
+    rng = random.Random(seed)
+    grids = []
+    for month in range(months):
+        days = ''.join(
+            f'<button aria-label="day {day + 1}" data-price="{rng.randint(80, 900)}">{day % 31 + 1}</button>'
+            for day in range(42)
+        )
+        grids.append(f'<section><h4>Month {month + 1}</h4><div class="grid">{days}</div></section>')
+    body = ('<form><input name="from" placeholder="Where from?"> <input name="to" placeholder="Where to?">'
+            '<select name="class"><option>Economy</option><option>Business</option></select></form>'
+            + ''.join(grids) + '<button>Done</button>')
+    return PAGE_TEMPLATE.format(title='Calendar', body=body)
+
+
+def long_table_page(rows=400, cols=8, seed=0):
+    """長表格：每列有連結與輸入框，大部分位於可視範圍之外"""
+    rng = random.Random(seed)
+    head = ''.join(f'<th>{_text(rng, 1)}</th>' for _ in range(cols))
+    body_rows = ''.join(
+        '<tr>' + f'<td><a href="#row{r}">Row {r}</a></td>'
+        + ''.join(f'<td>{_text(rng, 2)}</td>' for _ in range(cols - 2))
+        + f'<td><input type="text" name="q{r}" size="4"></td></tr>'
+        for r in range(rows)
+    )
+    body = f'<table><tr>{head}</tr>{body_rows}</table>'
+    return PAGE_TEMPLATE.format(title='Long table', body=body)
+
+
+FIXTURES = {
+    'search_results.html': search_results_page,
+    'calendar.html': calendar_page,
+    'long_table.html': long_table_page,
+}
+
+
+def write_fixtures(directory):
+    """寫出內建的固定網頁，已存在的檔案 (例如手動存下的快照) 不會被覆寫"""
+    os.makedirs(directory, exist_ok=True)
+    for name, build in FIXTURES.items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(build())
+    return sorted(name for name in os.listdir(directory) if name.endswith('.html'))
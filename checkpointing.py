@@ -0,0 +1,64 @@
+"""
+LangGraph 檢查點
+每個節點執行後以 SQLite 保存 State 中可序列化的部分 (每個任務一個 thread)，
+瀏覽器、LLM、命令列參數、軌跡寫入器與網頁元素等執行期物件不會寫入。
+
+執行中斷後以 --resume <result_dir> 重新執行：已完成的任務直接略過，
+未完成的任務從最後一個檢查點取回訊息、迭代次數與花費，並在記錄的網址重新開啟瀏覽器後繼續觀察。
+
+需要 langgraph-checkpoint-sqlite 套件。
+"""
+
+import os
+import sqlite3
+
+CHECKPOINT_DB = 'checkpoints.sqlite'
+
+# 執行期物件與可重新產生的大型欄位，不寫入檢查點
+RUNTIME_KEYS = frozenset({'driver', 'llm', 'args', 'trajectory', 'web_elements', 'current_screenshot'})
+
+
+def _strip_checkpoint(checkpoint):
+    channel_values = checkpoint.get('channel_values') or {}
+    stripped = dict(checkpoint)
+    stripped['channel_values'] = {k: v for k, v in channel_values.items() if k not in RUNTIME_KEYS}
+    return stripped
+
+
+def create_checkpointer(result_dir):
+    """建立寫入 <result_dir>/checkpoints.sqlite 的檢查點儲存器"""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class StateSqliteSaver(SqliteSaver):
+        """只保存可序列化欄位的 SqliteSaver"""
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            return super().put(config, _strip_checkpoint(checkpoint), metadata, new_versions)
+
+        def put_writes(self, config, writes, *args, **kwargs):
+            writes = [(channel, value) for channel, value in writes if channel not in RUNTIME_KEYS]
+            return super().put_writes(config, writes, *args, **kwargs)
+
+    conn = sqlite3.connect(os.path.join(result_dir, CHECKPOINT_DB), check_same_thread=False)
+    return StateSqliteSaver(conn)
+
+
+def thread_config(task_id, recursion_limit=100):
+    return {"recursion_limit": recursion_limit, "configurable": {"thread_id": f'task{task_id}'}}
+
+
+def load_resume_state(graph, config):
+    """回傳任務最後一個檢查點保存的欄位；沒有檢查點時回傳 None"""
+    snapshot = graph.get_state(config)
+    values = dict(snapshot.values) if snapshot and snapshot.values else None
+    if not values or not values.get('current_url'):
+        # 尚未完成任何一次觀察，直接重新開始即可
+        return None
+    return {k: v for k, v in values.items() if k not in RUNTIME_KEYS}
+
+
+def discard_thread(checkpointer, config):
+    """任務完成後刪除其檢查點，避免資料庫隨任務數成長"""
+    delete_thread = getattr(checkpointer, 'delete_thread', None)
+    if delete_thread is not None:
+        delete_thread(config["configurable"]["thread_id"])
@@ -0,0 +1,63 @@
+"""
+比較單一動作與批次動作模式
+讀取兩個結果目錄中各任務的 action_stats.json，只比較兩邊都有的任務，
+輸出每個任務與平均的迭代次數 (turns)、LLM 呼叫次數與實際執行的動作數。
+
+用法: python compare_action_modes.py results/single_run results/multi_run
+"""
+
+import argparse
+import json
+import os
+
+METRICS = ("turns", "llm_calls", "actions", "aborted_batches")
+
+
+def load_action_stats(result_dir):
+    """回傳 {任務目錄名稱: action_stats}"""
+    stats = {}
+    for entry in os.scandir(result_dir):
+        path = os.path.join(entry.path, "action_stats.json")
+        if entry.is_dir() and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                stats[entry.name] = json.load(f)
+    return stats
+
+
+def compare(baseline, candidate):
+    common = sorted(set(baseline) & set(candidate))
+    rows = []
+    for task in common:
+        rows.append((task, {m: (baseline[task].get(m, 0), candidate[task].get(m, 0)) for m in METRICS}))
+    means = {}
+    for m in METRICS:
+        if common:
+            means[m] = (sum(r[1][m][0] for r in rows) / len(rows), sum(r[1][m][1] for r in rows) / len(rows))
+    return rows, means
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline_dir", help="Result dir of the single-action run")
+    parser.add_argument("candidate_dir", help="Result dir of the multi-action run")
+    args = parser.parse_args()
+
+    rows, means = compare(load_action_stats(args.baseline_dir), load_action_stats(args.candidate_dir))
+    if not rows:
+        print("No common tasks with action_stats.json found")
+        return
+
+    header = f"{'task':<40}" + "".join(f"{m:>22}" for m in METRICS)
+    print(header)
+    print("-" * len(header))
+    for task, values in rows:
+        print(f"{task:<40}" + "".join(f"{f'{b} -> {c}':>22}" for b, c in values.values()))
+    print("-" * len(header))
+    print(f"{'mean (' + str(len(rows)) + ' tasks)':<40}" + "".join(f"{f'{b:.2f} -> {c:.2f}':>22}" for b, c in means.values()))
+    base_calls, cand_calls = means["llm_calls"]
+    if base_calls:
+        print(f"\nLLM calls per task: {100 * (cand_calls - base_calls) / base_calls:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
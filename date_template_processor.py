@@ -7,24 +7,17 @@ import logging
 import argparse
 import pandas as pd
 import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from rate_limiter import configure_from_args, get_rate_limiter
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_with_openai(question, client, model):
-    """
-    使用OpenAI API分析問題中的日期並替換為模板
-    """
-    prompt = f"""
-    Please analyze the date content in the following question:
-    
-    "{question}"
-    """
-    
-    try:
-
-        SYSTEM_PROMPT = """
+SYSTEM_PROMPT = """
 You are an assistant for detecting and replacing date formats.
 
 The user will provide a series of text descriptions, and you will replace dates in the text with specific templates while preserving the original meaning.
@@ -105,7 +98,35 @@ The output should be in JSON format, either indicating no dates were found or pr
 }
 ```
 """
-        response = client.chat.completions.create(
+
+# 修改 SYSTEM_PROMPT 時需更新版本號，讓快取的判定失效
+PROMPT_VERSION = 'v1'
+
+# 便宜的日期預篩：月份名稱、西元年、數字日期與序數日；都沒有出現時不需呼叫 LLM
+DATE_HINT_PATTERN = re.compile(
+    r"\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+    r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b"
+    r"|\b(?:19|20)\d{2}\b"
+    r"|\b\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?\b"
+    r"|\b\d{1,2}(?:st|nd|rd|th)\b",
+    re.IGNORECASE,
+)
+
+def has_date_hint(question):
+    return DATE_HINT_PATTERN.search(question) is not None
+
+def process_with_openai(question, client, model):
+    """
+    使用OpenAI API分析問題中的日期並替換為模板
+    """
+    prompt = f"""
+    Please analyze the date content in the following question:
+    
+    "{question}"
+    """
+    
+    try:
+        response = get_rate_limiter().call(lambda: client.chat.completions.create(
             model=model,  # 使用參數傳入的模型
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -113,7 +134,7 @@ The output should be in JSON format, either indicating no dates were found or pr
             ],
             temperature=0.1,
             response_format={"type": "json_object"}
-        )
+        ), model=model, est_tokens=(len(SYSTEM_PROMPT) + len(prompt)) // 4)
         
         result = response.choices[0].message.content.strip()
         
@@ -121,49 +142,143 @@ The output should be in JSON format, either indicating no dates were found or pr
             return json.loads(result)
         except json.JSONDecodeError:
             logger.error(f"無法解析API回應為JSON: {result}")
-            return {"has_dates": False}
+            return {"has_dates": False, "error": "invalid_json"}
             
     except Exception as e:
         logger.error(f"調用OpenAI API時發生錯誤: {e}")
-        return {"has_dates": False}
+        return {"has_dates": False, "error": type(e).__name__}
+
+class VerdictCache:
+    """以 (模型, prompt 版本, 問題) 為鍵的判定快取，只追加的 JSONL，載入時以最後一筆為準"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry['key']] = entry['verdict']
+
+    @staticmethod
+    def key(question, model):
+        return hashlib.sha256(f"{model}|{PROMPT_VERSION}|{question}".encode('utf-8')).hexdigest()
+
+    def get(self, question, model):
+        with self._lock:
+            verdict = self.entries.get(self.key(question, model))
+            if verdict is not None:
+                self.hits += 1
+            return verdict
 
-def process_file(input_path, output_path, client, model):
+    def put(self, question, model, verdict):
+        key = self.key(question, model)
+        with self._lock:
+            self.entries[key] = verdict
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'verdict': verdict}, ensure_ascii=False) + '\n')
+
+def load_checkpoint(output_path):
+    """讀取已寫出的項目 id；中斷時可能留下不完整的最後一行，讀取時略過並截掉"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    valid_bytes = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['id'])
+            except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+                break
+            valid_bytes += len(line)
+    with open(output_path, 'rb+') as f:
+        f.truncate(valid_bytes)
+    return done
+
+def analyze_question(question, client, model, cache):
+    """回傳 (判定, 來源)，來源為 prefilter / cache / llm"""
+    if not has_date_hint(question):
+        return {"has_dates": False, "reason": "No date-like tokens found by the regex prefilter"}, 'prefilter'
+    verdict = cache.get(question, model)
+    if verdict is not None:
+        return verdict, 'cache'
+    verdict = process_with_openai(question, client, model)
+    # API 錯誤的結果不寫入快取，下次執行時重試
+    if "error" not in verdict:
+        cache.put(question, model, verdict)
+    return verdict, 'llm'
+
+def apply_verdict(item, result):
+    """根據分析結果更新問題，回傳是否有修改"""
+    if result.get("has_dates", False) and not result.get("all_old_dates", True):
+        item["ques"] = result.get("modified_question", item["ques"])
+        return True
+    return False
+
+def process_file(input_path, output_path, client, model, concurrency=8, cache_path=None):
     """
     處理JSONL文件，替換日期為模板
+    每完成一個項目就追加寫入輸出檔，重新執行時略過輸出檔中已有的 id；
+    全部完成後依輸入順序重寫輸出檔
     """
     logger.info(f"開始處理檔案: {input_path}")
-    
+
     # 讀取JSONL檔案
     with open(input_path, 'r', encoding='utf-8') as file:
         data = [json.loads(line) for line in file if line.strip()]
-    
+
+    done = load_checkpoint(output_path)
+    todo = [item for item in data if item['id'] not in done]
+    if done:
+        logger.info(f"從檢查點繼續：已完成 {len(done)} 項，剩餘 {len(todo)} 項")
+
+    cache = VerdictCache(cache_path if cache_path is not None else output_path + '.verdicts.jsonl')
+    sources = {'prefilter': 0, 'cache': 0, 'llm': 0}
     modified_count = 0
-    processed_data = []
-    
-    for i, item in enumerate(data):
-        logger.info(f"處理項目 {i+1}/{len(data)}: {item['id']}")
-        question = item["ques"]
-        
-        # 使用OpenAI分析問題中的日期
-        result = process_with_openai(question, client, model)
-        
-        # 根據分析結果更新問題
-        if result.get("has_dates", False) and not result.get("all_old_dates", True):
-            item["ques"] = result.get("modified_question", question)
-            logger.info(f"已更新問題: {item['ques']}")
-            modified_count += 1
-        else:
-            logger.info("無需更改")
-        
-        processed_data.append(item)
-    
-    # 將處理後的資料寫入新檔案
-    with open(output_path, 'w', encoding='utf-8') as file:
-        for item in processed_data:
-            file.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    logger.info(f"處理完成。共修改 {modified_count}/{len(data)} 項目。")
+    failed_ids = []
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(analyze_question, item["ques"], client, model, cache): item for item in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            result, source = future.result()
+            sources[source] += 1
+            if "error" in result:
+                # API 錯誤的項目不寫入檢查點，重新執行時會再處理
+                failed_ids.append(item['id'])
+                logger.warning(f"[{i}/{len(todo)}] {item['id']} 分析失敗，稍後重新執行: {result['error']}")
+                continue
+            if apply_verdict(item, result):
+                modified_count += 1
+                logger.info(f"[{i}/{len(todo)}] {item['id']} 已更新問題: {item['ques']}")
+            else:
+                logger.info(f"[{i}/{len(todo)}] {item['id']} 無需更改 ({source})")
+            # 主執行緒是唯一的寫入者，每筆寫完立即 flush 作為檢查點
+            out.write(json.dumps(item, ensure_ascii=False) + '\n')
+            out.flush()
+
+    # 依輸入順序重寫輸出檔
+    with open(output_path, 'r', encoding='utf-8') as file:
+        written = {item['id']: item for item in (json.loads(line) for line in file if line.strip())}
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        for item in data:
+            if item['id'] in written:
+                file.write(json.dumps(written[item['id']], ensure_ascii=False) + '\n')
+    os.replace(tmp_path, output_path)
+
+    logger.info(f"處理完成。本次修改 {modified_count}/{len(todo)} 項目 "
+                f"(預篩略過 {sources['prefilter']}、快取 {sources['cache']}、呼叫 LLM {sources['llm']})。")
     logger.info(f"輸出已儲存至: {output_path}")
+    if failed_ids:
+        logger.warning(f"{len(failed_ids)} 個項目因 API 錯誤未完成且未寫入輸出檔，請重新執行以補齊: {failed_ids}")
+    return failed_ids
 
 def compare_and_export_excel(input_path, output_path, excel_output_path):
     """
@@ -244,6 +359,10 @@ if __name__ == "__main__":
     parser.add_argument("--api_model", default="gpt-4o", type=str, help="OpenAI model name to use")
     parser.add_argument("--input_file", required=True, type=str, help="Path to input JSONL file")
     parser.add_argument("--output_file", required=True, type=str, help="Path to output JSONL file")
+    parser.add_argument("--concurrency", default=8, type=int, help="Maximum in-flight API requests")
+    parser.add_argument("--cache_file", type=str, default=None, help="Verdict cache JSONL (default: <output_file>.verdicts.jsonl)")
+    parser.add_argument("--rpm_limit", type=int, default=None, help="Requests per minute allowed for the model")
+    parser.add_argument("--tpm_limit", type=int, default=None, help="Tokens per minute allowed for the model")
     parser.add_argument("--analyze", action="store_true", help="Analyze differences and export to Excel",default=True)
     parser.add_argument("--excel_output", type=str, help="Path to export Excel analysis (required if --analyze is used)")
     
@@ -251,12 +370,13 @@ if __name__ == "__main__":
     
     # 初始化OpenAI客戶端
     client = OpenAI(api_key=args.api_key)
+    configure_from_args(args)
     
     # 確保輸出目錄存在
     os.makedirs(os.path.dirname(args.output_file), exist_ok=True)
     
     # 處理文件
-    process_file(args.input_file, args.output_file, client, args.api_model)
+    process_file(args.input_file, args.output_file, client, args.api_model, args.concurrency, args.cache_file)
     
     # 如果需要分析差異，匯出Excel
     if args.analyze:
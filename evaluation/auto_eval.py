@@ -1,15 +1,27 @@
 import argparse
 import os
+import sys
 import json
 import time
 import re
 import base64
+import fnmatch
+import hashlib
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from langchain_openai import AzureOpenAI,OpenAI,AzureChatOpenAI,ChatOpenAI
 
+# 以腳本方式執行時，讓專案根目錄的共用模組可被匯入
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rate_limiter import configure_from_args, invoke_with_rate_limit, model_name_of
+from trajectory import load_messages
+from evaluation.eval_cache import VerdictCache, verdict_fingerprint
+from evaluation.results_sink import ResultsSink
+from evaluation.batch_eval import write_batch_input, run_batch, OpenAIBatchBackend, LocalBatchBackend, llm_responder
+from image_prep import configure_image_prep_from_args, get_image_prep, image_data_url
+from artifact_store import STORE_MARKER
+
 SYSTEM_PROMPT = """As an evaluator, you will be presented with four primary components to assist you in your role:
 
 1. **Web Task Instruction**: A clear and specific directive provided in natural language, detailing the online activity to be carried out. These requirements may include conducting searches, verifying information, comparing prices, checking availability, or any other action relevant to the specified web service (such as Amazon, Apple, ArXiv, BBC News, Booking, etc.).
@@ -69,6 +81,69 @@ Operation Trace:
 <assistant_process>
 <num> screenshots at the end: """
 
+# 評估 prompt 的版本，prompt 修改後快取的判定自動失效
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + USER_PROMPT).encode('utf-8')).hexdigest()[:12]
+
+
+# 任務目錄名稱：WebVoyager 為 task<網站>--<編號>，GAIA 為 task<level>-<編號>
+TASK_DIR_PATTERN = re.compile(r"^task(?P<site>.+?)(?:--|-)(?P<id>\d+)$")
+
+
+def parse_task_dir_name(name):
+    """解析任務目錄名稱，回傳 (網站, 編號)，不是任務目錄時回傳 None"""
+    match = TASK_DIR_PATTERN.match(name)
+    if not match:
+        return None
+    return match.group('site'), int(match.group('id'))
+
+
+def discover_task_dirs(root, sites=None, id_range=None, pattern=None):
+    """
+    以 os.scandir 掃描結果目錄，邊掃描邊產生 (網站, 編號, 路徑)，讓評估可以立即開始。
+    非任務目錄的子目錄 (例如每次執行的時間戳記目錄) 會繼續往下掃描；
+    任務目錄本身、以 . 開頭的目錄 (例如 .batch) 與觀察檔案儲存區不會往下掃描。
+    Args:
+        sites: 只保留這些網站
+        id_range: (最小編號, 最大編號)，包含兩端
+        pattern: 目錄名稱的 glob 樣式
+    """
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = sorted(os.scandir(current), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            if entry.name.startswith('.'):
+                continue
+            parsed = parse_task_dir_name(entry.name)
+            if parsed is None:
+                if not entry.name.startswith('task') and \
+                        not os.path.exists(os.path.join(entry.path, STORE_MARKER)):
+                    subdirs.append(entry.path)
+                continue
+            site, idx = parsed
+            if sites and site not in sites:
+                continue
+            if id_range and not (id_range[0] <= idx <= id_range[1]):
+                continue
+            if pattern and not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            yield site, idx, entry.path
+        stack.extend(reversed(subdirs))
+
+
+def parse_id_range(text):
+    """將 "0-45" 或 "7" 轉為 (最小, 最大)"""
+    if not text:
+        return None
+    low, _, high = text.partition('-')
+    return int(low), int(high or low)
+
 
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
@@ -89,11 +164,16 @@ def extract_assistant_process(messages):
     return "\n\n".join(assistant_responses) , step
 
 
-def auto_eval_by_gpt4v(process_dir, llm, img_num):
+def build_eval_request(process_dir, llm, img_num, cache=None, force=False):
+    """
+    準備單一任務的評審請求，回傳 (verdict, request)。
+    不需呼叫評審模型時 (沒有答案、快取命中) verdict 為評估結果、request 為 None；
+    否則 request 包含 messages 以及解析回覆時需要的任務資訊。
+    """
     print(f'--------------------- {process_dir} ---------------------')
     res_files = sorted(os.listdir(process_dir))
-    with open(os.path.join(process_dir, 'interact_messages.json'), encoding='utf-8') as fr:
-        it_messages = json.load(fr)
+    # 優先串流讀取逐步軌跡，舊的結果目錄則讀取 interact_messages.json
+    it_messages = load_messages(process_dir)
 
     if len(it_messages) <= 1:
         print('Not find answer for ' + process_dir + ' only system messages')
@@ -106,7 +186,7 @@ def auto_eval_by_gpt4v(process_dir, llm, img_num):
             'answer': '' , # 新增空的 answer 欄位
             'step_count': 0,
             'steps': []
-        }
+        }, None
 
     task_info = it_messages[1]["content"]
     if type(task_info) == list:
@@ -134,7 +214,7 @@ def auto_eval_by_gpt4v(process_dir, llm, img_num):
             'answer': '',  # 新增空的 answer 欄位
             'step_count' : img_num,
             'steps': []
-        }
+        }, None
     pattern_ans = r"ANSWER[:; ]+\[?(.[^\]]*)\]?"
     matches_ans = re.search(pattern_ans, ans_info)
     answer_content = matches_ans.group(1).strip()
@@ -157,12 +237,26 @@ def auto_eval_by_gpt4v(process_dir, llm, img_num):
 
     matches.sort(key=lambda x: x[1])
     end_files = matches[-img_num:]
+
+    # 軌跡未改變時沿用快取的判定，--force 時重新評估並覆寫
+    fingerprint = None
+    if cache is not None:
+        fingerprint = verdict_fingerprint(
+            answer_content, assistant_process,
+            [os.path.join(process_dir, png_file[0]) for png_file in end_files],
+            model_name_of(llm), PROMPT_VERSION
+        )
+        cached = None if force else cache.get(process_dir, fingerprint)
+        if cached is not None:
+            print('Using cached verdict:', cached['result'])
+            return cached, None
+
     for png_file in end_files:
-        b64_img = encode_image(os.path.join(process_dir, png_file[0]))
+        # 經共用前處理縮小/重新編碼，結果依內容 hash 快取
         whole_content_img.append(
             {
                 'type': 'image_url',
-                'image_url': {"url": f"data:image/png;base64,{b64_img}"}
+                'image_url': {"url": image_data_url(os.path.join(process_dir, png_file[0]))}
             }
         )
 
@@ -181,67 +275,33 @@ def auto_eval_by_gpt4v(process_dir, llm, img_num):
             + [{'type': 'text', 'text': "Your verdict:\n"}]
         }
     ]
-    while True:
-        policyError = False
-        try:
-            print('Calling gpt4v API to get the auto evaluation......')
-            # 添加response_format參數強制JSON輸出
-            response = llm.invoke(
-                messages,
-                response_format={"type": "json_object"}
-            )
-            token_usage = response.response_metadata.get('token_usage', {})
-            prompt_tokens = token_usage.get('prompt_tokens', 0)
-            completion_tokens = token_usage.get('completion_tokens', 0)
-
-            print('Prompt Tokens:', prompt_tokens, ';',
-                  'Completion Tokens:', completion_tokens)
-            print('Cost:', prompt_tokens/1000 * 0.01
-                  + completion_tokens / 1000 * 0.03)
-
-            print('API call complete...')
-            break
-        except Exception as e:
-            print(e)
-            if type(e).__name__ == 'RateLimitError':
-                time.sleep(10)
-            elif type(e).__name__ == 'APIError':
-                time.sleep(15)
-            elif type(e).__name__ == 'InvalidRequestError':
-                # 嘗試不使用response_format參數再試一次
-                try:
-                    print('Retrying without response_format parameter...')
-                    response = llm.invoke(messages)
-                    break
-                except:
-                    exit(0)
-            elif "ResponsibleAIPolicyViolation" in str(e) and "content_filter" in str(e):
-                print("Content ResponsibleAIPolicyViolation triggered. Breaking out of the loop.")
-                policyError = True
-                break
-            else:
-                time.sleep(10)
-                
-    if policyError:
-        return {
-            'result': 'NOT SUCCESS',
-            'use_rag': use_rag,
-            'reason': 'Content policy violation',
-            'task_question': task_question,
-            'answer': answer_content,
-            'step_count': step_count,
-            'steps': []
-        }
-    
-    gpt_4v_res = response.content
-    print_message = messages[1]
-    for idx in range(len(print_message['content'])):
-        if print_message['content'][idx]['type'] == 'image_url':
-            print_message['content'][idx]['image_url'] = {"url": "data:image/png;base64, b64_img"}
-
-    #print(print_message)
-    #print(gpt_4v_res)
 
+    return None, {
+        'process_dir': process_dir,
+        'messages': messages,
+        'use_rag': use_rag,
+        'task_question': task_question,
+        'answer': answer_content,
+        'step_count': step_count,
+        'fingerprint': fingerprint,
+    }
+
+
+def error_verdict(request, reason):
+    """評審呼叫失敗時的結果"""
+    return {
+        'result': 'NOT SUCCESS',
+        'use_rag': request['use_rag'],
+        'reason': reason,
+        'task_question': request['task_question'],
+        'answer': request['answer'],
+        'step_count': request['step_count'],
+        'steps': []
+    }
+
+
+def parse_eval_response(gpt_4v_res, request, cache=None):
+    """解析評審回覆並寫入快取；無法解析時回傳 None"""
     # 使用新的JSON解析邏輯
     try:
         # 嘗試解析JSON回應
@@ -268,96 +328,161 @@ def auto_eval_by_gpt4v(process_dir, llm, img_num):
         print('Auto_eval_res:', auto_eval_res)
         print('Evaluation Reason:', thought)
         
-        return {
+        verdict = {
             'result': auto_eval_res,
-            'use_rag': use_rag,
+            'use_rag': request['use_rag'],
             'reason': thought,
-            'task_question': task_question,
-            'answer': answer_content,
-            'step_count': step_count,
+            'task_question': request['task_question'],
+            'answer': request['answer'],
+            'step_count': request['step_count'],
             'steps': steps
         }
+        if cache is not None:
+            cache.put(request['process_dir'], request['fingerprint'], verdict)
+        return verdict
     except Exception as e:
         print(f"Error parsing JSON response: {e}")
         return
 
+
+def auto_eval_by_gpt4v(process_dir, llm, img_num, cache=None, force=False):
+    verdict, request = build_eval_request(process_dir, llm, img_num, cache, force)
+    if request is None:
+        return verdict
+    messages = request['messages']
+
+    policyError = False
+    apiError = None
+    try:
+        print('Calling gpt4v API to get the auto evaluation......')
+        # 添加response_format參數強制JSON輸出，速率限制與重試由共用限制器處理
+        response = invoke_with_rate_limit(
+            llm,
+            messages,
+            response_format={"type": "json_object"}
+        )
+        token_usage = response.response_metadata.get('token_usage', {})
+        prompt_tokens = token_usage.get('prompt_tokens', 0)
+        completion_tokens = token_usage.get('completion_tokens', 0)
+
+        print('Prompt Tokens:', prompt_tokens, ';',
+              'Completion Tokens:', completion_tokens)
+        print('Cost:', prompt_tokens/1000 * 0.01
+              + completion_tokens / 1000 * 0.03)
+
+        print('API call complete...')
+    except Exception as e:
+        print(e)
+        if "ResponsibleAIPolicyViolation" in str(e) and "content_filter" in str(e):
+            print("Content ResponsibleAIPolicyViolation triggered. Breaking out of the loop.")
+            policyError = True
+        elif type(e).__name__ in ('InvalidRequestError', 'BadRequestError'):
+            # 嘗試不使用response_format參數再試一次
+            try:
+                print('Retrying without response_format parameter...')
+                response = invoke_with_rate_limit(llm, messages)
+            except Exception as e2:
+                apiError = e2
+        else:
+            apiError = e
+
+    if apiError is not None:
+        return error_verdict(request, f'Evaluation API call failed: {type(apiError).__name__}')
+
+    if policyError:
+        return error_verdict(request, 'Content policy violation')
+
+    return parse_eval_response(response.content, request, cache)
+
+def failed_eval_result(reason):
+    return {
+        'result': 'NOT SUCCESS',
+        'use_rag': False,
+        'reason': reason,
+        'task_question': '',
+        'answer': '',
+        'step_count': 0,
+        'steps': []
+    }
+
+def to_result_row(eval_result, web, idx):
+    return {
+        'Website': web,
+        'Task_ID': idx,
+        'Use_RAG': eval_result['use_rag'],
+        'Task_Question': eval_result['task_question'],
+        'Result': eval_result['result'],
+        'Answer': eval_result['answer'],  # 新增 answer 欄位
+        'Reason': eval_result['reason'],
+        'Steps': eval_result['steps']
+    }
+
+def evaluate_task(file_dir, llm, img_num, web, idx, cache=None, force=False):
+    """
+    評估單一任務並轉為結果列；評估過程拋出例外或回覆無法解析時記為 NOT SUCCESS，
+    讓單一任務的錯誤不會中斷整批評估
+    """
+    try:
+        eval_result = auto_eval_by_gpt4v(file_dir, llm, img_num, cache, force)
+        reason = 'Unable to parse evaluation response'
+    except Exception as e:
+        eval_result = None
+        reason = f'Evaluation crashed: {type(e).__name__}: {e}'
+    if eval_result is None:
+        eval_result = failed_eval_result(reason)
+    return to_result_row(eval_result, web, idx)
+
+def evaluate_batch(tasks, llm, args, cache, backend):
+    """
+    批次模式：逐一準備評審請求並直接寫入批次輸入檔 (不在記憶體保留圖片)，
+    一次送出並輪詢，完成後依 custom_id 把回覆合併回結果列。
+    回傳 [(網站, 編號, 結果列)]
+    """
+    os.makedirs(args.batch_dir, exist_ok=True)
+    input_path = os.path.join(args.batch_dir, f'batch_input_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jsonl')
+    rows = []
+    pending = {}
+
+    def requests():
+        for web, idx, file_dir in tasks:
+            custom_id = os.path.relpath(file_dir, args.process_dir).replace(os.sep, '/')
+            try:
+                verdict, request = build_eval_request(file_dir, llm, args.max_attached_imgs, cache, args.force)
+            except Exception as e:
+                verdict, request = failed_eval_result(f'Evaluation crashed: {type(e).__name__}: {e}'), None
+            if request is None:
+                rows.append((web, idx, to_result_row(verdict, web, idx)))
+                continue
+            messages = request.pop('messages')
+            pending[custom_id] = (web, idx, request)
+            yield custom_id, messages
+
+    write_batch_input(requests(), input_path, model_name_of(llm), args.temperature)
+    verdict_cache = cache if getattr(backend, 'writes_verdicts', True) else None
+    outputs = run_batch(backend, input_path, args.batch_poll_interval) if pending else {}
+
+    for custom_id, (web, idx, request) in pending.items():
+        content, error = outputs.get(custom_id, (None, 'missing from batch output'))
+        if content is None:
+            eval_result = error_verdict(request, f'Batch request failed: {error}')
+        else:
+            eval_result = parse_eval_response(content, request, verdict_cache) or failed_eval_result('Unable to parse evaluation response')
+        rows.append((web, idx, to_result_row(eval_result, web, idx)))
+    return rows
+
 def save_evaluation_results(process_dir, results_by_website , max_steps):
     """
-    將評估結果儲存為 Excel 檔案，包含詳細結果和準確率統計
+    將評估結果儲存為 Excel、CSV 與 JSONL 檔案，包含詳細結果和準確率統計
     Args:
         process_dir: 儲存結果的目錄路徑
-        results_by_website: 包含每個網站評估結果的字典列表
+        results_by_website: 包含每個網站評估結果的字典列表 (或逐筆產生結果的 iterable)
     Returns:
         excel_filename: 儲存的 Excel 檔案路徑
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    excel_filename = os.path.join(process_dir, f'evaluation_results_{timestamp}.xlsx')
-    
-    wb = Workbook()
-    # 設定詳細結果工作表
-    ws_details = wb.active
-    ws_details.title = "Detailed Results"
-    
-    # 設定欄位
-    headers = ['Website', 'Task_ID', 'Use_RAG','Task_Question', 'Result', 'Answer', 'Reason' , 'Steps']
-    for col, header in enumerate(headers, 1):
-        ws_details.cell(row=1, column=col, value=header)
-        # 設定欄寬
-        ws_details.column_dimensions[get_column_letter(col)].width = 20 if col != 3 else 50
-    
-    # 寫入詳細結果
-    for row, result in enumerate(results_by_website, 2):
-        for col, header in enumerate(headers, 1):
-            if header == 'Steps':
-                # 將步驟列表轉換為字符串
-                steps_str = '\n'.join([f"Step {step['Step']}: {step['action']}" for step in result['Steps']])
-                ws_details.cell(row=row, column=col, value=steps_str)
-            else:
-                ws_details.cell(row=row, column=col, value=result[header])
-    
-    # 建立準確率統計工作表
-    ws_accuracy = wb.create_sheet("Accuracy Statistics")
-    ws_accuracy.append(['Website', 'Total Tasks', 'Successful Tasks', 'No Answer Tasks', 'Wrong Answer Tasks', 'Step(Avg.)', 'Accuracy'])
-    
-    # 計算每個網站的準確率和各類任務數量
-    website_stats = {}
+    sink = ResultsSink(process_dir, max_steps)
     for result in results_by_website:
-        website = result['Website']
-        if website not in website_stats:
-            website_stats[website] = {'total': 0, 'success': 0, 'no_answer': 0, 'wrong_answer': 0 , 'total_steps': 0}
-        website_stats[website]['total'] += 1
-        website_stats[website]['total_steps'] += len(result['Steps'])  # 累計步驟數
-        if result['Result'] == 'no_answer':
-            website_stats[website]['total_steps'] += max_steps
-        if result['Result'] == 'SUCCESS':
-            website_stats[website]['success'] += 1
-        elif result['Result'] == 'NOT SUCCESS' and result['Reason'] == 'No final answer found in the conversation':
-            website_stats[website]['no_answer'] += 1
-    
-    # 計算Wrong Answer數量並寫入準確率統計
-    for website, stats in website_stats.items():
-        # 計算Wrong Answer = Total - Success - No Answer
-        stats['wrong_answer'] = stats['total'] - stats['success'] - stats['no_answer']
-        accuracy = stats['success'] / stats['total'] if stats['total'] > 0 else 0
-        # 計算平均步驟數
-        avg_steps = stats['total_steps'] / stats['total'] if stats['total'] > 0 else 0
-        ws_accuracy.append([
-            website,
-            stats['total'],
-            stats['success'],
-            stats['no_answer'],
-            stats['wrong_answer'],
-            f"{avg_steps:.2f}",
-            f"{accuracy:.2%}"
-        ])
-    
-    # 設定欄寬
-    for col in range(1, 7):  # 更新欄數為6
-        ws_accuracy.column_dimensions[get_column_letter(col)].width = 15
-    
-    wb.save(excel_filename)
-    print(f"\nEvaluation results have been saved to: {excel_filename}")
-    return excel_filename
+        sink.add(result)
+    return sink.close()
 
 def main():
     parser = argparse.ArgumentParser()
@@ -372,8 +497,29 @@ def main():
     parser.add_argument("--seed", type=int, default=42, help="Seed for random number generation")
     parser.add_argument("--llm", type=str, default="openai", choices=["openai", "azure", "openrouter", "gemini"])
     parser.add_argument('--max_iter', type=int, default=15)
+    parser.add_argument("--rpm_limit", type=int, default=None, help="Requests per minute shared by all LLM calls of a model")
+    parser.add_argument("--tpm_limit", type=int, default=None, help="Tokens per minute shared by all LLM calls of a model")
+    parser.add_argument("--sites", type=str, nargs='*', default=None, help="Only evaluate these sites (default: all discovered)")
+    parser.add_argument("--id_range", type=str, default=None, help="Inclusive task id range, e.g. 0-45")
+    parser.add_argument("--glob", type=str, default=None, help="Glob pattern on task directory names, e.g. 'taskGoogle*'")
+    parser.add_argument("--img_max_side", type=int, default=None, help="Downsize evaluator screenshots so the longest side is at most N pixels")
+    parser.add_argument("--img_format", type=str, default="png", choices=["png", "jpeg", "webp"], help="Re-encode evaluator screenshots in this format")
+    parser.add_argument("--img_quality", type=int, default=85, help="Quality for jpeg/webp re-encoding")
+    parser.add_argument("--img_cache_dir", type=str, default=None, help="Directory for the content-hashed screenshot cache")
+    parser.add_argument("--force", action='store_true', help="Ignore cached verdicts and re-evaluate every task")
+    parser.add_argument("--batch", action='store_true', help="Submit all judge requests as one batch job instead of calling the API per task")
+    parser.add_argument("--batch_backend", type=str, default="openai", choices=["openai", "local", "local_llm"],
+                        help="openai: batch endpoint; local: file-based stand-in with a fixed verdict; local_llm: file-based stand-in answered by --llm")
+    parser.add_argument("--batch_dir", type=str, default=None, help="Where batch input/output files are kept (default: <process_dir>/.batch)")
+    parser.add_argument("--batch_poll_interval", type=float, default=30, help="Seconds between batch status polls")
+    parser.add_argument("--eval_workers", type=int, default=1, help="Number of tasks evaluated concurrently")
 
     args = parser.parse_args()
+    # 批次端點只有 OpenAI 提供；其他供應商的請求不能送到 OpenAI 的批次服務
+    if args.batch and args.batch_backend == 'openai' and args.llm != 'openai':
+        parser.error(f'--batch_backend openai does not support --llm {args.llm}; use --batch_backend local_llm instead')
+    configure_from_args(args)
+    configure_image_prep_from_args(args)
 
     if args.llm == "openai":
         llm = ChatOpenAI(
@@ -406,57 +552,54 @@ def main():
             convert_system_message_to_human=True
         )
 
-    all_results = []  # 儲存所有網站的評估結果
+    # 評估結果到達時即寫出，不在記憶體中累積
+    sink = ResultsSink(args.process_dir, args.max_iter)
     
-    webs = ['Allrecipes', 'Amazon', 'Apple', 'ArXiv', 'BBC News', 'Booking', 'Cambridge Dictionary',
-            'Coursera', 'ESPN', 'GitHub', 'Google Flights', 'Google Map', 'Google Search', 'Huggingface', 'Wolfram Alpha']
-
-    for web in webs:
-        web_task_res = []  # list of dictionaries containing task id and response
-        for idx in range(0, 46):
-            file_dir = os.path.join(args.process_dir, 'task'+web+'--'+str(idx))
-            if os.path.exists(file_dir):
-                eval_result = auto_eval_by_gpt4v(file_dir, llm, args.max_attached_imgs)  # 修正參數從client到llm
-                result_dict = {
-                    'Website': web,
-                    'Task_ID': idx,
-                    'use_rag': eval_result['use_rag'],
-                    'Task_Question': eval_result['task_question'],
-                    'Result': eval_result['result'],
-                    'Answer': eval_result['answer'],  # 新增 answer 欄位
-                    'Reason': eval_result['reason'],
-                    'Steps': eval_result['steps']
-                }
-                web_task_res.append(result_dict)
-                all_results.append(result_dict)
-                
-                # 同時打印到控制台
-                print(f"task{web}--{idx}:")
-                print(f"Question: {eval_result['task_question']}")
-                print(f"Answer: {eval_result['answer']}")
-                print(f"Result: {eval_result['result']}")
-                print(f"Reason: {eval_result['reason']}\n")
-
-
-                # save results as json file
-                knowledge_dir = f"./data/{web}"
-                if not os.path.exists(knowledge_dir):
-                    os.makedirs(knowledge_dir)
-                fileName = f"task{web}--{idx}_{eval_result['result']}_eval.json"
-                with open(os.path.join(knowledge_dir, fileName), 'w', encoding='utf-8') as f:
-                    json.dump(result_dict, f, ensure_ascii=False, indent=4)
-
-        if web_task_res:
-            total_tasks = len(web_task_res)
-            successful_tasks = sum(1 for res in web_task_res if res['Result'] == 'SUCCESS')
+    # 單次掃描結果目錄，找到任務就立即送出評估；結果依 (網站, 編號) 排序後輸出
+    cache = VerdictCache(args.process_dir)
+    executor = ThreadPoolExecutor(max_workers=max(1, args.eval_workers))
+    grouped = {}
+    tasks = discover_task_dirs(args.process_dir, args.sites, parse_id_range(args.id_range), args.glob)
+    if args.batch:
+        args.batch_dir = args.batch_dir or os.path.join(args.process_dir, '.batch')
+        if args.batch_backend == 'openai':
+            backend = OpenAIBatchBackend(args.api_key)
+        else:
+            backend = LocalBatchBackend(args.batch_dir, llm_responder(llm) if args.batch_backend == 'local_llm' else None)
+        for web, idx, row in evaluate_batch(tasks, llm, args, cache, backend):
+            grouped.setdefault(web, []).append((idx, row))
+    else:
+        for web, idx, file_dir in tasks:
+            grouped.setdefault(web, []).append((idx, executor.submit(evaluate_task, file_dir, llm, args.max_attached_imgs, web, idx, cache, args.force)))
+    futures_by_web = [(web, sorted(grouped[web], key=lambda item: item[0])) for web in sorted(grouped)]
+
+    for web, futures in futures_by_web:
+        total_tasks = 0
+        successful_tasks = 0
+        for idx, future in futures:
+            # 批次模式直接是結果列，其他模式為 Future
+            result_dict = future.result() if isinstance(future, Future) else future
+            sink.add(result_dict)
+            total_tasks += 1
+            successful_tasks += result_dict['Result'] == 'SUCCESS'
+
+            # 同時打印到控制台
+            print(f"task{web}--{idx}:")
+            print(f"Question: {result_dict['Task_Question']}")
+            print(f"Answer: {result_dict['Answer']}")
+            print(f"Result: {result_dict['Result']}")
+            print(f"Reason: {result_dict['Reason']}\n")
+
+        if total_tasks:
             accuracy = successful_tasks / total_tasks if total_tasks > 0 else 0
             print(f'{web} Accuracy: {accuracy:.2%}')
+    executor.shutdown()
+    cache.compact()
+    print(f'Verdict cache: {cache.hits} hits, {cache.misses} misses')
+    print(f'Image prep: {get_image_prep().stats}')
 
-    # 儲存所有評估結果
-
-    save_evaluation_results(args.process_dir, all_results, args.max_iter)
-
-    
+    # 寫入準確率統計並關閉輸出檔
+    sink.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,199 @@
+"""
+批次評估模式
+將所有評審請求寫成 OpenAI Batch API 格式的 JSONL，送出後輪詢直到完成，再把回覆依 custom_id 合併回來。
+離線評分時單筆延遲不重要，批次模式可降低成本並提高吞吐量。
+
+提供兩種後端:
+- OpenAIBatchBackend: 使用 OpenAI 相容的 /v1/batches 端點
+- LocalBatchBackend:  以本地檔案模擬批次服務，不需網路即可跑完整個流程
+"""
+
+import json
+import os
+import time
+import uuid
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+
+def write_batch_input(requests, path, model, temperature=0.0):
+    """
+    將評審請求寫成批次輸入檔
+    Args:
+        requests: [(custom_id, messages)]
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, messages in requests:
+            line = {
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': {
+                    'model': model,
+                    'messages': messages,
+                    'temperature': temperature,
+                    'response_format': {'type': 'json_object'},
+                },
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+
+def parse_batch_output(lines):
+    """
+    將批次輸出轉為 {custom_id: (content, error)}，
+    失敗的請求 content 為 None、error 為錯誤描述
+    """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        custom_id = item.get('custom_id')
+        response = item.get('response') or {}
+        error = item.get('error')
+        if error or response.get('status_code', 200) != 200:
+            results[custom_id] = (None, json.dumps(error or response.get('body'), ensure_ascii=False))
+            continue
+        try:
+            content = response['body']['choices'][0]['message']['content']
+            results[custom_id] = (content, None)
+        except (KeyError, IndexError, TypeError) as e:
+            results[custom_id] = (None, f'Malformed batch output: {e}')
+    return results
+
+
+class OpenAIBatchBackend:
+    """OpenAI 相容的批次端點"""
+
+    def __init__(self, api_key, base_url=None):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key, **({'base_url': base_url} if base_url else {}))
+        # 回覆來自真正的評審模型，可寫入判定快取
+        self.writes_verdicts = True
+
+    def submit(self, input_path):
+        with open(input_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window='24h',
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(self.client.files.content(file_id).text.splitlines())
+        return lines
+
+
+def stand_in_responder(body):
+    """本地替身的預設回覆：不呼叫任何模型，固定回傳 NOT SUCCESS"""
+    return json.dumps({
+        'thought': 'Local batch stand-in: no judge model was called.',
+        'answer': 'NOT SUCCESS',
+        'steps': [],
+    })
+
+
+def llm_responder(llm):
+    """以一般 chat model 逐筆處理批次請求，讓本地後端也能產生真正的判定"""
+    from rate_limiter import invoke_with_rate_limit
+
+    def respond(body):
+        return invoke_with_rate_limit(llm, body['messages'], response_format=body.get('response_format')).content
+    return respond
+
+
+class LocalBatchBackend:
+    """
+    以檔案模擬的批次服務：送出時複製輸入檔到 work_dir/<batch_id>/，
+    第一次查詢狀態時依序以 responder 處理每一筆請求並寫出 output.jsonl
+    """
+
+    def __init__(self, work_dir, responder=None):
+        self.work_dir = work_dir
+        self.responder = responder or stand_in_responder
+        # 固定回覆的替身不是評審模型，其判定不得寫入以評審模型為鍵的快取
+        self.writes_verdicts = responder is not None
+        os.makedirs(work_dir, exist_ok=True)
+
+    def _batch_dir(self, batch_id):
+        return os.path.join(self.work_dir, batch_id)
+
+    def _write_status(self, batch_id, status):
+        with open(os.path.join(self._batch_dir(batch_id), 'status.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': batch_id, 'status': status, 'updated_at': time.time()}, f)
+
+    def submit(self, input_path):
+        batch_id = f'batch_{uuid.uuid4().hex[:12]}'
+        os.makedirs(self._batch_dir(batch_id))
+        with open(input_path, 'r', encoding='utf-8') as src, \
+                open(os.path.join(self._batch_dir(batch_id), 'input.jsonl'), 'w', encoding='utf-8') as dst:
+            dst.write(src.read())
+        self._write_status(batch_id, 'validating')
+        return batch_id
+
+    def _process(self, batch_id):
+        batch_dir = self._batch_dir(batch_id)
+        self._write_status(batch_id, 'in_progress')
+        with open(os.path.join(batch_dir, 'input.jsonl'), 'r', encoding='utf-8') as src, \
+                open(os.path.join(batch_dir, 'output.jsonl'), 'w', encoding='utf-8') as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                output = {'id': f'req_{uuid.uuid4().hex[:12]}', 'custom_id': request['custom_id'], 'error': None}
+                try:
+                    content = self.responder(request['body'])
+                    output['response'] = {
+                        'status_code': 200,
+                        'body': {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}}]},
+                    }
+                except Exception as e:
+                    output['response'] = None
+                    output['error'] = {'code': type(e).__name__, 'message': str(e)}
+                dst.write(json.dumps(output, ensure_ascii=False) + "\n")
+        self._write_status(batch_id, 'completed')
+
+    def status(self, batch_id):
+        with open(os.path.join(self._batch_dir(batch_id), 'status.json'), 'r', encoding='utf-8') as f:
+            status = json.load(f)['status']
+        if status == 'validating':
+            self._process(batch_id)
+            status = 'completed'
+        return status
+
+    def results(self, batch_id):
+        with open(os.path.join(self._batch_dir(batch_id), 'output.jsonl'), 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+
+
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def run_batch(backend, input_path, poll_interval=30, timeout=24 * 3600):
+    """送出批次並輪詢至結束，回傳 {custom_id: (content, error)}"""
+    batch_id = backend.submit(input_path)
+    print(f'Submitted batch {batch_id}')
+    deadline = time.time() + timeout
+    while True:
+        status = backend.status(batch_id)
+        if status in TERMINAL_STATUSES:
+            break
+        if time.time() > deadline:
+            raise TimeoutError(f'Batch {batch_id} did not finish within {timeout}s (last status: {status})')
+        print(f'Batch {batch_id} status: {status}')
+        time.sleep(poll_interval)
+    print(f'Batch {batch_id} finished with status: {status}')
+    # 逾期的批次仍可能有部分完成的輸出
+    if status not in ('completed', 'expired'):
+        return {}
+    return parse_batch_output(backend.results(batch_id))
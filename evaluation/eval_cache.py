@@ -0,0 +1,93 @@
+"""
+評估結果快取
+以軌跡指紋 (答案、助理操作過程、最後 N 張截圖的 hash、評審模型、prompt 版本) 作為鍵，
+指紋未改變時直接沿用先前的判定，重新執行 auto_eval 時只需評估新增或有變動的任務。
+
+每個結果根目錄有一個只追加的索引檔 .eval_cache.jsonl，載入時以最後一筆為準。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_FILE = '.eval_cache.jsonl'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verdict_fingerprint(answer, assistant_process, screenshot_paths, judge_model, prompt_version):
+    """計算評估輸入的指紋，任何一項改變都會得到不同的指紋"""
+    payload = {
+        'answer': answer,
+        'assistant_process': assistant_process,
+        'screenshots': [file_sha256(path) for path in screenshot_paths],
+        'judge_model': judge_model,
+        'prompt_version': prompt_version,
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class VerdictCache:
+    """結果根目錄下的判定快取，可在多個評估執行緒間共用"""
+
+    def __init__(self, root, filename=CACHE_FILE):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, filename)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._entries[entry['task']] = entry
+
+    def _key(self, process_dir):
+        return os.path.relpath(os.path.abspath(process_dir), self.root).replace(os.sep, '/')
+
+    def get(self, process_dir, fingerprint):
+        """指紋相符時回傳快取的判定，否則回傳 None"""
+        with self._lock:
+            entry = self._entries.get(self._key(process_dir))
+            if entry and entry['fingerprint'] == fingerprint:
+                self.hits += 1
+                return entry['verdict']
+            self.misses += 1
+            return None
+
+    def put(self, process_dir, fingerprint, verdict):
+        entry = {
+            'task': self._key(process_dir),
+            'fingerprint': fingerprint,
+            'verdict': verdict,
+            'updated_at': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        }
+        with self._lock:
+            self._entries[entry['task']] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def compact(self):
+        """只保留每個任務最新的一筆，避免索引檔無限成長"""
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self._entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,89 @@
+"""
+背景評估佇列
+代理執行完的軌跡放入佇列，由評估執行緒在背景呼叫評審模型，讓代理與評審的吞吐量重疊。
+主執行緒只在需要評估結果 (例如決定是否以 RAG 重試) 且沒有其他任務可執行時才等待。
+
+評估執行緒的紀錄 (含限流器) 不應寫進主執行緒當下任務的 agent.log：
+以 evaluator_log_handler 寫到整次執行的 eval.log 並標上被評估的任務，
+任務的 handler 則加上 ExcludeEvaluatorFilter。
+"""
+
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+EVALUATOR_THREAD_PREFIX = 'evaluator'
+
+_current = threading.local()
+
+
+class ExcludeEvaluatorFilter(logging.Filter):
+    """排除評估執行緒的紀錄"""
+
+    def filter(self, record):
+        return not record.threadName.startswith(EVALUATOR_THREAD_PREFIX)
+
+
+class EvaluatorOnlyFilter(logging.Filter):
+    """只保留評估執行緒的紀錄，並加上目前評估的任務標籤 (record.eval_label)"""
+
+    def filter(self, record):
+        if not record.threadName.startswith(EVALUATOR_THREAD_PREFIX):
+            return False
+        record.eval_label = getattr(_current, 'label', None) or '-'
+        return True
+
+
+def evaluator_log_handler(path):
+    """寫入評估執行緒紀錄的 handler，應掛在 root logger 上並在切換任務 log 時保留"""
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(levelname)s - [%(eval_label)s] %(message)s'))
+    handler.addFilter(EvaluatorOnlyFilter())
+    return handler
+
+
+class EvaluationQueue:
+    def __init__(self, evaluate_fn, workers):
+        """
+        Args:
+            evaluate_fn: 評估函數，回傳結果列 (例如 auto_eval.evaluate_task)
+            workers: 評估執行緒數量
+        """
+        self.evaluate_fn = evaluate_fn
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=EVALUATOR_THREAD_PREFIX)
+        self._done = queue.Queue()
+        # 只由主執行緒修改
+        self.outstanding = 0
+
+    def submit(self, job, *args, label=None):
+        """送出評估；job 為呼叫端用來辨識任務的資料，會與結果一起回傳；label 標示於評估紀錄"""
+        self.outstanding += 1
+        self._executor.submit(self._evaluate, job, args, label)
+
+    def _evaluate(self, job, args, label=None):
+        _current.label = label
+        try:
+            result = self.evaluate_fn(*args)
+        except Exception as e:
+            logging.error(f'Evaluation failed: {type(e).__name__}: {e}')
+            result = e
+        finally:
+            _current.label = None
+        self._done.put((job, result))
+
+    def drain(self, block=False):
+        """取出已完成的評估；block 為 True 時至少等待一筆"""
+        finished = []
+        if block and self.outstanding:
+            finished.append(self._done.get())
+        while True:
+            try:
+                finished.append(self._done.get_nowait())
+            except queue.Empty:
+                break
+        self.outstanding -= len(finished)
+        return finished
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,126 @@
+"""
+串流評估結果輸出
+評估結果到達時立即寫出一列到 Excel (openpyxl write-only 模式)、CSV 與單一合併的 JSONL，
+同時維護各網站的累計統計，記憶體用量不隨任務數量成長。
+"""
+
+import csv
+import json
+import os
+import threading
+from datetime import datetime
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+HEADERS = ['Website', 'Task_ID', 'Use_RAG', 'Task_Question', 'Result', 'Answer', 'Reason', 'Steps']
+ACCURACY_HEADERS = ['Website', 'Total Tasks', 'Successful Tasks', 'No Answer Tasks', 'Wrong Answer Tasks', 'Step(Avg.)', 'Accuracy']
+NO_ANSWER_REASON = 'No final answer found in the conversation'
+
+
+def format_steps(steps):
+    """將步驟列表轉換為字符串"""
+    return '\n'.join([f"Step {step['Step']}: {step['action']}" for step in steps])
+
+
+def append_jsonl(path, record):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class ResultsSink:
+    """逐筆寫出評估結果並累計各網站統計，close() 時寫入準確率統計"""
+
+    def __init__(self, process_dir, max_steps, timestamp=None, formats=('xlsx', 'csv', 'jsonl')):
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.max_steps = max_steps
+        self.formats = formats
+        self.base_path = os.path.join(process_dir, f'evaluation_results_{timestamp}')
+        self.excel_filename = self.base_path + '.xlsx'
+        self.website_stats = {}
+        self.count = 0
+        self._lock = threading.Lock()
+
+        if 'xlsx' in formats:
+            self._wb = Workbook(write_only=True)
+            self._ws_details = self._wb.create_sheet("Detailed Results")
+            # write-only 模式需在寫入第一列前設定欄寬
+            for col in range(1, len(HEADERS) + 1):
+                self._ws_details.column_dimensions[get_column_letter(col)].width = 20 if col != 3 else 50
+            self._ws_details.append(HEADERS)
+        if 'csv' in formats:
+            self._csv_file = open(self.base_path + '.csv', 'w', encoding='utf-8-sig', newline='')
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(HEADERS)
+        if 'jsonl' in formats:
+            self._jsonl_file = open(self.base_path + '.jsonl', 'w', encoding='utf-8')
+
+    def add(self, result):
+        """寫出一筆評估結果並更新該網站的累計統計"""
+        row = [format_steps(result['Steps']) if header == 'Steps' else result[header] for header in HEADERS]
+        with self._lock:
+            if 'xlsx' in self.formats:
+                self._ws_details.append(row)
+            if 'csv' in self.formats:
+                self._csv.writerow(row)
+            if 'jsonl' in self.formats:
+                self._jsonl_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                self._jsonl_file.flush()
+            self._update_stats(result)
+            self.count += 1
+
+    def _update_stats(self, result):
+        website = result['Website']
+        if website not in self.website_stats:
+            self.website_stats[website] = {'total': 0, 'success': 0, 'no_answer': 0, 'wrong_answer': 0, 'total_steps': 0}
+        stats = self.website_stats[website]
+        stats['total'] += 1
+        stats['total_steps'] += len(result['Steps'])  # 累計步驟數
+        if result['Result'] == 'no_answer':
+            stats['total_steps'] += self.max_steps
+        if result['Result'] == 'SUCCESS':
+            stats['success'] += 1
+        elif result['Result'] == 'NOT SUCCESS' and result['Reason'] == NO_ANSWER_REASON:
+            stats['no_answer'] += 1
+        # 計算Wrong Answer = Total - Success - No Answer
+        stats['wrong_answer'] = stats['total'] - stats['success'] - stats['no_answer']
+
+    def accuracy_rows(self):
+        rows = []
+        for website, stats in self.website_stats.items():
+            accuracy = stats['success'] / stats['total'] if stats['total'] > 0 else 0
+            # 計算平均步驟數
+            avg_steps = stats['total_steps'] / stats['total'] if stats['total'] > 0 else 0
+            rows.append([
+                website,
+                stats['total'],
+                stats['success'],
+                stats['no_answer'],
+                stats['wrong_answer'],
+                f"{avg_steps:.2f}",
+                f"{accuracy:.2%}"
+            ])
+        return rows
+
+    def close(self):
+        """寫入準確率統計並關閉所有輸出，回傳 Excel 檔案路徑"""
+        with self._lock:
+            rows = self.accuracy_rows()
+            if 'xlsx' in self.formats:
+                ws_accuracy = self._wb.create_sheet("Accuracy Statistics")
+                for col in range(1, len(ACCURACY_HEADERS) + 1):
+                    ws_accuracy.column_dimensions[get_column_letter(col)].width = 15
+                ws_accuracy.append(ACCURACY_HEADERS)
+                for row in rows:
+                    ws_accuracy.append(row)
+                self._wb.save(self.excel_filename)
+            if 'csv' in self.formats:
+                self._csv_file.close()
+                with open(self.base_path + '_accuracy.csv', 'w', encoding='utf-8-sig', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(ACCURACY_HEADERS)
+                    writer.writerows(rows)
+            if 'jsonl' in self.formats:
+                self._jsonl_file.close()
+        print(f"\nEvaluation results have been saved to: {self.base_path}.*")
+        return self.excel_filename if 'xlsx' in self.formats else self.base_path
@@ -0,0 +1,212 @@
+"""
+截圖前處理模組
+將截圖縮小並重新編碼 (png / jpeg / webp)，結果以「原始內容 hash + 處理參數」為鍵快取於記憶體，
+並可選擇同時寫入磁碟快取目錄，重複評估同一批截圖時不需重新解碼與編碼。
+
+同一個行程內會評估代理截圖時 (run_langGraph_exp 呼叫 enable_capture_registration)，
+utils.encode_image 會登記擷取時已產生的 base64，評估可直接沿用，不必再讀檔與編碼；
+其他情況不登記，避免整批截圖留在記憶體中。
+"""
+
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+MIME_TYPES = {'png': 'image/png', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+
+class _LRU:
+    """以項目數量限制，可另外限制總位元組數 (值為 base64 字串)"""
+
+    def __init__(self, max_items, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._items[key] = value
+            self.bytes += len(value)
+            self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self._items and (len(self._items) > self.max_items or
+                               (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            _, evicted = self._items.popitem(last=False)
+            self.bytes -= len(evicted)
+
+
+# 代理擷取截圖時產生的 base64，以 (路徑, 修改時間, 大小) 為鍵；未設定 --image_cache_mb 時仍限制總大小
+CAPTURE_CACHE_BYTES = 32 * 1024 * 1024
+_captures = _LRU(64, CAPTURE_CACHE_BYTES)
+_register_captures = False
+
+
+def enable_capture_registration(enabled=True):
+    """由會在同一行程內評估代理截圖的執行程式開啟"""
+    global _register_captures
+    _register_captures = enabled
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def register_capture(path, b64):
+    """登記截圖已產生的 base64 (原始 PNG)，檔案改變後自動失效"""
+    if not _register_captures:
+        return
+    try:
+        _captures.put(_file_key(path), b64)
+    except OSError:
+        pass
+
+
+def _read_original(path, decode=True):
+    """回傳 (原始檔案內容, 已登記的 base64)，優先使用擷取時已登記的 base64；decode 為 False 時不解碼，內容為 None"""
+    try:
+        b64 = _captures.get(_file_key(path))
+    except OSError:
+        b64 = None
+    if b64 is not None:
+        return (base64.b64decode(b64) if decode else None), b64
+    with open(path, 'rb') as f:
+        return f.read(), None
+
+
+class ImagePrep:
+    def __init__(self, max_side=None, fmt='png', quality=85, cache_dir=None, max_memory_items=256, max_memory_bytes=None):
+        if fmt not in MIME_TYPES:
+            raise ValueError(f'Unsupported image format: {fmt}')
+        self.max_side = max_side
+        self.format = fmt
+        self.quality = quality
+        self.cache_dir = cache_dir
+        self._memory = _LRU(max_memory_items, max_memory_bytes)
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_in': 0, 'bytes_out': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def is_identity(self):
+        return not self.max_side and self.format == 'png'
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.format]
+
+    def _params(self):
+        return f'{self.max_side or 0}_{self.format}_{self.quality}'
+
+    def _transcode(self, data):
+        from PIL import Image
+
+        img = Image.open(BytesIO(data))
+        if self.max_side and max(img.size) > self.max_side:
+            img.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+        if self.format == 'jpeg' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        out = BytesIO()
+        if self.format == 'png':
+            img.save(out, format='PNG', optimize=True)
+        else:
+            img.save(out, format=self.format.upper(), quality=self.quality)
+        return out.getvalue()
+
+    def encode(self, path):
+        """回傳處理後圖片的 base64"""
+        data, original_b64 = _read_original(path, decode=not self.is_identity)
+        if self.is_identity:
+            return original_b64 or base64.b64encode(data).decode('utf-8')
+
+        key = hashlib.sha256(data).hexdigest() + '_' + self._params()
+        b64 = self._memory.get(key)
+        if b64 is not None:
+            self.stats['hits'] += 1
+            return b64
+
+        disk_path = os.path.join(self.cache_dir, f'{key}.{self.format}') if self.cache_dir else None
+        if disk_path and os.path.exists(disk_path):
+            with open(disk_path, 'rb') as f:
+                encoded = f.read()
+            self.stats['hits'] += 1
+        else:
+            encoded = self._transcode(data)
+            self.stats['misses'] += 1
+            self.stats['bytes_in'] += len(data)
+            self.stats['bytes_out'] += len(encoded)
+            if disk_path:
+                tmp_path = f'{disk_path}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(encoded)
+                os.replace(tmp_path, disk_path)
+
+        b64 = base64.b64encode(encoded).decode('utf-8')
+        self._memory.put(key, b64)
+        return b64
+
+    def data_url(self, path):
+        return f'data:{self.mime_type};base64,{self.encode(path)}'
+
+
+_image_prep = ImagePrep()
+# 記憶體快取的總位元組上限，None 表示只以項目數量限制
+_memory_cap_bytes = None
+
+
+def get_image_prep():
+    return _image_prep
+
+
+def configure_image_prep(max_side=None, fmt='png', quality=85, cache_dir=None):
+    global _image_prep
+    _image_prep = ImagePrep(max_side, fmt, quality, cache_dir, max_memory_bytes=_memory_cap_bytes)
+    return _image_prep
+
+
+def configure_image_cache_limit(max_mb):
+    """限制擷取登記與前處理結果兩個記憶體快取各自的總大小 (MB)，長時間執行時記憶體不隨任務數成長"""
+    global _memory_cap_bytes
+    _memory_cap_bytes = int(max_mb * 1024 * 1024) if max_mb is not None else None
+    _captures.set_max_bytes(_memory_cap_bytes if _memory_cap_bytes is not None else CAPTURE_CACHE_BYTES)
+    _image_prep._memory.set_max_bytes(_memory_cap_bytes)
+
+
+def image_cache_bytes():
+    return _captures.bytes + _image_prep._memory.bytes
+
+
+def configure_image_prep_from_args(args):
+    """依命令列參數 --img_max_side / --img_format / --img_quality / --img_cache_dir 設定全域前處理"""
+    return configure_image_prep(
+        getattr(args, 'img_max_side', None),
+        getattr(args, 'img_format', 'png'),
+        getattr(args, 'img_quality', 85),
+        getattr(args, 'img_cache_dir', None),
+    )
+
+
+def image_data_url(path):
+    """以全域設定產生圖片的 data URL"""
+    return _image_prep.data_url(path)
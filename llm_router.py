@@ -0,0 +1,278 @@
+"""
+多供應商 LLM 路由模組
+依權重選擇主要供應商，當主要請求超過以 p95 延遲推算的期限時發出對沖 (hedged) 請求，
+採用第一個有效回覆，並在錯誤時切換到其他供應商。
+對外提供與 LangChain chat model 相同的 invoke 介面，代理邏輯不需修改。
+"""
+
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+from rate_limiter import invoke_with_rate_limit
+
+# 延遲直方圖的區間上限 (秒)
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120)
+
+
+def build_chat_model(spec: Dict[str, Any], temperature: float = 1.0):
+    """依供應商設定建立 LangChain chat model，參數與 runner 的 --llm 選項一致"""
+    llm_type = spec.get('llm', 'openai')
+    temperature = spec.get('temperature', temperature)
+    if llm_type == 'openai':
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            api_key=spec['api_key'],
+            model=spec['api_model'],
+            temperature=temperature,
+            **({'base_url': spec['base_url']} if spec.get('base_url') else {})
+        )
+    elif llm_type == 'azure':
+        from langchain_openai import AzureChatOpenAI
+        return AzureChatOpenAI(
+            api_key=spec['api_key'],
+            model=spec['api_model'],
+            api_version=spec.get('api_version', ''),
+            temperature=temperature,
+            azure_endpoint=spec.get('azure_endpoint', '')
+        )
+    elif llm_type == 'openrouter':
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=spec['api_key'],
+            model=spec['api_model'],
+            temperature=temperature
+        )
+    elif llm_type == 'gemini':
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=spec['api_model'],
+            api_key=spec['api_key'],
+            temperature=temperature,
+            convert_system_message_to_human=True
+        )
+    raise ValueError(f"Unknown llm type: {llm_type}")
+
+
+class LatencyHistogram:
+    """固定區間計數加上最近樣本，用來計算百分位數"""
+
+    def __init__(self, window: int = 200):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples = deque(maxlen=window)
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.samples.append(seconds)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self):
+        return len(self.samples)
+
+    def summary(self) -> Dict[str, Any]:
+        labels = [f'<={b}s' for b in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}s']
+        return {
+            'count': sum(self.counts),
+            'errors': self.errors,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class Provider:
+    def __init__(self, name: str, llm, weight: float = 1.0, histogram: Optional[LatencyHistogram] = None):
+        self.name = name
+        self.llm = llm
+        self.weight = weight
+        self.histogram = histogram or LatencyHistogram()
+
+
+def is_valid_agent_reply(response) -> bool:
+    """代理回覆需能解析出動作；與執行端相同，先把 tool call、JSON 內容與 list 形式的內容統一為文字"""
+    from utils import parse_action_response, structured_action_to_text
+    return parse_action_response(structured_action_to_text(response)[0])[0] is not None
+
+
+class ProviderRouter:
+    """對多個供應商進行加權選擇、對沖請求與錯誤切換"""
+
+    # 每個供應商的呼叫已各自經過共用限制器，外層不需再包一次
+    handles_rate_limit = True
+
+    def __init__(self, providers: List[Provider], default_deadline: float = 30.0,
+                 min_deadline: float = 5.0, min_samples: int = 20, max_hedges: int = 1,
+                 log_every: int = 20, _shared=None):
+        if not providers:
+            raise ValueError('ProviderRouter needs at least one provider')
+        self.providers = providers
+        self.default_deadline = default_deadline
+        self.min_deadline = min_deadline
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.log_every = log_every
+        if _shared is None:
+            _shared = {
+                'executor': ThreadPoolExecutor(max_workers=max(4, 2 * len(providers))),
+                'stats': {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'failovers': 0, 'invalid': 0},
+                'lock': threading.Lock(),
+            }
+        self._shared = _shared
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self._shared['stats']
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.providers[0].llm, 'model_name', None) or self.providers[0].name
+
+    def __getattr__(self, item):
+        # 其他屬性 (例如 openai_api_key、client) 交給權重最高的供應商
+        providers = self.__dict__.get('providers')
+        if not providers:
+            raise AttributeError(item)
+        return getattr(max(providers, key=lambda p: p.weight).llm, item)
+
+    def bind_tools(self, tools, **kwargs):
+        bound = [Provider(p.name, p.llm.bind_tools(tools, **kwargs), p.weight, p.histogram)
+                 for p in self.providers]
+        return ProviderRouter(bound, self.default_deadline, self.min_deadline, self.min_samples,
+                              self.max_hedges, self.log_every, _shared=self._shared)
+
+    def _count(self, key):
+        with self._shared['lock']:
+            self.stats[key] += 1
+            return self.stats[key]
+
+    def _order(self) -> List[Provider]:
+        """依權重隨機排列供應商，第一個為主要供應商"""
+        remaining = list(self.providers)
+        order = []
+        while remaining:
+            pick = random.choices(remaining, weights=[max(p.weight, 1e-6) for p in remaining])[0]
+            order.append(pick)
+            remaining.remove(pick)
+        return order
+
+    def _deadline(self, provider: Provider) -> float:
+        if len(provider.histogram) < self.min_samples:
+            return self.default_deadline
+        return max(self.min_deadline, provider.histogram.percentile(0.95))
+
+    def _call(self, provider: Provider, messages, kwargs):
+        start = time.monotonic()
+        try:
+            response = invoke_with_rate_limit(provider.llm, messages, max_retries=2, **kwargs)
+        except Exception:
+            provider.histogram.record_error()
+            raise
+        latency = time.monotonic() - start
+        provider.histogram.record(latency)
+        return response, latency
+
+    def invoke(self, messages, validate: Optional[Callable[[Any], bool]] = None, **kwargs):
+        executor = self._shared['executor']
+        order = self._order()
+        primary = order[0]
+        remaining = order[1:]
+        pending = {executor.submit(self._call, primary, messages, kwargs): (primary, False)}
+        hedges = 0
+        last_error = None
+
+        while pending:
+            timeout = self._deadline(primary) if (remaining and hedges < self.max_hedges) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # 主要請求超過期限，對下一個供應商發出對沖請求
+                provider = remaining.pop(0)
+                hedges += 1
+                self._count('hedges')
+                logging.info(f'Hedging request to {provider.name} after {timeout:.1f}s')
+                pending[executor.submit(self._call, provider, messages, kwargs)] = (provider, True)
+                continue
+
+            for future in done:
+                provider, hedged = pending.pop(future)
+                try:
+                    response, latency = future.result()
+                except Exception as e:
+                    last_error = e
+                    logging.warning(f'Provider {provider.name} failed: {type(e).__name__}: {e}')
+                    response = None
+                else:
+                    if validate is not None and not validate(response):
+                        self._count('invalid')
+                        logging.warning(f'Provider {provider.name} returned an invalid reply')
+                        last_error = ValueError(f'Invalid reply from {provider.name}')
+                        response = None
+
+                if response is not None:
+                    for other in pending:
+                        other.cancel()
+                    if hedged:
+                        self._count('hedge_wins')
+                    metadata = getattr(response, 'response_metadata', None)
+                    if isinstance(metadata, dict):
+                        metadata['provider'] = provider.name
+                    logging.info(f'Provider {provider.name} answered in {latency:.2f}s' + (' (hedge)' if hedged else ''))
+                    if self._count('requests') % self.log_every == 0:
+                        self.log_summary()
+                    return response
+
+                # 失敗時若沒有其他進行中的請求，切換到下一個供應商
+                if not pending and remaining:
+                    self._count('failovers')
+                    provider = remaining.pop(0)
+                    pending[executor.submit(self._call, provider, messages, kwargs)] = (provider, hedged)
+
+        raise last_error if last_error else RuntimeError('All providers failed')
+
+    def summary(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['hedge_win_rate'] = stats['hedge_wins'] / stats['hedges'] if stats['hedges'] else 0.0
+        stats['providers'] = {p.name: p.histogram.summary() for p in self.providers}
+        return stats
+
+    def log_summary(self):
+        logging.info(f'Provider router summary: {json.dumps(self.summary(), ensure_ascii=False)}')
+
+
+def build_router(providers_file: str, temperature: float = 1.0, default_deadline: float = 30.0) -> ProviderRouter:
+    """
+    從 JSON 檔建立路由器，格式為供應商設定的列表，例如:
+    [{"name": "openai", "llm": "openai", "api_model": "gpt-4o", "api_key": "...", "weight": 3},
+     {"name": "azure", "llm": "azure", "api_model": "gpt-4o", "api_key": "...",
+      "azure_endpoint": "...", "api_version": "...", "weight": 1}]
+    """
+    with open(providers_file, 'r', encoding='utf-8') as f:
+        specs = json.load(f)
+    providers = [
+        Provider(spec.get('name', f"{spec.get('llm', 'openai')}-{i}"),
+                 build_chat_model(spec, temperature),
+                 float(spec.get('weight', 1.0)))
+        for i, spec in enumerate(specs)
+    ]
+    return ProviderRouter(providers, default_deadline=default_deadline)
@@ -14,6 +14,8 @@ import google.generativeai as genai
 # 導入 LangChain 的分塊工具
 from langchain.text_splitter import MarkdownTextSplitter, MarkdownHeaderTextSplitter,RecursiveCharacterTextSplitter
 
+from rate_limiter import get_rate_limiter, invoke_with_rate_limit
+
 def load_knowledge_documents(directory_path: str) -> List[Dict[str, Any]]:
     """從指定目錄載入知識文檔，支援 Markdown、JSON、JSONL 和 TXT 格式"""
     documents = []
@@ -119,8 +121,12 @@ def get_embeddings(texts: List[str], llm) -> List[List[float]]:
                 google_api_key=api_key
             )
             
-            # 批次處理以提高效率
-            embeddings = embeddings_model.embed_documents(texts)
+            # 批次處理以提高效率，並經由共用限制器控制速率
+            embeddings = get_rate_limiter().call(
+                lambda: embeddings_model.embed_documents(texts),
+                model="gemini-embedding-exp-03-07",
+                est_tokens=sum(len(t) for t in texts) // 4
+            )
         else:
             # 回退到 OpenAI 的文本嵌入 API
             from langchain_openai import OpenAIEmbeddings
@@ -131,8 +137,12 @@ def get_embeddings(texts: List[str], llm) -> List[List[float]]:
                 openai_api_key=llm.openai_api_key if hasattr(llm, 'openai_api_key') else None
             )
             
-            # 批次處理以提高效率
-            embeddings = embeddings_model.embed_documents(texts)
+            # 批次處理以提高效率，並經由共用限制器控制速率
+            embeddings = get_rate_limiter().call(
+                lambda: embeddings_model.embed_documents(texts),
+                model="text-embedding-ada-002",
+                est_tokens=sum(len(t) for t in texts) // 4
+            )
     except Exception as e:
         logging.error(f"獲取嵌入向量時出錯: {str(e)}")
         # 如果出錯，返回隨機嵌入作為回退
@@ -354,7 +364,7 @@ Provide clear instructions on which sections or topics of the manual the retriev
             {"role": "user", "content": user_prompt}
         ]
 
-        answer = llm.invoke(messages)
+        answer = invoke_with_rate_limit(llm, messages)
         
         optimized_query = answer.content.strip()
         logging.info(f"生成優化查詢: {optimized_query}")
@@ -783,7 +793,7 @@ The following is the knowledge base： {context_texts} The above is the knowledg
                     {"role": "user", "content": user_prompt}
                 ]
                 
-                answer = llm.invoke(messages)
+                answer = invoke_with_rate_limit(llm, messages)
 
                 if print_answer and answer:
                     print("\n" + "=" * 50)
@@ -0,0 +1,214 @@
+"""
+記憶體用量追蹤與狀態大小上限
+--track_memory: 記錄每個 LangGraph 節點與每個任務的 RSS 與 tracemalloc 峰值，寫入 <task_dir>/memory.json，
+                整次執行彙整為 <result_dir>/memory_summary.json，並以各任務結束時 RSS 的斜率檢查是否隨任務數成長。
+                tracemalloc 的峰值為整個行程共用，非同步評估執行緒的配置也會計入。
+--spill_images: State 的 messages 中截圖改存為磁碟檔案參照 (file://...)，只在送出 LLM 請求時才讀檔轉為 base64，
+                訊息與檢查點不再保存 base64 內容。
+--image_cache_mb: 限制 image_prep 記憶體快取的總大小。
+"""
+
+import base64
+import gc
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+FILE_REF_PREFIX = 'file://'
+MB = 1024 * 1024
+
+_enabled = False
+_local = threading.local()
+_run_tasks = []
+_run_lock = threading.Lock()
+
+
+def rss_bytes():
+    """目前行程的常駐記憶體 (RSS)；無 /proc 時以 psutil 或 getrusage 的峰值代替"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _mb(value):
+    return round(value / MB, 2)
+
+
+def configure_memory(enabled, image_cache_mb=None):
+    global _enabled
+    _enabled = bool(enabled)
+    if _enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if image_cache_mb is not None:
+        from image_prep import configure_image_cache_limit
+        configure_image_cache_limit(image_cache_mb)
+
+
+def configure_memory_from_args(args):
+    configure_memory(getattr(args, 'track_memory', False), getattr(args, 'image_cache_mb', None))
+
+
+def messages_bytes(messages):
+    """訊息中文字與內嵌圖片 (base64) 的大約位元組數"""
+    total = 0
+    for msg in messages or []:
+        content = msg.get('content') if isinstance(msg, dict) else None
+        if isinstance(content, str):
+            total += len(content)
+        elif isinstance(content, list):
+            for item in content:
+                if item.get('type') == 'image_url':
+                    total += len(item['image_url']['url'])
+                else:
+                    total += len(item.get('text', ''))
+    return total
+
+
+class TaskMemory:
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.started_at = time.time()
+        self.rss_start = rss_bytes()
+        self.rss_peak = self.rss_start
+        self.tracemalloc_peak = 0
+        self.nodes = {}
+
+    def record(self, name, rss_before, rss_after, traced_peak, state_messages_bytes):
+        stats = self.nodes.setdefault(name, {'calls': 0, 'rss_delta_mb': 0.0, 'rss_max_mb': 0.0,
+                                             'tracemalloc_peak_mb': 0.0, 'messages_mb': 0.0})
+        stats['calls'] += 1
+        stats['rss_delta_mb'] = round(stats['rss_delta_mb'] + _mb(rss_after - rss_before), 2)
+        stats['rss_max_mb'] = max(stats['rss_max_mb'], _mb(rss_after))
+        stats['tracemalloc_peak_mb'] = max(stats['tracemalloc_peak_mb'], _mb(traced_peak))
+        stats['messages_mb'] = max(stats['messages_mb'], _mb(state_messages_bytes))
+        self.rss_peak = max(self.rss_peak, rss_after)
+        self.tracemalloc_peak = max(self.tracemalloc_peak, traced_peak)
+
+
+def start_memory_task(task_id):
+    _local.task = TaskMemory(task_id) if _enabled else None
+    return _local.task
+
+
+def memory_node(name, fn):
+    """包裝 LangGraph 節點，記錄節點前後的 RSS、節點期間的 tracemalloc 峰值與訊息大小"""
+    @wraps(fn)
+    def wrapper(state):
+        task = getattr(_local, 'task', None)
+        if task is None:
+            return fn(state)
+        tracemalloc.reset_peak()
+        rss_before = rss_bytes()
+        result = fn(state)
+        _, traced_peak = tracemalloc.get_traced_memory()
+        task.record(name, rss_before, rss_bytes(), traced_peak, messages_bytes((result or state).get("messages")))
+        return result
+    return wrapper
+
+
+def finish_memory_task(task_dir, filename='memory.json'):
+    """回收循環參照 (graph 狀態、WebElement 與 driver) 後寫出任務的記憶體紀錄"""
+    task = getattr(_local, 'task', None)
+    _local.task = None
+    gc.collect()
+    if task is None:
+        return None
+    image_cache = 0
+    if 'image_prep' in sys.modules:
+        image_cache = sys.modules['image_prep'].image_cache_bytes()
+    record = {
+        'task_id': task.task_id,
+        'seconds': round(time.time() - task.started_at, 2),
+        'rss_start_mb': _mb(task.rss_start),
+        'rss_end_mb': _mb(rss_bytes()),
+        'rss_peak_mb': _mb(task.rss_peak),
+        'tracemalloc_peak_mb': _mb(task.tracemalloc_peak),
+        'image_cache_mb': _mb(image_cache),
+        'nodes': task.nodes,
+    }
+    with open(os.path.join(task_dir, filename), 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    with _run_lock:
+        _run_tasks.append({k: v for k, v in record.items() if k != 'nodes'})
+    return record
+
+
+def rss_growth_per_task(records):
+    """各任務結束時 RSS 的最小平方法斜率 (MB / 任務)，接近 0 表示記憶體持平"""
+    n = len(records)
+    if n < 2:
+        return 0.0
+    xs = range(n)
+    ys = [r['rss_end_mb'] for r in records]
+    mean_x, mean_y = (n - 1) / 2, sum(ys) / n
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    var = sum((x - mean_x) ** 2 for x in xs)
+    return round(cov / var, 3)
+
+
+def write_memory_summary(result_dir, filename='memory_summary.json'):
+    if not _enabled:
+        return None
+    with _run_lock:
+        records = list(_run_tasks)
+    summary = {
+        'tasks': len(records),
+        'rss_first_mb': records[0]['rss_end_mb'] if records else None,
+        'rss_last_mb': records[-1]['rss_end_mb'] if records else None,
+        'rss_peak_mb': max((r['rss_peak_mb'] for r in records), default=None),
+        'rss_growth_mb_per_task': rss_growth_per_task(records),
+        'per_task': records,
+    }
+    with open(os.path.join(result_dir, filename), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    line = (f"Memory: {summary['tasks']} tasks, RSS {summary['rss_first_mb']} -> {summary['rss_last_mb']} MB, "
+            f"peak {summary['rss_peak_mb']} MB, growth {summary['rss_growth_mb_per_task']} MB/task")
+    logging.info(line)
+    print(line)
+    return summary
+
+
+def image_ref(path):
+    return FILE_REF_PREFIX + os.path.abspath(path)
+
+
+def image_url(image):
+    """format_msg 使用：base64 內容轉為 data URL，磁碟參照保持原樣"""
+    return image if image.startswith(FILE_REF_PREFIX) else f"data:image/png;base64,{image}"
+
+
+def materialize_messages(messages):
+    """送出請求前把 file:// 截圖參照讀回 data URL；沒有參照時直接回傳原本的 list"""
+    materialized = None
+    for idx, msg in enumerate(messages):
+        content = msg.get('content') if isinstance(msg, dict) else None
+        if not isinstance(content, list) or not any(
+                item.get('type') == 'image_url' and item['image_url']['url'].startswith(FILE_REF_PREFIX)
+                for item in content):
+            continue
+        if materialized is None:
+            materialized = list(messages)
+        new_content = []
+        for item in content:
+            url = item['image_url']['url'] if item.get('type') == 'image_url' else ''
+            if url.startswith(FILE_REF_PREFIX):
+                with open(url[len(FILE_REF_PREFIX):], 'rb') as f:
+                    item = {'type': 'image_url',
+                            'image_url': {"url": f"data:image/png;base64,{base64.b64encode(f.read()).decode('utf-8')}"}}
+            new_content.append(item)
+        materialized[idx] = dict(msg, content=new_content)
+    return materialized if materialized is not None else messages
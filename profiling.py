@@ -0,0 +1,85 @@
+"""
+任務層級的效能剖析 (--profile)
+    cprofile: 以 cProfile 剖析執行任務的執行緒，寫出 <task_dir>/profile.prof 與依累計時間排序的 profile.txt
+              (可用 snakeviz 或 python -m pstats 開啟)
+    sample:   背景執行緒定期擷取所有執行緒的呼叫堆疊，寫出 collapsed stack 格式的 profile.folded
+              (可直接拖進 speedscope.app 或用 flamegraph.pl 產生火焰圖)，額外開銷低且涵蓋 LangGraph 的工作執行緒
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_MODES = ['cprofile', 'sample']
+
+
+class StackSampler:
+    """以固定間隔取樣所有執行緒的 Python 呼叫堆疊"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+@contextmanager
+def task_profiler(task_dir, mode=None, name='profile', top=40):
+    """with task_profiler(task_dir, args.profile): ...；mode 為 None 時不做任何事"""
+    if not mode:
+        yield
+        return
+    start = time.perf_counter()
+    if mode == 'sample':
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write(os.path.join(task_dir, f'{name}.folded'))
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(task_dir, f'{name}.prof'))
+        report = io.StringIO()
+        report.write(f'wall time: {time.perf_counter() - start:.2f}s\n')
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(top)
+        with open(os.path.join(task_dir, f'{name}.txt'), 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
@@ -120,3 +120,28 @@ Action: {One Action format you choose}
 Then the User will provide:
 Observation: {Accessibility Tree of a web page}"""
 
+
+
+# 結構化動作模式 (--action_mode json) 附加在系統提示之後
+ACTION_MODE_JSON_PROMPT = """
+
+Structured action mode:
+Instead of writing the "Thought:" and "Action:" lines, call the `browser_action` tool exactly once per iteration with:
+- thought: your brief thoughts (briefly summarize the info that will help ANSWER)
+- action: one of Click, Type, Scroll, Wait, GoBack, Google, ANSWER
+- element: the Numerical_Label of the target element (or WINDOW for Scroll), empty for Wait, GoBack, Google and ANSWER
+- content: the text to type for Type, up or down for Scroll, the final answer for ANSWER, empty otherwise
+If tools are unavailable, reply with a single JSON object using the same keys."""
+
+
+def build_multi_action_prompt(system_prompt, max_actions):
+    """批次動作模式：允許模型在同一輪針對同一組數字標籤輸出多個有序動作"""
+    return system_prompt.replace(
+        "Execute only one action per iteration.",
+        f"You may execute up to {max_actions} actions per iteration when they all target elements in the current Observation "
+        "(e.g. type into a search box and then click a filter). Write each one on its own line starting with \"Action:\"; "
+        "they are executed in order, and the remaining ones are skipped if the page changes. ANSWER must always be the only action."
+    ).replace(
+        "Action: {One Action format you choose}",
+        "Action: {One Action format you choose}\nAction: {Optional further actions, one per line}"
+    )
@@ -0,0 +1,367 @@
+"""
+全域 LLM 呼叫速率限制與重試排程模組
+以每個模型的 token bucket 控制每分鐘請求數 (RPM) 與每分鐘 token 數 (TPM)，
+並支援 Retry-After 標頭、指數退避 (含 jitter) 與斷路器。
+同一個行程內的代理、local_rag、auto_eval 與 AutoManual 共用同一個限制器，
+執行緒與 asyncio 皆可安全使用。
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+# 以例外類別名稱判斷 (沿著 MRO)，避免此模組直接依賴 openai / google SDK
+RATE_LIMIT_ERRORS = ('RateLimitError', 'ResourceExhausted', 'TooManyRequests')
+TRANSIENT_ERRORS = ('APIError', 'APIConnectionError', 'APITimeoutError', 'InternalServerError',
+                    'ServiceUnavailable', 'DeadlineExceeded', 'Timeout', 'TimeoutError',
+                    'ReadTimeout', 'ConnectTimeout', 'ConnectionError')
+# 4xx 中仍值得重試的狀態碼
+RETRYABLE_STATUS = (408, 409, 429)
+
+# 每張圖片估計的 token 數 (1024x768 截圖在 high detail 下約 765 tokens)
+IMAGE_TOKEN_ESTIMATE = 765
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def _error_names(e: BaseException):
+    return {cls.__name__ for cls in type(e).__mro__}
+
+
+def classify_error(e: BaseException) -> Optional[str]:
+    """回傳 'rate_limit'、'transient' 或 None (不可重試)"""
+    names = _error_names(e)
+    status = getattr(e, 'status_code', None)
+    if status == 429 or names.intersection(RATE_LIMIT_ERRORS):
+        return 'rate_limit'
+    if isinstance(status, int) and 400 <= status < 500 and status not in RETRYABLE_STATUS:
+        return None
+    if names.intersection(TRANSIENT_ERRORS):
+        return 'transient'
+    return None
+
+
+def retry_after_seconds(e: BaseException) -> Optional[float]:
+    """從例外附帶的 HTTP 回應中讀取 Retry-After (秒或 HTTP 日期)"""
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value:
+            return float(value) / 1000.0
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class TokenBucket:
+    """以預約方式運作的 token bucket：呼叫者先扣除額度，再依回傳的秒數等待"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            # 單次請求超過容量時只扣到容量上限，避免永遠等不到
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """連續失敗達門檻後開啟，冷卻結束進入半開狀態並只放行一個探測請求"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        with self._lock:
+            if self.state == 'closed':
+                return 0.0
+            if self.state == 'open':
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    return remaining
+                self.state = 'half_open'
+                self._probe_in_flight = False
+            if not self._probe_in_flight:
+                self._probe_in_flight = True
+                return 0.0
+            return min(1.0, self.reset_timeout)
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logging.warning(f'Circuit breaker opened after {self.failures} consecutive failures')
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class ModelBudget:
+    """單一模型的 RPM / TPM 額度、全域冷卻時間與斷路器"""
+
+    def __init__(self, rpm=None, tpm=None, failure_threshold=5, reset_timeout=60.0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.cooldown_until = 0.0
+        self.stats = {'calls': 0, 'retries': 0, 'failures': 0, 'throttled_seconds': 0.0}
+        self._lock = threading.Lock()
+
+    def reserve(self, est_tokens: int) -> float:
+        wait = max(0.0, self.cooldown_until - time.monotonic())
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens and est_tokens:
+            wait = max(wait, self.tokens.reserve(est_tokens))
+        return wait
+
+    def reconcile(self, est_tokens: int, actual_tokens: int):
+        if self.tokens and actual_tokens:
+            self.tokens.refund(est_tokens - actual_tokens)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+
+class RateLimiter:
+    """依模型名稱管理額度的共用限制器"""
+
+    def __init__(self):
+        self._budgets: Dict[str, ModelBudget] = {}
+        self._limits: Dict[Optional[str], dict] = {None: {}}
+        self._lock = threading.Lock()
+
+    def configure(self, model: Optional[str] = None, rpm=None, tpm=None,
+                  failure_threshold: int = 5, reset_timeout: float = 60.0):
+        """設定模型額度；model 為 None 時作為所有未個別設定模型的預設值"""
+        with self._lock:
+            self._limits[model] = {'rpm': rpm, 'tpm': tpm, 'failure_threshold': failure_threshold,
+                                   'reset_timeout': reset_timeout}
+            # 重新設定後舊的 bucket 作廢
+            if model is None:
+                self._budgets = {k: v for k, v in self._budgets.items() if k in self._limits}
+            else:
+                self._budgets.pop(model, None)
+
+    def budget(self, model: Optional[str]) -> ModelBudget:
+        key = model or 'default'
+        with self._lock:
+            if key not in self._budgets:
+                self._budgets[key] = ModelBudget(**self._limits.get(model, self._limits[None]))
+            return self._budgets[key]
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {model: dict(budget.stats) for model, budget in self._budgets.items()}
+
+    def _acquire_delays(self, budget: ModelBudget, est_tokens: int):
+        """產生需要等待的秒數，直到可送出請求為止"""
+        while True:
+            wait = budget.breaker.wait_time()
+            if wait <= 0:
+                break
+            yield wait
+        wait = budget.reserve(est_tokens)
+        if wait > 0:
+            yield wait
+
+    def _retry_delay(self, budget: ModelBudget, e: Exception, attempt: int, max_retries: int,
+                     base_delay: float, max_delay: float) -> float:
+        kind = classify_error(e)
+        if kind is None:
+            budget.breaker.release()
+            budget.count('failures')
+            raise e
+        if kind == 'transient':
+            budget.breaker.record_failure()
+        else:
+            budget.breaker.release()
+        if attempt >= max_retries:
+            budget.count('failures')
+            logging.info('Retrying too many times')
+            raise e
+
+        # Full jitter 指數退避，若伺服器提供 Retry-After 則以其為下限
+        delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+        retry_after = retry_after_seconds(e)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if kind == 'rate_limit':
+            # 讓同模型的其他呼叫者一起暫停，避免持續撞到限制
+            budget.pause(retry_after if retry_after is not None else delay)
+        budget.count('retries')
+        logging.info(f'Error occurred, retrying in {delay:.1f}s. Error type: {type(e).__name__}')
+        return delay
+
+    def call(self, fn: Callable[[], Any], model: Optional[str] = None, est_tokens: int = 0,
+             max_retries: int = 10, base_delay: float = 2.0, max_delay: float = 60.0,
+             usage_fn: Optional[Callable[[Any], int]] = None):
+        budget = self.budget(model)
+        attempt = 0
+        while True:
+            for wait in self._acquire_delays(budget, est_tokens):
+                budget.count('throttled_seconds', wait)
+                time.sleep(wait)
+            budget.count('calls')
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._retry_delay(budget, e, attempt, max_retries, base_delay, max_delay))
+                attempt += 1
+                continue
+            budget.breaker.record_success()
+            if usage_fn:
+                budget.reconcile(est_tokens, usage_fn(result))
+            return result
+
+    async def acall(self, afn: Callable[[], Any], model: Optional[str] = None, est_tokens: int = 0,
+                    max_retries: int = 10, base_delay: float = 2.0, max_delay: float = 60.0,
+                    usage_fn: Optional[Callable[[Any], int]] = None):
+        budget = self.budget(model)
+        attempt = 0
+        while True:
+            for wait in self._acquire_delays(budget, est_tokens):
+                budget.count('throttled_seconds', wait)
+                await asyncio.sleep(wait)
+            budget.count('calls')
+            try:
+                result = await afn()
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(budget, e, attempt, max_retries, base_delay, max_delay))
+                attempt += 1
+                continue
+            budget.breaker.record_success()
+            if usage_fn:
+                budget.reconcile(est_tokens, usage_fn(result))
+            return result
+
+
+_GLOBAL_LIMITER = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _GLOBAL_LIMITER
+
+
+def configure_from_args(args):
+    """依命令列參數 --rpm_limit / --tpm_limit 設定共用限制器的預設額度"""
+    get_rate_limiter().configure(rpm=getattr(args, 'rpm_limit', None),
+                                 tpm=getattr(args, 'tpm_limit', None))
+
+
+def model_name_of(llm) -> Optional[str]:
+    for attr in ('model_name', 'model', 'deployment_name'):
+        value = getattr(llm, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
+def estimate_tokens(messages) -> int:
+    """粗略估計訊息的 token 數；圖片以固定值計算而非 base64 長度"""
+    if isinstance(messages, str):
+        return len(messages) // 4
+    total = 0
+    for msg in messages:
+        content = msg.get('content', '') if isinstance(msg, dict) else getattr(msg, 'content', '')
+        if isinstance(content, str):
+            total += len(content) // 4
+        elif isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict) and item.get('type') == 'image_url':
+                    total += IMAGE_TOKEN_ESTIMATE
+                elif isinstance(item, dict):
+                    total += len(str(item.get('text', ''))) // 4
+                else:
+                    total += len(str(item)) // 4
+    return total
+
+
+def response_token_usage(response) -> int:
+    metadata = getattr(response, 'response_metadata', None) or {}
+    token_usage = metadata.get('token_usage') or {}
+    total = token_usage.get('total_tokens') or \
+        (token_usage.get('prompt_tokens', 0) + token_usage.get('completion_tokens', 0))
+    if not total:
+        usage = getattr(response, 'usage_metadata', None) or {}
+        total = usage.get('total_tokens', 0)
+    return total
+
+
+def invoke_with_rate_limit(llm, messages, max_retries: int = 10, **kwargs):
+    """經由共用限制器呼叫 LangChain chat model 的 invoke"""
+    if getattr(llm, 'handles_rate_limit', False):
+        return llm.invoke(messages, **kwargs)
+    return get_rate_limiter().call(
+        lambda: llm.invoke(messages, **kwargs),
+        model=model_name_of(llm),
+        est_tokens=estimate_tokens(messages),
+        max_retries=max_retries,
+        usage_fn=response_token_usage,
+    )
+
+
+async def ainvoke_with_rate_limit(llm, messages, max_retries: int = 10, **kwargs):
+    """invoke_with_rate_limit 的 asyncio 版本"""
+    if getattr(llm, 'handles_rate_limit', False):
+        return await llm.ainvoke(messages, **kwargs)
+    return await get_rate_limiter().acall(
+        lambda: llm.ainvoke(messages, **kwargs),
+        model=model_name_of(llm),
+        est_tokens=estimate_tokens(messages),
+        max_retries=max_retries,
+        usage_fn=response_token_usage,
+    )
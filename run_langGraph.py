@@ -9,7 +9,6 @@ import logging
 from typing import Annotated, Literal, Dict, Any
 
 from typing_extensions import TypedDict
-from openai import RateLimitError, APIError
 import matplotlib.pyplot as plt
 from PIL import Image as PILImage
 from io import BytesIO
@@ -27,9 +26,22 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.chrome.service import Service as ChromeService
 
-from prompts import SYSTEM_PROMPT, SYSTEM_PROMPT_TEXT_ONLY,SYSTEM_PROMPT_TYPE
+from prompts import SYSTEM_PROMPT, SYSTEM_PROMPT_TEXT_ONLY,SYSTEM_PROMPT_TYPE, ACTION_MODE_JSON_PROMPT, build_multi_action_prompt
 from utils import get_web_element_rect, encode_image, extract_information, print_message,\
-    get_webarena_accessibility_tree, get_pdf_retrieval_ans_from_assistant, clip_message_and_obs, clip_message_and_obs_text_only
+    get_webarena_accessibility_tree, get_pdf_retrieval_ans_from_assistant, clip_message_and_obs, clip_message_and_obs_text_only,\
+    split_action_texts, parse_action_response, normalize_llm_reply, browser_action
+
+from rate_limiter import configure_from_args, invoke_with_rate_limit, estimate_tokens
+from llm_router import ProviderRouter, build_router, is_valid_agent_reply
+from trajectory import TrajectoryWriter, prompt_hash, message_text
+from task_store import add_task_store_args, load_tasks_from_args, is_task_completed
+from tracing import configure_tracing, start_task, finish_task, write_run_summary, span, traced_node, sleep, task_phase_seconds
+from run_report import load_pricing, count_image_tokens, record_usage, response_model, estimate_cost, with_progress, write_task_metrics, write_run_report
+from profiling import PROFILE_MODES, task_profiler
+from memory_monitor import configure_memory_from_args, start_memory_task, finish_memory_task, write_memory_summary,\
+    memory_node, image_ref, image_url, materialize_messages
+from artifact_store import configure_artifact_store_from_args, save_screenshot, save_accessibility_tree, write_artifact_summary
+from checkpointing import create_checkpointer, thread_config, load_resume_state, discard_thread
 
 # 引入本地 RAG 模組取代 RagFlow
 from local_rag import get_retriever_context
@@ -54,6 +66,10 @@ class State(TypedDict):
     current_screenshot : Annotated[str, "Current screenshot"]
     LLM_Cost : Annotated[float, "Total cost of LLM API"]
     RetrieverContext : Annotated[str, "Retriever Context"]
+    ActionStats : Annotated[dict, "LLM calls / actions executed per task"]
+    trajectory : Annotated[object, "Per-step trajectory writer"]
+    current_url : Annotated[str, "URL of the last observed page"]
+    resume_url : Annotated[str, "URL to reopen when resuming from a checkpoint"]
 
 def driver_config(args):
     options = webdriver.ChromeOptions()
@@ -133,14 +149,17 @@ def launchBrowser(state: State):
     options = driver_config(args)
     
     # 初始化Chrome瀏覽器驅動
-    driver = webdriver.Chrome(options=options)
+    with span('launch.browser_start'):
+        driver = webdriver.Chrome(options=options)
 
     
 
     # 設置瀏覽器視窗大小
     driver.set_window_size(args.window_width, args.window_height)
-    # 導航到任務指定的網頁
-    driver.get(task['web'])
+    # 導航到任務指定的網頁；從檢查點恢復時回到中斷前最後觀察的網址
+    resume_url = state.get("resume_url")
+    with span('launch.page_load'):
+        driver.get(resume_url or task['web'])
     
     try:
         # 等待頁面載入完成
@@ -156,25 +175,36 @@ def launchBrowser(state: State):
     # 防止空白鍵的預設行為(頁面滾動)，除非焦點在文本輸入框
     driver.execute_script("""window.onkeydown = function(e) {if(e.keyCode == 32 && e.target.type != 'text' && e.target.type != 'textarea') {e.preventDefault();}};""")
     
-    # 更新狀態：設置驅動器、初始化下載文件列表和迭代計數器
     state["driver"] = driver
+    if resume_url:
+        # 保留檢查點中的訊息、迭代次數與花費，重新觀察目前頁面
+        state["resume_url"] = None
+        state["fail_obs"] = ""
+        state["trajectory"].write('resume', url=resume_url, iteration=state["iteration"])
+        return state
+
+    # 更新狀態：設置驅動器、初始化下載文件列表和迭代計數器
     state["download_files"] = []
     state["iteration"] = 0
 
     state["RetrieverContext"] = "No data available."
     if args.use_rag:
-        state["RetrieverContext"] = GetRetrieverContext(state["llm"], task['ques'], task['web'],task['web_name'])
+        with span('launch.rag'):
+            state["RetrieverContext"] = GetRetrieverContext(state["llm"], task['ques'], task['web'],task['web_name'])
+
     #state["RetrieverContext"] = None
     return state
 
 def format_observation(state: State):
     state["iteration"] += 1
     if not state["fail_obs"]:
+        obs_start = time.time()
         driver = state["driver"]
         args = state["args"]
         
         if not args.text_only:
-            rects, web_eles, web_eles_text = get_web_element_rect(driver, fix_color=args.fix_box_color,detect_all =args.som_scan_all)
+            with span('observation.som_script'):
+                rects, web_eles, web_eles_text = get_web_element_rect(driver, fix_color=args.fix_box_color,detect_all =args.som_scan_all)
             state["web_elements"] = {
                 "rects": rects,
                 "elements": web_eles,
@@ -182,16 +212,27 @@ def format_observation(state: State):
             }
         else:
             accessibility_tree_path = os.path.join(state["task_dir"], f'accessibility_tree{state["iteration"]}')
-            ac_tree, obs_info = get_webarena_accessibility_tree(driver, accessibility_tree_path)
+            with span('observation.accessibility_tree'):
+                ac_tree, obs_info = get_webarena_accessibility_tree(driver)
+                save_accessibility_tree(accessibility_tree_path, ac_tree, obs_info)
             state["web_elements"] = {
                 "ac_tree": ac_tree,
                 "obs_info": obs_info
             }
+        state["current_url"] = driver.current_url
             
         img_path = os.path.join(state["task_dir"], f'screenshot{state["iteration"]}.png')
-        driver.save_screenshot(img_path)
+        with span('observation.screenshot'):
+            save_screenshot(driver, img_path)
         
-        state["current_screenshot"] = encode_image(img_path)
+        with span('observation.encode'):
+            # --spill_images: 只保存截圖檔的參照，送出請求時才讀成 base64
+            state["current_screenshot"] = image_ref(img_path) if args.spill_images else encode_image(img_path)
+        state["trajectory"].note(
+            screenshot=os.path.basename(img_path),
+            accessibility_tree=os.path.basename(accessibility_tree_path) if args.text_only else None,
+            observation_seconds=round(time.time() - obs_start, 3)
+        )
 
         return state
     
@@ -208,7 +249,7 @@ def format_msg(it, init_msg, pdf_obs, warn_obs, web_img_b64, web_text, retriever
             'context': retriever_context
         }
         init_msg_format['content'].append({"type": "image_url",
-                                           "image_url": {"url": f"data:image/png;base64,{web_img_b64}"}})
+                                           "image_url": {"url": image_url(web_img_b64)}})
         return init_msg_format
     else:
         if not pdf_obs:
@@ -218,7 +259,7 @@ def format_msg(it, init_msg, pdf_obs, warn_obs, web_img_b64, web_text, retriever
                     {'type': 'text', 'text': f"Observation:{warn_obs} please analyze the attached screenshot and give the Thought and Action. I've provided the tag name of each element and the text it contains (if text exists). Note that <textarea> or <input> may be textbox, but not exactly. Not all elements are in the screenshot. You can identify them by visible or invisible words. Please focus more on the screenshot and then refer to the textual information.\n{web_text}"},
                     {
                         'type': 'image_url',
-                        'image_url': {"url": f"data:image/png;base64,{web_img_b64}"}
+                        'image_url': {"url": image_url(web_img_b64)}
                     }
                 ],
                 'context': retriever_context
@@ -230,7 +271,7 @@ def format_msg(it, init_msg, pdf_obs, warn_obs, web_img_b64, web_text, retriever
                     {'type': 'text', 'text': f"Observation: {pdf_obs} Please analyze the response given by Assistant, then consider whether to continue iterating or not. The screenshot of the current page is also attached, give the Thought and Action. I've provided the tag name of each element and the text it contains (if text exists). Note that <textarea> or <input> may be textbox, but not exactly. Not all elements are in the screenshot. You can identify them by visible or invisible words. Please focus more on the screenshot and then refer to the textual information.\n{web_text}"},
                     {
                         'type': 'image_url',
-                        'image_url': {"url": f"data:image/png;base64,{web_img_b64}"}
+                        'image_url': {"url": image_url(web_img_b64)}
                     }
                 ],
                 'context': retriever_context
@@ -263,10 +304,13 @@ def thoughts(state: State):
 
     # 僅在 state["messages"] 為空時加入 system message (避免重置先前訊息)
     if not state["messages"]:
-        if args.text_only:
-            state["messages"].append({'role': 'system', 'content': SYSTEM_PROMPT_TEXT_ONLY})
-        else:
-            state["messages"].append({'role': 'system', 'content': SYSTEM_PROMPT_TYPE})
+        system_prompt = SYSTEM_PROMPT_TEXT_ONLY if args.text_only else SYSTEM_PROMPT_TYPE
+        if args.max_actions_per_turn > 1:
+            system_prompt = build_multi_action_prompt(system_prompt, args.max_actions_per_turn)
+        if args.action_mode == 'json':
+            system_prompt += ACTION_MODE_JSON_PROMPT
+        state["messages"].append({'role': 'system', 'content': system_prompt})
+        state["trajectory"].write('task', task=state["task"], use_rag=args.use_rag, system_prompt=system_prompt)
     
     obs_prompt = "Observation: please analyze the attached screenshot and give the Thought and Action. "
     if args.text_only:
@@ -308,28 +352,61 @@ def thoughts(state: State):
     
     # Clip messages, too many attached images may cause confusion
     if not args.text_only:
-        state["messages"] = clip_message_and_obs(state["messages"], args.max_attached_imgs)
+        with span('thoughts.clip_messages'):
+            state["messages"] = clip_message_and_obs(state["messages"], args.max_attached_imgs)
     else:
-        state["messages"] = clip_message_and_obs_text_only(state["messages"], args.max_attached_imgs)
+        with span('thoughts.clip_messages'):
+            state["messages"] = clip_message_and_obs_text_only(state["messages"], args.max_attached_imgs)
+
+    # 結構化動作模式：綁定 browser_action 工具，讓模型回傳 {action, element, content}
+    llm = state["llm"]
+    if args.action_mode == 'json':
+        llm = llm.bind_tools([browser_action], tool_choice="browser_action")
 
     # Call GPT-4V API and process response
-    prompt_tokens, completion_tokens, gpt_call_error, openai_response = call_gpt4v_api(args, state["llm"], state["messages"])
+    image_tokens = count_image_tokens(state["messages"])
+    llm_start = time.time()
+    with span('thoughts.llm_call'):
+        prompt_tokens, completion_tokens, gpt_call_error, openai_response = call_gpt4v_api(args, llm, state["messages"])
+    llm_seconds = round(time.time() - llm_start, 3)
+    step_record = {
+        'iteration': state["iteration"],
+        'user_text': message_text(curr_msg),
+        'pdf_obs': state["pdf_obs"],
+        'warn_obs': state["warn_obs"],
+        'prompt_hash': prompt_hash(state["messages"]),
+        'llm_seconds': llm_seconds,
+        # 累計計數在寫入時才複製，會包含本次呼叫的用量
+        'cost': state["LLM_Cost"],
+        'action_stats': state["ActionStats"],
+    }
+    state["ActionStats"]["llm_calls"] += 1
+    state["ActionStats"]["turns"] = state["iteration"]
     
     if gpt_call_error:
         # Add error handling for token counting
         logging.error('API call failed')
         state["fail_obs"] = "OpenAI API call failed. Please try again."
+        state["trajectory"].write('step', response=None, error='api_call_failed', **step_record)
         return state
     
-    state["LLM_Cost"]["accumulate_prompt_token"] += prompt_tokens
-    state["LLM_Cost"]["accumulate_completion_token"] += completion_tokens
+    record_usage(state["LLM_Cost"], response_model(openai_response, state["llm"], args.api_model),
+                 prompt_tokens, completion_tokens, image_tokens)
     logging.info(f'Accumulate Prompt Tokens: {state["LLM_Cost"]["accumulate_prompt_token"]}; Accumulate Completion Tokens: {state["LLM_Cost"]["accumulate_completion_token"]}')
     logging.info('API call complete...')
         
     #gpt_response = openai_response.choices[0].message.content
-    gpt_response = openai_response.content
+    # 統一轉為 Thought/Action 文字，後續節點與評估流程維持不變
+    gpt_response = normalize_llm_reply(openai_response, state["ActionStats"])
     state["messages"].append({'role': 'assistant', 'content': gpt_response})
     state["current_response"] = gpt_response
+    action_key, info = parse_action_response(gpt_response)
+    state["trajectory"].write(
+        'step', response=gpt_response,
+        parsed_action={'action': action_key, 'info': info},
+        tokens={'prompt': prompt_tokens, 'completion': completion_tokens},
+        **step_record
+    )
     
     
 
@@ -339,7 +416,7 @@ def thoughts(state: State):
 def exec_action_click(info, web_ele, driver_task):
     driver_task.execute_script("arguments[0].setAttribute('target', '_self')", web_ele)
     web_ele.click()
-    time.sleep(3)
+    sleep(3)
 
 def exec_action_type(info, web_ele, driver_task):
     warn_obs = ""
@@ -380,7 +457,7 @@ def exec_action_type(info, web_ele, driver_task):
     actions.pause(2)
     #actions.send_keys(Keys.ENTER)
     actions.perform()
-    time.sleep(10)
+    sleep(10)
     return warn_obs
 
 def exec_action_scroll(info, web_eles, driver_task, args, obs_info):
@@ -405,123 +482,169 @@ def exec_action_scroll(info, web_eles, driver_task, args, obs_info):
             actions.key_down(Keys.ALT).send_keys(Keys.ARROW_DOWN).key_up(Keys.ALT).perform()
         else:
             actions.key_down(Keys.ALT).send_keys(Keys.ARROW_UP).key_up(Keys.ALT).perform()
-    time.sleep(3)
+    sleep(3)
 
-# 修改 action 函數
-def action(state: State):
-    response = state["current_response"]
-    chosen_action = re.split(r'Thought:|Action:|Observation:', response)[2].strip()
-    action_key, info = extract_information(chosen_action)
-    
-    # 如果是 answer action，直接返回不再循環
-    if action_key == 'answer':
-        logging.info(f'Final Answer: {info["content"]}')
-        with open(os.path.join(state["task_dir"], "answer.txt"), "w", encoding='utf-8' ) as f:
-            f.write(info["content"])
-        return state
+def resolve_target(driver, args, web_elements, number):
+    """依數字標籤取得目標元素，text_only 模式以 accessibility tree 的座標定位"""
+    if not args.text_only:
+        return web_elements["elements"][int(number)]
+    element_box = web_elements["obs_info"][number]['union_bound']
+    element_box_center = (element_box[0] + element_box[2] // 2,
+                        element_box[1] + element_box[3] // 2)
+    return driver.execute_script(
+        "return document.elementFromPoint(arguments[0], arguments[1]);",
+        element_box_center[0], element_box_center[1]
+    )
+
+def mark_page(driver):
+    """在目前頁面留下標記，之後可用來判斷是否已換頁"""
+    token = str(time.time())
+    driver.execute_script("window.__webvoyager_turn = arguments[0];", token)
+    return token
+
+def page_mutated(driver, args, web_elements, token, action_key, info):
+    """批次動作執行前檢查頁面是否已改變：換頁、或目標元素已失效/不可見"""
+    try:
+        if driver.execute_script("return window.__webvoyager_turn || null;") != token:
+            return True
+        number = info[0] if action_key == 'click' else info.get('number') if isinstance(info, dict) else None
+        if action_key in ('click', 'type') or (action_key == 'scroll' and number != "WINDOW"):
+            if not args.text_only:
+                return not resolve_target(driver, args, web_elements, number).is_displayed()
+    except Exception:
+        return True
+    return False
 
+def execute_action(state: State, action_key, info):
+    """執行單一動作，無法執行時拋出例外"""
     driver = state["driver"]
     args = state["args"]
     web_elements = state["web_elements"]
-    state["fail_obs"] = ""
-    state["pdf_obs"] = ""
-    state["warn_obs"] = ""
-    
-    try:
-        window_handle = driver.current_window_handle
-        driver.switch_to.window(window_handle)
 
-        if action_key == 'click':
-            if not args.text_only:
-                click_ele_number = int(info[0])
-                web_ele = web_elements["elements"][click_ele_number]
-            else:
-                click_ele_number = info[0]
-                element_box = web_elements["obs_info"][click_ele_number]['union_bound']
-                element_box_center = (element_box[0] + element_box[2] // 2,
-                                    element_box[1] + element_box[3] // 2)
-                web_ele = driver.execute_script(
-                    "return document.elementFromPoint(arguments[0], arguments[1]);",
-                    element_box_center[0], element_box_center[1]
-                )
+    if action_key == 'click':
+        web_ele = resolve_target(driver, args, web_elements, info[0])
+        exec_action_click(info, web_ele, driver)
+        
+        # Handle PDF download
+        current_files = sorted(os.listdir(args.download_dir))
+        if current_files != state["download_files"]:
+            sleep(10)
+            current_files = sorted(os.listdir(args.download_dir))
             
-            exec_action_click(info, web_ele, driver)
+            current_download_file = [
+                pdf_file for pdf_file in current_files 
+                if pdf_file not in state["download_files"] and pdf_file.endswith('.pdf')
+            ]
             
-            # Handle PDF download
-            current_files = sorted(os.listdir(args.download_dir))
-            if current_files != state["download_files"]:
-                time.sleep(10)
-                current_files = sorted(os.listdir(args.download_dir))
-                
-                current_download_file = [
-                    pdf_file for pdf_file in current_files 
-                    if pdf_file not in state["download_files"] and pdf_file.endswith('.pdf')
-                ]
-                
-                if current_download_file:
-                    pdf_file = current_download_file[0]
+            if current_download_file:
+                pdf_file = current_download_file[0]
+                with span('action.pdf'):
                     state["pdf_obs"] = get_pdf_retrieval_ans_from_assistant(
                         state["llm"], 
                         os.path.join(args.download_dir, pdf_file), 
                         state["task"]['ques']
                     )
-                    shutil.copy(
-                        os.path.join(args.download_dir, pdf_file),
-                        state["task_dir"]
-                    )
-                    state["pdf_obs"] = "You downloaded a PDF file, I ask the Assistant API to answer the task based on the PDF file and get the following response: " + state["pdf_obs"]
-                
-                state["download_files"] = current_files
-
-        elif action_key == 'type':
-            if not args.text_only:
-                type_ele_number = int(info['number'])
-                web_ele = web_elements["elements"][type_ele_number]
-            else:
-                type_ele_number = info['number']
-                element_box = web_elements["obs_info"][type_ele_number]['union_bound']
-                element_box_center = (element_box[0] + element_box[2] // 2,
-                                    element_box[1] + element_box[3] // 2)
-                web_ele = driver.execute_script(
-                    "return document.elementFromPoint(arguments[0], arguments[1]);",
-                    element_box_center[0], element_box_center[1]
+                shutil.copy(
+                    os.path.join(args.download_dir, pdf_file),
+                    state["task_dir"]
                 )
+                state["pdf_obs"] = "You downloaded a PDF file, I ask the Assistant API to answer the task based on the PDF file and get the following response: " + state["pdf_obs"]
             
-            state["warn_obs"] = exec_action_type(info, web_ele, driver)
+            state["download_files"] = current_files
 
-        elif action_key == 'scroll':
-            if not args.text_only:
-                exec_action_scroll(info, web_elements["elements"], driver, args, None)
-            else:
-                exec_action_scroll(info, None, driver, args, web_elements["obs_info"])
+    elif action_key == 'type':
+        web_ele = resolve_target(driver, args, web_elements, info['number'])
+        warn_obs = exec_action_type(info, web_ele, driver)
+        if warn_obs:
+            state["warn_obs"] = (state["warn_obs"] + " " + warn_obs).strip()
 
-        elif action_key == 'wait':
-            time.sleep(5)
+    elif action_key == 'scroll':
+        if not args.text_only:
+            exec_action_scroll(info, web_elements["elements"], driver, args, None)
+        else:
+            exec_action_scroll(info, None, driver, args, web_elements["obs_info"])
 
-        elif action_key == 'goback':
-            driver.back()
-            time.sleep(2)
+    elif action_key == 'wait':
+        sleep(5)
 
-        elif action_key == 'google':
-            driver.get('https://www.google.com/')
-            time.sleep(2)
+    elif action_key == 'goback':
+        driver.back()
+        sleep(2)
 
-        elif action_key == 'answer':
-            logging.info(info['content'])
-            logging.info('finish!!')
-            return state
+    elif action_key == 'google':
+        driver.get('https://www.google.com/')
+        sleep(2)
 
-        else:
-            raise NotImplementedError
+    else:
+        raise NotImplementedError
 
-    except Exception as e:
-        logging.error('Driver error info:')
-        logging.error(e)
-        if 'element click intercepted' not in str(e):
-            state["fail_obs"] = "The action you have chosen cannot be executed. Please double-check if you have selected the wrong Numerical Label or Action or Action format. Then provide the revised Thought and Action."
-        time.sleep(2)
-    
+# 修改 action 函數
+def action(state: State):
+    response = state["current_response"]
+    action_key, info = parse_action_response(response)
     
+    # 如果是 answer action，直接返回不再循環
+    if action_key == 'answer':
+        logging.info(f'Final Answer: {info["content"]}')
+        with open(os.path.join(state["task_dir"], "answer.txt"), "w", encoding='utf-8' ) as f:
+            f.write(info["content"])
+        return state
+
+    driver = state["driver"]
+    args = state["args"]
+    web_elements = state["web_elements"]
+    state["fail_obs"] = ""
+    state["pdf_obs"] = ""
+    state["warn_obs"] = ""
+
+    # 批次動作模式：依序執行同一組標籤上的多個動作，單一動作模式只取第一個
+    planned = [(action_key, info)]
+    if args.max_actions_per_turn > 1:
+        planned += [extract_information(text) for text in split_action_texts(response)[1:args.max_actions_per_turn]]
+    token = mark_page(driver) if len(planned) > 1 else None
+    stats = state["ActionStats"]
+    executed = 0
+
+    for idx, (action_key, info) in enumerate(planned):
+        if idx > 0:
+            if action_key is None:
+                state["warn_obs"] = (state["warn_obs"] + f" note: Could not parse action {idx + 1}, it and the remaining {len(planned) - idx - 1} action(s) were not executed.").strip()
+                break
+            if action_key == 'answer':
+                state["warn_obs"] = (state["warn_obs"] + f" note: Action {idx + 1} was skipped, ANSWER must be the only action of an iteration.").strip()
+                break
+            if page_mutated(driver, args, web_elements, token, action_key, info):
+                stats["aborted_batches"] += 1
+                logging.info(f'Page changed after action {idx}, skipping {len(planned) - idx} remaining action(s)')
+                state["warn_obs"] = (state["warn_obs"] + f" note: The page changed after action {idx}, the remaining {len(planned) - idx} action(s) were not executed.").strip()
+                break
+        try:
+            window_handle = driver.current_window_handle
+            driver.switch_to.window(window_handle)
+            with span(f'action.{action_key}'):
+                execute_action(state, action_key, info)
+            executed += 1
+        except Exception as e:
+            logging.error('Driver error info:')
+            logging.error(e)
+            if idx > 0:
+                # 前面的動作已生效，需要重新觀察頁面，因此以警告取代失敗
+                state["warn_obs"] = (state["warn_obs"] + f" note: Action {idx + 1} could not be executed, the remaining actions were skipped.").strip()
+            elif 'element click intercepted' not in str(e):
+                state["fail_obs"] = "The action you have chosen cannot be executed. Please double-check if you have selected the wrong Numerical Label or Action or Action format. Then provide the revised Thought and Action."
+            sleep(2)
+            break
+
+    stats["actions"] += executed
+    try:
+        current_url = driver.current_url
+    except Exception:
+        current_url = None
+    state["trajectory"].write(
+        'action', iteration=state["iteration"], planned=len(planned), executed=executed,
+        fail_obs=state["fail_obs"], warn_obs=state["warn_obs"], url=current_url,
+        cost=state["LLM_Cost"], action_stats=state["ActionStats"]
+    )
     return state
 
 def has_answer(state: State) -> Literal["action", "answer"]:
@@ -537,15 +660,14 @@ def has_answer(state: State) -> Literal["action", "answer"]:
 
     response = state["current_response"]
     try:
-        chosen_action = re.split(r'Thought:|Action:|Observation:', response)[2].strip()
-        action_key, _ = extract_information(chosen_action)
+        action_key, _ = parse_action_response(response)
         return "answer" if action_key == "answer" else "action"
     except:
         return "action"
 
 def answer(state: State):
     response = state["current_response"]
-    answer_content = re.split(r'Thought:|Action:|Observation:', response)[2].strip()
+    answer_content = split_action_texts(response)[0]
     
     with open(os.path.join(state["task_dir"], "answer.txt"), "w", encoding='utf-8') as f:
         f.write(answer_content)
@@ -553,7 +675,12 @@ def answer(state: State):
     
     print_message(state["messages"], state["task_dir"])
     state["driver"].quit()
-    logging.info(f'Total cost: {state["LLM_Cost"]["accumulate_prompt_token"] / 1000 * 0.01 + state["LLM_Cost"]["accumulate_completion_token"] / 1000 * 0.03}')
+    logging.info(f'Total cost: {estimate_cost(state["LLM_Cost"], state["args"].pricing, state["args"].api_model):.4f}')
+    logging.info(f'Action stats: {state["ActionStats"]}')
+    with open(os.path.join(state["task_dir"], "action_stats.json"), "w", encoding='utf-8') as f:
+        json.dump(dict(state["ActionStats"], max_actions_per_turn=state["args"].max_actions_per_turn), f, indent=2)
+    state["trajectory"].write('end', iteration=state["iteration"], cost=state["LLM_Cost"], action_stats=state["ActionStats"])
+    state["trajectory"].flush()
 
 
     return state
@@ -565,44 +692,33 @@ def showImage(image):
     plt.show()  # Display the image
 
 def call_gpt4v_api(args, llm, messages):
-    retry_times = 0
-    while True:
-        try:
-            if not args.text_only:
-                logging.info('Calling Gemini API...')
-                response = llm.invoke(messages)
-            else:
-                logging.info('Calling Gemini API...')
-                response = llm.invoke(messages, timeout=30)
-
-            # Extract token usage from response metadata
-            token_usage = response.response_metadata.get('token_usage', {})
-            prompt_tokens = token_usage.get('prompt_tokens', 0)
-            completion_tokens = token_usage.get('completion_tokens', 0)
-
-            if not prompt_tokens and not completion_tokens:
-                # Gemini可能沒有提供token計數，使用估算值
-                prompt_tokens = len(str(messages)) // 4
-                completion_tokens = len(response.content) // 4
-                
-            logging.info(f'Prompt Tokens: {prompt_tokens}; Completion Tokens: {completion_tokens}')
-
-            return prompt_tokens, completion_tokens, False, response
+    try:
+        logging.info('Calling Gemini API...')
+        kwargs = {}
+        if args.text_only:
+            kwargs['timeout'] = 30
+        if isinstance(llm, ProviderRouter):
+            # 多供應商時只採用格式正確的 Thought/Action 回覆
+            kwargs['validate'] = is_valid_agent_reply
+        response = invoke_with_rate_limit(llm, materialize_messages(messages), **kwargs)
+    except Exception as e:
+        # 可重試的錯誤已由共用限制器處理，到這裡代表放棄
+        logging.info(f'API call failed. Error type: {type(e).__name__}')
+        return None, None, True, None
 
-        except Exception as e:
-            logging.info(f'Error occurred, retrying. Error type: {type(e).__name__}')
+    # Extract token usage from response metadata
+    token_usage = response.response_metadata.get('token_usage', {})
+    prompt_tokens = token_usage.get('prompt_tokens', 0)
+    completion_tokens = token_usage.get('completion_tokens', 0)
+
+    if not prompt_tokens and not completion_tokens:
+        # LLM可能沒有提供token計數，使用估算值
+        prompt_tokens = estimate_tokens(messages)
+        completion_tokens = len(response.content) // 4
 
-            if isinstance(e, RateLimitError):
-                time.sleep(10)
-            elif isinstance(e, APIError):
-                time.sleep(15)
-            else:
-                return None, None, True, None
+    logging.info(f'Prompt Tokens: {prompt_tokens}; Completion Tokens: {completion_tokens}')
 
-            retry_times += 1
-            if retry_times == 10:
-                logging.info('Retrying too many times')
-                return None, None, True, None
+    return prompt_tokens, completion_tokens, False, response
 
 def setup_logger(folder_path):
     log_file_path = os.path.join(folder_path, 'agent.log')
@@ -621,10 +737,23 @@ def setup_logger(folder_path):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--test_file', type=str, default='data/test.json')
+    add_task_store_args(parser)
     parser.add_argument('--max_iter', type=int, default=5)
     parser.add_argument("--api_key", default="key", type=str, help="YOUR_OPENAI_API_KEY")
     parser.add_argument("--api_model", default="gpt-4-vision-preview", type=str, help="api model name")
     parser.add_argument("--output_dir", type=str, default='results')
+    parser.add_argument("--trace", action='store_true', help="Write per-task Chrome traces and a per-phase latency summary")
+    parser.add_argument("--profile", type=str, nargs='?', const='cprofile', default=None, choices=PROFILE_MODES,
+                        help="Profile each task into its task_dir (cprofile, or sample for a low-overhead stack sampler)")
+    parser.add_argument("--track_memory", action='store_true', help="Record RSS and tracemalloc peaks per node and per task")
+    parser.add_argument("--spill_images", action='store_true', help="Keep screenshots in state as file references and inline them only when calling the LLM")
+    parser.add_argument("--image_cache_mb", type=float, default=None, help="Cap the in-memory screenshot caches at N MB each")
+    parser.add_argument("--artifact_store", action='store_true', help="Store screenshots and accessibility trees deduplicated by content hash, linked from task_dir")
+    parser.add_argument("--artifact_dir", type=str, default=None, help="Artifact store location (default: <result_dir>/artifacts); share it across runs to deduplicate between them")
+    parser.add_argument("--compress_trees", action='store_true', help="zstd-compress stored accessibility trees (requires zstandard)")
+    parser.add_argument("--pricing_file", type=str, default=None, help="JSON {model: [prompt, completion]} USD per 1K tokens, overrides the built-in table")
+    parser.add_argument("--resume", type=str, default=None, help="Resume an interrupted run in this result_dir")
+    parser.add_argument("--no_checkpoint", action='store_true', help="Do not save LangGraph checkpoints")
     parser.add_argument("--seed", type=int, default=None)
     parser.add_argument("--max_attached_imgs", type=int, default=1)
     parser.add_argument("--temperature", type=float, default=1.0)
@@ -641,9 +770,19 @@ def main():
     parser.add_argument("--api_version", type=str, default="")
     parser.add_argument("--llm", type=str, default="openai", choices=["openai", "azure","openrouter","gemini"])
     parser.add_argument("--som_scan_all", type=bool, default=False)
+    parser.add_argument("--rpm_limit", type=int, default=None, help="Requests per minute shared by all LLM calls of a model")
+    parser.add_argument("--tpm_limit", type=int, default=None, help="Tokens per minute shared by all LLM calls of a model")
+    parser.add_argument("--action_mode", type=str, default="text", choices=["text", "json"], help="json: structured tool-calling actions")
+    parser.add_argument("--providers", type=str, default=None, help="JSON file listing weighted LLM providers for hedged/failover requests")
+    parser.add_argument("--max_actions_per_turn", type=int, default=1, help="Allow the model to emit up to N ordered actions per turn (1 = single-action mode)")
+    parser.add_argument("--hedge_after", type=float, default=30.0, help="Hedge deadline in seconds until enough latency samples exist")
     parser.add_argument("--use_rag", action="store_true", default=False, help="Use RAG to get context for the task")
 
     args = parser.parse_args()
+    configure_from_args(args)
+    configure_tracing(args.trace)
+    configure_memory_from_args(args)
+    args.pricing = load_pricing(args.pricing_file)
 
     #options = driver_config(args)
 
@@ -678,14 +817,16 @@ def main():
             convert_system_message_to_human=True
         )
 
-    # Save Result file
-    result_dir = setup_environment(args)
+    if args.providers:
+        # 多供應商路由取代單一模型，--llm 相關參數僅在未指定時使用
+        llm = build_router(args.providers, args.temperature, default_deadline=args.hedge_after)
+
+    # Save Result file；--resume 時沿用中斷的結果目錄
+    result_dir = args.resume or setup_environment(args)
+    configure_artifact_store_from_args(args, result_dir)
 
     # Load tasks
-    tasks = []
-    with open(args.test_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            tasks.append(json.loads(line))
+    tasks = load_tasks_from_args(args)
     
     #prompt = ChatPromptTemplate.from_template("prompt_str")
     #chain = prompt | llm
@@ -694,11 +835,11 @@ def main():
     workflow = StateGraph(State)
     
     # Add nodes
-    workflow.add_node("launchBrowser", launchBrowser)
-    workflow.add_node("observation", format_observation)
-    workflow.add_node("thoughts", thoughts)
-    workflow.add_node("action", action)
-    workflow.add_node("answer", answer)
+    workflow.add_node("launchBrowser", traced_node("launchBrowser", memory_node("launchBrowser", launchBrowser)))
+    workflow.add_node("observation", traced_node("observation", memory_node("observation", format_observation)))
+    workflow.add_node("thoughts", traced_node("thoughts", memory_node("thoughts", thoughts)))
+    workflow.add_node("action", traced_node("action", memory_node("action", action)))
+    workflow.add_node("answer", traced_node("answer", memory_node("answer", answer)))
     
     # Add edges
     workflow.add_edge(START, "launchBrowser")
@@ -715,13 +856,24 @@ def main():
     workflow.add_edge("action", "observation")  # action 完成後回到 observation
     workflow.add_edge("answer", END)
     
-    # Compile and run
-    graph = workflow.compile()
+    # Compile and run；每個節點執行後保存檢查點
+    checkpointer = None
+    if args.resume or not args.no_checkpoint:
+        try:
+            checkpointer = create_checkpointer(result_dir)
+        except ImportError:
+            if args.resume:
+                raise
+            print('langgraph-checkpoint-sqlite is not installed, running without checkpoints')
+    graph = workflow.compile(checkpointer=checkpointer)
     
     # Load tasks and execute
     for task in tasks:
 
         task_dir = os.path.join(result_dir, f'task{task["id"]}')
+        if args.resume and is_task_completed(task_dir):
+            print(f'Task {task["id"]} already completed, skipped')
+            continue
         os.makedirs(task_dir, exist_ok=True)
         setup_logger(task_dir)
         logging.info(f'########## TASK{task["id"]} ##########')
@@ -729,7 +881,9 @@ def main():
 
         cost = {
             "accumulate_prompt_token": 0,
-            "accumulate_completion_token": 0
+            "accumulate_completion_token": 0,
+            "accumulate_image_token": 0,
+            "by_model": {}
         }
 
         initial_state = {
@@ -746,17 +900,57 @@ def main():
             "iteration": 0,
             "driver": None,
             "current_response": None,
-            "LLM_Cost": cost
+            "LLM_Cost": cost,
+            "ActionStats": {"turns": 0, "llm_calls": 0, "actions": 0, "aborted_batches": 0,
+                            "parse_tool_call": 0, "parse_json_content": 0, "parse_text": 0, "parse_failed": 0},
+            "trajectory": None,
+            "current_url": "",
+            "resume_url": None
         }
+
+        config = thread_config(task["id"])
+        if args.resume and checkpointer is not None:
+            saved_state = load_resume_state(graph, config)
+            if saved_state:
+                initial_state.update(saved_state)
+                initial_state["resume_url"] = saved_state["current_url"]
+                print(f'Resuming task {task["id"]} at iteration {saved_state["iteration"]}: {saved_state["current_url"]}')
         
+        # 逐步軌跡紀錄由 main 建立並在 finally 關閉，任務中途失敗時也會寫出已排入的紀錄並結束背景執行緒
+        trajectory = initial_state["trajectory"] = TrajectoryWriter(task_dir)
+        start_task(task["id"])
+        start_memory_task(task["id"])
+        started_at = time.time()
+        result, error = None, None
         try:
-            result = graph.invoke(initial_state, {"recursion_limit": 100})
+            with task_profiler(task_dir, args.profile):
+                result = graph.invoke(initial_state, config)
             logging.info(f"Task {task['id']} completed successfully")
+            if checkpointer is not None:
+                discard_thread(checkpointer, config)
         except Exception as e:
             import traceback
+            error = f"{type(e).__name__}: {e}"
             logging.error(f"Task {task['id']} failed: {str(e)}")
             traceback.print_exc()
             continue
+        finally:
+            # 崩潰的任務沒有最終狀態，計數取自軌跡最後的紀錄
+            task_state = result or with_progress(initial_state, trajectory.progress)
+            write_task_metrics(task_dir, task, task_state, started_at, error, task_phase_seconds(),
+                               pricing=args.pricing)
+            finish_task(task_dir)
+            finish_memory_task(task_dir)
+            trajectory.close()
+
+    write_run_summary(result_dir)
+    write_memory_summary(result_dir)
+    write_artifact_summary()
+    write_run_report(result_dir, args.pricing)
+
+    if isinstance(llm, ProviderRouter):
+        llm.log_summary()
+        print(json.dumps(llm.summary(), ensure_ascii=False, indent=2))
 
     #image = graph.get_graph().draw_mermaid_png()
     #showImage(image)
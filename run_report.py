@@ -0,0 +1,263 @@
+"""
+執行報告
+每個任務結束時寫出 metrics.json (步驟數、LLM 呼叫、token 用量、花費、各階段耗時、失敗與重試)，
+整次執行結束後彙整為 run_report.json 與 run_report.html，並依 web_name 分組，
+方便比較不同程式版本的吞吐量與花費。
+
+也可對既有的結果目錄重新產生報告：
+    python run_report.py results/20250101_12_00_00 [--pricing_file pricing.json]
+"""
+
+import argparse
+import html
+import json
+import os
+import subprocess
+import time
+
+from rate_limiter import IMAGE_TOKEN_ESTIMATE, get_rate_limiter, model_name_of
+
+METRICS_FILE = 'metrics.json'
+
+# 每 1K tokens 的價格 (USD)：(prompt, completion)；以模型名稱最長的前綴比對
+MODEL_PRICING = {
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.0025, 0.01),
+    'gpt-4.1-nano': (0.0001, 0.0004),
+    'gpt-4.1-mini': (0.0004, 0.0016),
+    'gpt-4.1': (0.002, 0.008),
+    'gpt-4-turbo': (0.01, 0.03),
+    'gpt-4-vision-preview': (0.01, 0.03),
+    'gpt-4': (0.03, 0.06),
+    'gemini-1.5-flash': (0.000075, 0.0003),
+    'gemini-1.5-pro': (0.00125, 0.005),
+    'gemini-2.0-flash': (0.0001, 0.0004),
+    'claude-3-5-sonnet': (0.003, 0.015),
+    'claude-3-5-haiku': (0.0008, 0.004),
+}
+# 未列出的模型沿用原本寫死的價格
+DEFAULT_PRICING = (0.01, 0.03)
+
+
+def load_pricing(path=None):
+    """回傳價格表；path 為 {模型: [prompt, completion]} 的 JSON，會覆蓋內建的價格"""
+    pricing = dict(MODEL_PRICING)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            pricing.update({model: tuple(prices) for model, prices in json.load(f).items()})
+    return pricing
+
+
+def price_for(model, pricing=None):
+    pricing = pricing or MODEL_PRICING
+    model = (model or '').lower()
+    matches = [name for name in pricing if model.startswith(name.lower())]
+    return pricing[max(matches, key=len)] if matches else DEFAULT_PRICING
+
+
+def count_image_tokens(messages):
+    """估計送出的訊息中圖片佔用的 token 數"""
+    images = 0
+    for msg in messages:
+        content = msg.get('content') if isinstance(msg, dict) else None
+        if isinstance(content, list):
+            images += sum(1 for item in content if isinstance(item, dict) and item.get('type') == 'image_url')
+    return images * IMAGE_TOKEN_ESTIMATE
+
+
+def record_usage(cost, model, prompt_tokens, completion_tokens, image_tokens=0):
+    """把一次 LLM 呼叫的用量累加到 state["LLM_Cost"]，並依模型分開記錄以便計價"""
+    cost["accumulate_prompt_token"] += prompt_tokens
+    cost["accumulate_completion_token"] += completion_tokens
+    cost["accumulate_image_token"] = cost.get("accumulate_image_token", 0) + image_tokens
+    by_model = cost.setdefault("by_model", {})
+    usage = by_model.setdefault(model or 'unknown', {'prompt': 0, 'completion': 0, 'calls': 0})
+    usage['prompt'] += prompt_tokens
+    usage['completion'] += completion_tokens
+    usage['calls'] += 1
+
+
+def response_model(response, llm, default=None):
+    """實際回覆的模型名稱，多供應商路由時每次呼叫可能不同"""
+    metadata = getattr(response, 'response_metadata', None) or {}
+    return metadata.get('model_name') or metadata.get('model') or model_name_of(llm) or default
+
+
+def estimate_cost(cost, pricing=None, default_model=None):
+    """依各模型的用量計算花費 (USD)"""
+    by_model = cost.get("by_model") or {
+        default_model or 'unknown': {'prompt': cost.get("accumulate_prompt_token", 0),
+                                     'completion': cost.get("accumulate_completion_token", 0)}
+    }
+    total = 0.0
+    for model, usage in by_model.items():
+        prompt_price, completion_price = price_for(model, pricing)
+        total += usage['prompt'] / 1000 * prompt_price + usage['completion'] / 1000 * completion_price
+    return total
+
+
+def with_progress(state, progress):
+    """
+    graph 崩潰時沒有最終狀態；以軌跡最後記錄的累計計數 (TrajectoryWriter.progress) 取代初始狀態中的計數，
+    讓失敗任務的步驟數與花費仍計入報告
+    """
+    if not progress:
+        return state
+    return dict(state, **{
+        "iteration": progress.get('iteration', state.get("iteration", 0)),
+        "LLM_Cost": progress.get('cost', state.get("LLM_Cost")),
+        "ActionStats": progress.get('action_stats', state.get("ActionStats")),
+    })
+
+
+def write_task_metrics(task_dir, task, state, started_at, error=None, phase_seconds=None,
+                       attempt=None, pricing=None, filename=METRICS_FILE):
+    """寫出單一任務的指標，state 為 graph 最終的狀態 (失敗時為 with_progress 補上計數的初始狀態)"""
+    cost = state.get("LLM_Cost") or {}
+    stats = state.get("ActionStats") or {}
+    default_model = getattr(state.get("args"), 'api_model', None)
+    metrics = {
+        'task_id': task['id'],
+        'web_name': task.get('web_name', ''),
+        'attempt': attempt,
+        'started_at': started_at,
+        'ended_at': time.time(),
+        'wall_seconds': round(time.time() - started_at, 3),
+        'steps': state.get("iteration", 0),
+        'llm_calls': stats.get("llm_calls", 0),
+        'actions': stats.get("actions", 0),
+        'aborted_batches': stats.get("aborted_batches", 0),
+        'parse_failures': stats.get("parse_failed", 0),
+        'prompt_tokens': cost.get("accumulate_prompt_token", 0),
+        'completion_tokens': cost.get("accumulate_completion_token", 0),
+        'image_tokens': cost.get("accumulate_image_token", 0),
+        'tokens_by_model': cost.get("by_model", {}),
+        'cost_usd': round(estimate_cost(cost, pricing, default_model), 6),
+        'failed': error is not None,
+        'error': error,
+        'phase_seconds': phase_seconds or {},
+    }
+    with open(os.path.join(task_dir, filename), 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2)
+    return metrics
+
+
+def iter_task_metrics(result_dir):
+    for entry in sorted(os.scandir(result_dir), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        for name in sorted(os.listdir(entry.path)):
+            if name.startswith('metrics') and name.endswith('.json'):
+                with open(os.path.join(entry.path, name), 'r', encoding='utf-8') as f:
+                    yield json.load(f)
+
+
+def _aggregate(records):
+    tasks = {record['task_id'] for record in records}
+    if not records:
+        return {}
+    wall = max(r['ended_at'] for r in records) - min(r['started_at'] for r in records)
+    phases = {}
+    for record in records:
+        for name, seconds in record.get('phase_seconds', {}).items():
+            phases[name] = phases.get(name, 0.0) + seconds
+    total_steps = sum(r['steps'] for r in records)
+    return {
+        'tasks': len(tasks),
+        'attempts': len(records),
+        'retries': len(records) - len(tasks),
+        'failures': sum(1 for r in records if r['failed']),
+        'wall_seconds': round(wall, 1),
+        'tasks_per_hour': round(len(tasks) / (wall / 3600), 2) if wall > 0 else None,
+        'steps_per_task': round(total_steps / len(tasks), 2),
+        'llm_calls': sum(r['llm_calls'] for r in records),
+        'actions': sum(r['actions'] for r in records),
+        'parse_failures': sum(r.get('parse_failures', 0) for r in records),
+        'prompt_tokens': sum(r['prompt_tokens'] for r in records),
+        'completion_tokens': sum(r['completion_tokens'] for r in records),
+        'image_tokens': sum(r['image_tokens'] for r in records),
+        'cost_usd': round(sum(r['cost_usd'] for r in records), 4),
+        'cost_per_task_usd': round(sum(r['cost_usd'] for r in records) / len(tasks), 4),
+        'phase_seconds': {name: round(seconds, 2) for name, seconds in sorted(phases.items(), key=lambda item: -item[1])},
+    }
+
+
+def _code_version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def build_run_report(result_dir, pricing=None):
+    records = list(iter_task_metrics(result_dir))
+    if pricing is not None:
+        # 以指定的價格表重新計價
+        for record in records:
+            record['cost_usd'] = estimate_cost({'by_model': record['tokens_by_model']}, pricing) \
+                if record.get('tokens_by_model') else record['cost_usd']
+    by_site = {}
+    for record in records:
+        by_site.setdefault(record['web_name'], []).append(record)
+    return {
+        'result_dir': os.path.abspath(result_dir),
+        'generated_at': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        'code_version': _code_version(),
+        'pricing_usd_per_1k': {model: list(prices) for model, prices in (pricing or MODEL_PRICING).items()},
+        'overall': _aggregate(records),
+        'by_site': {site: _aggregate(site_records) for site, site_records in sorted(by_site.items())},
+        'rate_limiter': get_rate_limiter().stats(),
+    }
+
+
+SUMMARY_COLUMNS = ['tasks', 'attempts', 'retries', 'failures', 'tasks_per_hour', 'steps_per_task', 'llm_calls',
+                   'parse_failures', 'prompt_tokens', 'completion_tokens', 'image_tokens', 'cost_usd', 'cost_per_task_usd']
+
+
+def render_html(report):
+    def table(headers, rows):
+        head = ''.join(f'<th>{html.escape(str(h))}</th>' for h in headers)
+        body = ''.join('<tr>' + ''.join(f'<td>{html.escape(str(v))}</td>' for v in row) + '</tr>' for row in rows)
+        return f'<table><tr>{head}</tr>{body}</table>'
+
+    groups = [('overall', report['overall'])] + list(report['by_site'].items())
+    summary = table(['web_name'] + SUMMARY_COLUMNS,
+                    [[name] + [stats.get(column, '') for column in SUMMARY_COLUMNS] for name, stats in groups if stats])
+    phase_names = list(report['overall'].get('phase_seconds', {}))
+    phases = table(['web_name'] + phase_names,
+                   [[name] + [stats.get('phase_seconds', {}).get(phase, 0) for phase in phase_names]
+                    for name, stats in groups if stats]) if phase_names else '<p>No trace data (run with --trace).</p>'
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Run report</title>
+<style>body{{font-family:sans-serif;margin:2em}}table{{border-collapse:collapse;margin-bottom:2em}}
+td,th{{border:1px solid #ccc;padding:4px 8px;text-align:right}}th{{background:#f3f3f3}}td:first-child{{text-align:left}}</style>
+</head><body>
+<h1>Run report</h1>
+<p>{html.escape(report['result_dir'])}<br>generated {html.escape(report['generated_at'])}, code version {html.escape(str(report['code_version']))}</p>
+<h2>Throughput and cost</h2>{summary}
+<h2>Wall-clock by phase (seconds)</h2>{phases}
+</body></html>
+"""
+
+
+def write_run_report(result_dir, pricing=None):
+    """寫出 run_report.json 與 run_report.html，回傳報告內容"""
+    report = build_run_report(result_dir, pricing)
+    with open(os.path.join(result_dir, 'run_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(result_dir, 'run_report.html'), 'w', encoding='utf-8') as f:
+        f.write(render_html(report))
+    overall = report['overall']
+    if overall:
+        print(f"Run report: {overall['tasks']} tasks, {overall['tasks_per_hour']} tasks/hour, "
+              f"{overall['steps_per_task']} steps/task, ${overall['cost_usd']} total")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the run report of a result directory")
+    parser.add_argument('result_dir', type=str)
+    parser.add_argument('--pricing_file', type=str, default=None, help='JSON {model: [prompt, completion]} in USD per 1K tokens')
+    args = parser.parse_args()
+    write_run_report(args.result_dir, load_pricing(args.pricing_file) if args.pricing_file else None)
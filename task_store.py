@@ -0,0 +1,199 @@
+"""
+任務資料集的索引式讀取
+第一次讀取 data/*.jsonl 時建立旁置索引檔 <檔名>.idx.json (任務 id → 位元組偏移量、網站 → 任務 id)，
+之後依網站、id、分片挑選任務時只需 seek 到對應的行讀取，不必解析整個檔案。
+原始檔的大小或修改時間改變時索引會自動重建。
+
+分片 (--shard i/n) 依篩選後的檔案順序輪流分配，多台機器使用相同的篩選條件即可不重疊地分攤同一批任務。
+"""
+
+import json
+import os
+
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 1
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class TaskStore:
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.index = self._load_index() or self._build_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if index.get('version') != INDEX_VERSION or index.get('source') != _source_signature(self.path):
+            return None
+        return index
+
+    def _build_index(self):
+        offsets, sites, order = {}, {}, []
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    task = json.loads(line)
+                    task_id = str(task['id'])
+                    offsets[task_id] = offset
+                    sites.setdefault(task.get('web_name', ''), []).append(task_id)
+                    order.append(task_id)
+                offset += len(line)
+        index = {
+            'version': INDEX_VERSION,
+            'source': _source_signature(self.path),
+            'offsets': offsets,
+            'sites': sites,
+            'order': order,
+        }
+        # 資料目錄不可寫入時仍可使用記憶體中的索引
+        try:
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass
+        return index
+
+    def __len__(self):
+        return len(self.index['order'])
+
+    @property
+    def sites(self):
+        return list(self.index['sites'])
+
+    def get(self, task_id):
+        """以偏移量直接讀取單一任務"""
+        with open(self.path, 'rb') as f:
+            return self._read_at(f, self.index['offsets'][str(task_id)])
+
+    @staticmethod
+    def _read_at(f, offset):
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def select_ids(self, sites=None, ids=None, shard=None, exclude=None):
+        """
+        依檔案順序回傳符合條件的任務 id
+        Args:
+            sites: 只保留這些網站 (web_name)
+            ids: 只保留這些任務 id
+            shard: (i, n)，只保留篩選後第 i 個起每 n 個中的一個 (i 從 0 開始)
+            exclude: 要略過的任務 id (例如已完成的任務)
+        """
+        if sites:
+            unknown = [site for site in sites if site not in self.index['sites']]
+            if unknown:
+                raise ValueError(f'Unknown sites in {self.path}: {unknown}')
+            wanted = {task_id for site in sites for task_id in self.index['sites'][site]}
+            selected = [task_id for task_id in self.index['order'] if task_id in wanted]
+        else:
+            selected = list(self.index['order'])
+        if ids:
+            unknown = [task_id for task_id in ids if task_id not in self.index['offsets']]
+            if unknown:
+                raise ValueError(f'Unknown task ids in {self.path}: {unknown}')
+            wanted = set(ids)
+            selected = [task_id for task_id in selected if task_id in wanted]
+        if shard:
+            shard_index, shard_count = shard
+            selected = selected[shard_index::shard_count]
+        if exclude:
+            selected = [task_id for task_id in selected if task_id not in exclude]
+        return selected
+
+    def load(self, task_ids):
+        """依序讀取多個任務，共用同一個檔案代碼"""
+        with open(self.path, 'rb') as f:
+            return [self._read_at(f, self.index['offsets'][task_id]) for task_id in task_ids]
+
+
+def parse_shard(text):
+    """將 "1/4" 轉為 (1, 4)，分片編號從 0 開始"""
+    if not text:
+        return None
+    shard_index, _, shard_count = text.partition('/')
+    shard_index, shard_count = int(shard_index), int(shard_count)
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f'Invalid shard "{text}": expected i/n with 0 <= i < n')
+    return shard_index, shard_count
+
+
+def is_task_completed(task_dir):
+    """任務結束時兩個執行器都會寫出 interact_messages.json"""
+    return os.path.exists(os.path.join(task_dir, 'interact_messages.json'))
+
+
+def _iter_result_dirs(output_dir):
+    """結果目錄的結構為 <output_dir>/<時間戳記>/task<id>，也接受直接指定某次執行的目錄"""
+    if not os.path.isdir(output_dir):
+        return
+    yield output_dir
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.is_dir() and not entry.name.startswith('task'):
+                yield entry.path
+
+
+def completed_task_ids(output_dir):
+    """掃描既有的 task 目錄，回傳已執行完成的任務 id"""
+    completed = set()
+    for result_dir in _iter_result_dirs(output_dir):
+        with os.scandir(result_dir) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name.startswith('task') and is_task_completed(entry.path):
+                    completed.add(entry.name[len('task'):])
+    return completed
+
+
+def finally_evaluated_task_ids(output_dir):
+    """
+    run_langGraph_exp 的任務可能以 RAG 重試，只有評估成功或已用過 RAG 的任務才算完成。
+    從各次執行的 eval_attempts.jsonl 判斷。
+    """
+    completed = set()
+    for result_dir in _iter_result_dirs(output_dir):
+        path = os.path.join(result_dir, 'eval_attempts.jsonl')
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('Result') == 'SUCCESS' or record.get('Use_RAG'):
+                    completed.add(str(record.get('Task_ID')))
+    return completed
+
+
+def add_task_store_args(parser):
+    parser.add_argument("--sites", type=str, nargs='+', default=None, help="Only run tasks of these web_name values")
+    parser.add_argument("--ids", type=str, nargs='+', default=None, help="Only run these task ids")
+    parser.add_argument("--shard", type=str, default=None, help="Run shard i of n (i/n, 0-based) of the selected tasks")
+    parser.add_argument("--skip_completed", action='store_true', help="Skip tasks already finished under --output_dir")
+
+
+def load_tasks_from_args(args, completed_fn=completed_task_ids):
+    """依命令列參數從 --test_file 挑選要執行的任務"""
+    store = TaskStore(args.test_file)
+    task_ids = store.select_ids(args.sites, args.ids, parse_shard(args.shard))
+    skipped = 0
+    if args.skip_completed:
+        completed = completed_fn(args.output_dir)
+        skipped = sum(task_id in completed for task_id in task_ids)
+        task_ids = [task_id for task_id in task_ids if task_id not in completed]
+    print(f'Selected {len(task_ids)}/{len(store)} tasks from {args.test_file}'
+          + (f' (skipped {skipped} completed)' if skipped else ''))
+    return store.load(task_ids)
@@ -3,152 +3,166 @@ import re
 import datetime
 import random
 import os
-import pandas as pd
 import argparse
-from dateutil import parser
-from dateutil.relativedelta import relativedelta
+
+# 產品名稱佔位符
+PRODUCT_PLACEHOLDERS = {
+    'LAST_IPHONE': 'iPhone 16 pro',
+    'LAST_IPHONE2': 'iPhone 16',
+    'LAST_IPHONE2_COLOR': 'Pink',
+    'LAST_IPHONE2_STORAGE': '256GB',
+    'LAST_IPHONE3': 'iPhone 15',
+    'LAST_APPLE_WATCH': 'Series 10',
+    'LAST_IOS_VERSION': 'iOS 18',
+    'LAST_MACBOOK_CHIP': 'M4 Pro',
+    'LAST_AIRPODS': 'AirPods (4th Generation)',
+    'STORAGE': '256GB',
+}
+
+# 日期模板對應的格式，可附帶 +N / -N 天的偏移
+DATE_FORMATS = {
+    'YYYY_TEMPLATE': '%Y',
+    'MM_TEMPLATE': '%m',
+    'DD_TEMPLATE': '%d',
+    'YYYY_MM_TEMPLATE': '%B, %Y',
+    'MM_DD_TEMPLATE': '%B %d',
+    'YYYY_MM_DD_TEMPLATE': '%B %d, %Y',
+}
+PAST_TEMPLATES = ('YYYY_MM_DD_TEMPLATE_PAST', 'YYYY_YY_TEMPLATE_PAST')
+
+
+def _alternation(tokens):
+    # 長的 token 排在前面，避免 LAST_IPHONE2 先吃掉 LAST_IPHONE2_COLOR 的前綴
+    return '|'.join(re.escape(token) for token in sorted(tokens, key=len, reverse=True))
+
+
+# 所有 token 編成單一 pattern，一次掃描就完成整個問題的展開
+TOKEN_PATTERN = re.compile(
+    rf'(?P<date>{_alternation(list(DATE_FORMATS) + list(PAST_TEMPLATES))})(?P<offset>[+-]\d+)?'
+    rf'|(?P<product>{_alternation(PRODUCT_PLACEHOLDERS)})'
+)
+
+
+class TemplateExpander:
+    """
+    以單一編譯好的 pattern 展開日期模板與產品佔位符。
+    每個種子各自一個 random.Random，同一種子的輸出與逐題呼叫 random.seed 的舊版相同：
+    只有含日期模板的問題會抽一次隨機天數。
+    """
+
+    def __init__(self, seed=None, min_days=30, max_days=180, today=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.min_days = min_days
+        self.max_days = max_days
+        self.today = today or datetime.datetime.now()
+
+    def expand(self, question):
+        state = {}
+
+        def random_count():
+            # 第一次遇到日期模板時才抽，沒有日期模板的問題不消耗亂數
+            if 'count' not in state:
+                state['count'] = self.rng.randint(self.min_days, self.max_days)
+            return state['count']
+
+        def replace(match):
+            product = match.group('product')
+            if product:
+                return PRODUCT_PLACEHOLDERS[product]
+            template = match.group('date')
+            count = random_count()
+            if template == 'YYYY_MM_DD_TEMPLATE_PAST':
+                # 將日期設置為過去的日期
+                return (self.today - datetime.timedelta(days=count)).strftime('%B %d, %Y')
+            if template == 'YYYY_YY_TEMPLATE_PAST':
+                this_year = self.today.year
+                return str(this_year - 1) + '-' + str(this_year)[-2:]
+            offset_days = int(match.group('offset') or 0)
+            final_date = self.today + datetime.timedelta(days=count + offset_days)
+            return final_date.strftime(DATE_FORMATS[template])
+
+        return TOKEN_PATTERN.sub(replace, question)
+
+    def expand_item(self, item):
+        new_item = item.copy()
+        new_item['ques'] = self.expand(item.get('ques', ''))
+        return new_item
+
+
+def iter_jsonl(path):
+    """逐行讀取 JSONL，不一次載入整個檔案"""
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def seed_output_path(output_file, seed, multiple):
+    """多個種子時輸出到 <檔名>_seed<N>.jsonl，或以 {seed} 指定檔名格式"""
+    if '{seed}' in output_file:
+        return output_file.format(seed=seed)
+    if not multiple:
+        return output_file
+    root, ext = os.path.splitext(output_file)
+    return f'{root}_seed{seed}{ext or ".jsonl"}'
+
+
+def expand_file(input_file, output_file, seeds, min_days=30, max_days=180):
+    """讀取輸入一次，同時為每個種子產生一份展開後的資料集，回傳 {種子: 輸出路徑}"""
+    today = datetime.datetime.now()
+    expanders = [TemplateExpander(seed, min_days, max_days, today) for seed in seeds]
+    paths = {seed: seed_output_path(output_file, seed, len(seeds) > 1) for seed in seeds}
+    files = [open(paths[expander.seed], 'w', encoding='utf-8') for expander in expanders]
+    try:
+        for item in iter_jsonl(input_file):
+            for expander, f in zip(expanders, files):
+                f.write(json.dumps(expander.expand_item(item), ensure_ascii=False) + '\n')
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
 
 class TemplateReplacer:
     def __init__(self, json_path):
         self.json_path = json_path
-        self.data = self._read_json()
-
-    def _read_json(self):
-        """讀取JSON檔案"""
-        with open(self.json_path, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-        
-        data = []
-        for line in lines:
-            if line.strip():
-                data.append(json.loads(line))
-        return data
+
+    @property
+    def data(self):
+        return list(iter_jsonl(self.json_path))
+
+    def iter_replaced(self, seed=None, min_days=30, max_days=180):
+        """逐筆產生替換日期模板與產品名稱後的項目"""
+        expander = TemplateExpander(seed, min_days, max_days)
+        for item in iter_jsonl(self.json_path):
+            yield expander.expand_item(item)
 
     def replaced_dates(self, seed=None, min_days=30, max_days=180):
         """替換問題中的日期模板為未來半年內的隨機日期，以及替換Apple產品名稱"""
-        if seed is not None:
-            random.seed(seed)
-        
-        # 取得當前日期
-        today = datetime.datetime.now()
-        
-        # 複製資料以避免修改原始資料
-        replaced_data = []
-        
-        # 定義正則表達式模式來匹配模板和可能的日期偏移
-        template_pattern = r'(YYYY_MM_DD_TEMPLATE_PAST|YYYY_YY_TEMPLATE_PAST|YYYY_TEMPLATE|MM_TEMPLATE|DD_TEMPLATE|YYYY_MM_TEMPLATE|MM_DD_TEMPLATE|YYYY_MM_DD_TEMPLATE)([+-]\d+)?'
-
-        for item in self.data:
-            question = item.get('ques', '')
-            
-            # 檢查是否有任何模板匹配
-            if re.search(template_pattern, question):
-                # 生成一個未來隨機天數作為基準日期
-                random_count = random.randint(min_days, max_days)
-                base_date = today + datetime.timedelta(days=random_count)
-
-                # 找到所有模板匹配並替換
-                def replace_template(match):
-                    template = match.group(1)
-                    offset_str = match.group(2) or ""
-                    
-                    # 解析日期偏移量
-                    offset_days = 0
-                    if offset_str:
-                        offset_days = int(offset_str)
-                    
-                    # 計算最終日期
-                    final_date = base_date + datetime.timedelta(days=offset_days)
-                    
-                    # 根據模板類型，格式化日期
-                    if template == 'YYYY_TEMPLATE':
-                        return final_date.strftime('%Y')
-                    elif template == 'MM_TEMPLATE':
-                        return final_date.strftime('%m')
-                    elif template == 'DD_TEMPLATE':
-                        return final_date.strftime('%d')
-                    elif template == 'YYYY_MM_TEMPLATE':
-                        return final_date.strftime('%B, %Y')
-                    elif template == 'MM_DD_TEMPLATE':
-                        return final_date.strftime('%B %d')
-                    elif template == 'YYYY_MM_DD_TEMPLATE':
-                        return final_date.strftime('%B %d, %Y')
-                    elif template == 'YYYY_MM_DD_TEMPLATE_PAST':
-                        # 將日期設置為過去的日期
-                        past_date = today - datetime.timedelta(days=random_count)
-                        return past_date.strftime('%B %d, %Y')
-                    elif template == 'YYYY_YY_TEMPLATE_PAST':
-                        # 將日期設置為過去的日期
-                        this_year = today.year
-                        return str(this_year - 1) + '-' + str(this_year)[-2:]
-                    return match.group(0)  # 如果無法識別模板，保持原樣
-                
-                # 使用正則表達式替換所有匹配項
-                question = re.sub(template_pattern, replace_template, question)
-            
-            # 替換Apple產品名稱
-            question = self._replace_apple_production(question)
-            
-            # 創建替換後的新項目
-            new_item = item.copy()
-            new_item['ques'] = question
-            replaced_data.append(new_item)
-        
-        return replaced_data
-
-    def _replace_apple_production(self, text):
-        """替換問題中的Apple產品名稱"""
-        LAST_IPHONE = 'iPhone 16 pro'
-        LAST_IPHONE2 = 'iPhone 16'
-        LAST_IPHONE2_COLOR = 'Pink'
-        LAST_IPHONE3 = 'iPhone 15'
-        LAST_APPLE_WATCH = 'Series 10'
-        LAST_IOS_VERSION = 'iOS 18'
-        LAST_MACBOOK_CHIP = 'M4 Pro'
-        LAST_AIRPODS = 'AirPods (4th Generation)'
-        STORAGE = '256GB'
-
-        
-        text = text.replace("LAST_IPHONE2", LAST_IPHONE2)
-        text = text.replace("LAST_IPHONE2_COLOR", LAST_IPHONE2_COLOR)
-        text = text.replace("LAST_IPHONE3", LAST_IPHONE3)
-        text = text.replace("LAST_IPHONE", LAST_IPHONE)
-        text = text.replace("LAST_APPLE_WATCH", LAST_APPLE_WATCH)
-        text = text.replace("LAST_IOS_VERSION", LAST_IOS_VERSION)
-        text = text.replace("LAST_MACBOOK_CHIP", LAST_MACBOOK_CHIP)
-        text = text.replace("LAST_AIRPODS", LAST_AIRPODS)
-        text = text.replace("STORAGE", STORAGE)
-        
-        
-        return text
+        return list(self.iter_replaced(seed, min_days, max_days))
 
 # 使用範例
 def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_file', type=str, default='')
-    parser.add_argument('--output_file', type=str, default='')
+    parser.add_argument('--output_file', type=str, default='',
+                        help='Output JSONL; with several seeds "_seed<N>" is appended unless the name contains {seed}')
     parser.add_argument("--min_days", type=int, default=30)
     parser.add_argument("--max_days", type=int, default=180)
     parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--seeds", type=int, nargs='+', default=None, help="Generate one variant per seed in a single pass")
+    parser.add_argument("--num_variants", type=int, default=1, help="Generate seeds seed, seed+1, ... (ignored with --seeds)")
 
     args = parser.parse_args()
 
-    json_path = args.input_file
-    replacer = TemplateReplacer(json_path)
-    
+    seeds = args.seeds or list(range(args.seed, args.seed + args.num_variants))
     # 設定隨機種子以獲得可重現的結果，同時替換日期和Apple產品名稱
-    replaced_data = replacer.replaced_dates(seed=args.seed, 
-                                            min_days=args.min_days, 
-                                            max_days=args.max_days)
-
-    # 將結果保存為新的JSONL檔案
-    output_path = args.output_file
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for item in replaced_data:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    print(f"\n替換後資料已儲存至: {output_path}")
+    paths = expand_file(args.input_file, args.output_file, seeds, args.min_days, args.max_days)
+
+    for seed, path in paths.items():
+        print(f"\n替換後資料已儲存至: {path} (seed={seed})")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
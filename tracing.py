@@ -0,0 +1,159 @@
+"""
+LangGraph 節點與子階段的耗時追蹤
+每個任務的 span 寫成 Chrome trace-event JSON (<task_dir>/trace.json，可在 chrome://tracing 或 Perfetto 開啟)，
+整次執行再依 span 名稱彙整次數、總時間與 p50 / p95，寫入 <result_dir>/trace_summary.json。
+
+未啟用 (--trace) 或目前執行緒沒有進行中的任務時，span 不做任何事，額外開銷可忽略。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_enabled = False
+_local = threading.local()
+# 整次執行各 span 名稱的耗時 (秒)
+_run_durations = {}
+_run_lock = threading.Lock()
+
+
+class Tracer:
+    """收集單一任務的 span，時間以任務開始為原點"""
+
+    def __init__(self, task_id=None):
+        self.task_id = task_id
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+
+    def add(self, name, cat, start, end, args=None):
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': round((start - self.origin) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def write(self, path):
+        metadata = {'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': f'task {self.task_id}'}}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': [metadata] + self.events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+def configure_tracing(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def current_tracer():
+    return getattr(_local, 'tracer', None)
+
+
+def start_task(task_id):
+    """開始記錄一個任務，之後同一執行緒的 span 都歸到這個任務"""
+    _local.tracer = Tracer(task_id) if _enabled else None
+    return _local.tracer
+
+
+def finish_task(task_dir, filename='trace.json'):
+    """寫出任務的 trace 檔並把耗時併入整次執行的統計"""
+    tracer = current_tracer()
+    _local.tracer = None
+    if tracer is None:
+        return None
+    path = os.path.join(task_dir, filename)
+    tracer.write(path)
+    with _run_lock:
+        for event in tracer.events:
+            _run_durations.setdefault(event['name'], []).append(event['dur'] / 1e6)
+    return path
+
+
+@contextmanager
+def span(name, cat='phase', **args):
+    tracer = current_tracer()
+    if tracer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.add(name, cat, start, time.perf_counter(), args or None)
+
+
+def traced_node(name, fn):
+    """包裝 LangGraph 節點，整個節點記為一個 span"""
+    @wraps(fn)
+    def wrapper(state):
+        with span(name, cat='node'):
+            return fn(state)
+    return wrapper
+
+
+def sleep(seconds, name='action.sleep'):
+    """time.sleep 的追蹤版本，讓固定等待的時間在 trace 中可見"""
+    with span(name, seconds=seconds):
+        time.sleep(seconds)
+
+
+def percentile(values, q):
+    """線性內插的百分位數，values 需已排序"""
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def run_summary():
+    """各 span 名稱的次數、總時間、平均、p50、p95 與最大值 (秒)，依總時間排序"""
+    with _run_lock:
+        durations = {name: sorted(values) for name, values in _run_durations.items()}
+    summary = {}
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        summary[name] = {
+            'count': len(values),
+            'total': round(sum(values), 3),
+            'mean': round(sum(values) / len(values), 3),
+            'p50': round(percentile(values, 50), 3),
+            'p95': round(percentile(values, 95), 3),
+            'max': round(values[-1], 3),
+        }
+    return summary
+
+
+def write_run_summary(result_dir, filename='trace_summary.json'):
+    if not _enabled:
+        return None
+    summary = run_summary()
+    with open(os.path.join(result_dir, filename), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    lines = [f"{'phase':<28}{'count':>7}{'total':>10}{'p50':>9}{'p95':>9}"]
+    for name, stats in summary.items():
+        lines.append(f"{name:<28}{stats['count']:>7}{stats['total']:>10.2f}{stats['p50']:>9.3f}{stats['p95']:>9.3f}")
+    logging.info('Trace summary (seconds):\n' + '\n'.join(lines))
+    print('\n'.join(lines))
+    return summary
+
+
+def task_phase_seconds():
+    """目前任務各 span 名稱的累計秒數，需在 finish_task 之前呼叫"""
+    tracer = current_tracer()
+    if tracer is None:
+        return {}
+    totals = {}
+    for event in tracer.events:
+        totals[event['name']] = totals.get(event['name'], 0.0) + event['dur'] / 1e6
+    return {name: round(seconds, 3) for name, seconds in totals.items()}
@@ -0,0 +1,190 @@
+"""
+逐步軌跡紀錄模組
+每一步以一行 JSON 追加寫入 task_dir/trajectory.jsonl，由背景執行緒負責寫檔與 flush，
+代理迴圈只需把紀錄放進佇列，不會被磁碟 I/O 阻塞；程式中途崩潰時也只會遺失尚未寫出的最後幾筆。
+
+紀錄類型:
+- task:   每次啟動瀏覽器 (含 RAG 重試) 時寫入，包含任務資訊與是否使用 RAG
+- step:   每次 LLM 呼叫後寫入，包含觀察檔案參照、prompt hash、回覆、解析後的動作、耗時與 token 數
+- action: action 節點執行完畢後寫入
+- end:    任務結束時寫入
+
+step / action / end 紀錄附上當下的累計計數 (iteration、cost、action_stats)，
+寫入器同時保留最後一份 (progress)，任務崩潰、graph 沒有回傳狀態時仍可寫出實際的步驟數與花費。
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+TRAJECTORY_FILE = 'trajectory.jsonl'
+# 累計計數欄位，寫入時複製一份，避免背景執行緒序列化時狀態已被修改
+PROGRESS_FIELDS = ('iteration', 'cost', 'action_stats')
+
+_SENTINEL = object()
+
+
+def trajectory_path(task_dir):
+    return os.path.join(task_dir, TRAJECTORY_FILE)
+
+
+def strip_images(messages):
+    """回傳移除 base64 圖片的訊息副本，不修改原本的訊息"""
+    stripped = []
+    for msg in messages:
+        content = msg.get('content')
+        if isinstance(content, list):
+            content = [
+                {'type': 'image_url', 'image_url': {"url": "data:image/png;base64,{b64_img}"}}
+                if item.get('type') == 'image_url' else item
+                for item in content
+            ]
+        stripped.append({'role': msg.get('role'), 'content': content})
+    return stripped
+
+
+def message_text(msg):
+    """取出訊息中的文字部分"""
+    content = msg.get('content')
+    if isinstance(content, list):
+        return "\n".join(item.get('text', '') for item in content if item.get('type') == 'text')
+    return content or ""
+
+
+def prompt_hash(messages):
+    """以訊息內容計算 prompt 指紋，圖片以其 base64 內容參與計算"""
+    digest = hashlib.sha256()
+    for msg in messages:
+        digest.update(str(msg.get('role')).encode('utf-8'))
+        content = msg.get('content')
+        if isinstance(content, list):
+            for item in content:
+                if item.get('type') == 'image_url':
+                    digest.update(item['image_url']['url'].encode('utf-8'))
+                else:
+                    digest.update(item.get('text', '').encode('utf-8'))
+        else:
+            digest.update(str(content).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class TrajectoryWriter:
+    """以背景執行緒追加寫入 JSONL，每筆寫出後立即 flush"""
+
+    def __init__(self, task_dir, filename=TRAJECTORY_FILE):
+        self.path = os.path.join(task_dir, filename)
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._seq = 0
+        self.progress = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='trajectory-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            # 上一次執行若在寫到一半時中斷，先補上換行，避免新紀錄接在殘缺的行後面
+            if f.tell() > 0:
+                with open(self.path, 'rb') as check:
+                    check.seek(-1, os.SEEK_END)
+                    if check.read(1) != b"\n":
+                        f.write("\n")
+            while True:
+                record = self._queue.get()
+                if record is _SENTINEL:
+                    self._queue.task_done()
+                    break
+                try:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + "\n")
+                    f.flush()
+                except Exception as e:
+                    logging.warning(f'Failed to write trajectory record: {e}')
+                finally:
+                    self._queue.task_done()
+
+    def note(self, **fields):
+        """暫存欄位 (例如觀察耗時)，併入下一筆 step 紀錄"""
+        self._pending.update(fields)
+
+    def write(self, record_type, **fields):
+        if self._closed:
+            return
+        record = {'type': record_type, 'seq': self._seq, 'ts': time.time()}
+        if record_type == 'step' and self._pending:
+            record.update(self._pending)
+            self._pending = {}
+        for name in PROGRESS_FIELDS:
+            if name in fields:
+                fields[name] = copy.deepcopy(fields[name])
+                self.progress[name] = fields[name]
+        record.update(fields)
+        self._seq += 1
+        self._queue.put(record)
+
+    def flush(self):
+        """等待已排入的紀錄全部寫出，寫入器維持開啟"""
+        if not self._closed:
+            self._queue.join()
+
+    def close(self):
+        """寫入剩餘紀錄並結束背景執行緒"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_SENTINEL)
+        self._thread.join()
+
+
+def load_trajectory(task_dir, filename=TRAJECTORY_FILE):
+    """逐行讀取軌跡紀錄；崩潰時可能出現不完整的最後一行，直接略過"""
+    path = os.path.join(task_dir, filename)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f'Skipping truncated trajectory line in {path}')
+
+
+def last_attempt(records):
+    """只保留最後一次嘗試 (最後一筆 task 紀錄之後) 的紀錄"""
+    attempt = []
+    for record in records:
+        if record.get('type') == 'task':
+            attempt = []
+        attempt.append(record)
+    return attempt
+
+
+def trajectory_to_messages(records):
+    """
+    將軌跡轉回與 interact_messages.json 相同格式的訊息列表 (不含圖片)，
+    讓既有的評估流程可以直接使用
+    """
+    messages = []
+    for record in records:
+        if record.get('type') == 'task' and record.get('system_prompt'):
+            messages = [{'role': 'system', 'content': record['system_prompt']}]
+        elif record.get('type') == 'step':
+            messages.append({'role': 'user', 'content': [{'type': 'text', 'text': record.get('user_text', '')}]})
+            if record.get('response') is not None:
+                messages.append({'role': 'assistant', 'content': record['response']})
+    return messages
+
+
+def load_messages(task_dir):
+    """優先從 trajectory.jsonl 串流重建訊息，沒有時讀取 interact_messages.json"""
+    if os.path.exists(trajectory_path(task_dir)):
+        messages = trajectory_to_messages(last_attempt(load_trajectory(task_dir)))
+        if messages:
+            return messages
+    with open(os.path.join(task_dir, 'interact_messages.json'), encoding='utf-8') as fr:
+        return json.load(fr)
@@ -6,6 +6,8 @@ import time
 import logging
 import numpy as np
 from PIL import Image
+from langchain_core.tools import tool
+from image_prep import register_capture
 from utils_webarena import fetch_browser_info, fetch_page_accessibility_tree,\
                     parse_accessibility_tree, clean_accesibility_tree
 
@@ -32,7 +34,10 @@ def resize_image(image_path):
 # Code from OpenAI Document
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        b64 = base64.b64encode(image_file.read()).decode('utf-8')
+    # 登記擷取時的 base64，讓同一行程內的評估可直接沿用
+    register_capture(image_path, b64)
+    return b64
 
 
 # interact with webpage and add rectangles on elements
@@ -332,29 +337,141 @@ def get_web_element_rect(browser, fix_color=True, detect_all=False):
     return rects, filtered_elements, format_ele_text
 
 
+# 單一編譯後的動作解析式，取代逐一嘗試的多個正規表達式
+ACTION_PATTERN = re.compile(
+    r"Click \[?(?P<click>\d+)\]?"
+    r"|Type \[?(?P<type_number>\d+)\]?[; ]+\[?(?P<type_content>.[^\]]*)\]?"
+    r"|Scroll \[?(?P<scroll_number>\d+|WINDOW)\]?[; ]+\[?(?P<scroll_content>up|down)\]?"
+    r"|^(?P<wait>Wait)"
+    r"|^(?P<goback>GoBack)"
+    r"|^(?P<google>Google)"
+    r"|ANSWER[; ]+\[?(?P<answer>.[^\]]*)\]?"
+)
+ACTION_SEGMENT_PATTERN = re.compile(r"Action:(.*?)(?=Thought:|Action:|Observation:|$)", re.S)
+
 def extract_information(text):
-    patterns = {
-        "click": r"Click \[?(\d+)\]?",
-        "type": r"Type \[?(\d+)\]?[; ]+\[?(.[^\]]*)\]?",
-        # "delete_and_type": r"Delete_and_Type \[?(\d+)\]?[; ]+\[?(.[^\]]*)\]?",
-        "scroll": r"Scroll \[?(\d+|WINDOW)\]?[; ]+\[?(up|down)\]?",
-        "wait": r"^Wait",
-        "goback": r"^GoBack",
-        "google": r"^Google",
-        "answer": r"ANSWER[; ]+\[?(.[^\]]*)\]?"
-    }
-
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text)
-        if match:
-            if key in ["click", "wait", "goback", "google"]:
-                # no content
-                return key, match.groups()
-            else:
-                return key, {"number": match.group(1), "content": match.group(2)} if key in ["type", "scroll"] else {"content": match.group(1)}
+    match = ACTION_PATTERN.search(text)
+    if not match:
+        return None, None
+    groups = match.groupdict()
+    if groups["click"] is not None:
+        return "click", (groups["click"],)
+    if groups["type_number"] is not None:
+        return "type", {"number": groups["type_number"], "content": groups["type_content"]}
+    if groups["scroll_number"] is not None:
+        return "scroll", {"number": groups["scroll_number"], "content": groups["scroll_content"]}
+    if groups["answer"] is not None:
+        return "answer", {"content": groups["answer"]}
+    for key in ["wait", "goback", "google"]:
+        if groups[key] is not None:
+            # no content
+            return key, ()
     return None, None
 
 
+def split_action_texts(response):
+    """取出回覆中所有 Action: 段落；沒有 Action: 標記時視整段回覆為動作"""
+    segments = [seg.strip() for seg in ACTION_SEGMENT_PATTERN.findall(response or "") if seg.strip()]
+    return segments if segments else [(response or "").strip()]
+
+
+def parse_action_response(response):
+    return extract_information(split_action_texts(response)[0])
+
+
+@tool
+def browser_action(action: str, element: str = "", content: str = "", thought: str = "") -> str:
+    """Perform exactly one browser action on the current web page.
+
+    Args:
+        action: One of Click, Type, Scroll, Wait, GoBack, Google, ANSWER.
+        element: Numerical label of the target web element, or WINDOW for Scroll. Empty for Wait, GoBack, Google and ANSWER.
+        content: Text to type for Type, up or down for Scroll, the final answer for ANSWER. Empty otherwise.
+        thought: Brief thoughts that summarize the information that will help to answer.
+    """
+    return action
+
+
+_ACTION_NAMES = {name.lower(): name for name in ["Click", "Type", "Scroll", "Wait", "GoBack", "Google", "ANSWER"]}
+
+
+def format_structured_action(action, element="", content=""):
+    """把 {action, element, content} 轉成原本的文字動作格式"""
+    name = _ACTION_NAMES.get(str(action).strip().lower().replace("_", ""), str(action).strip())
+    element = str(element or "").strip().strip("[]")
+    content = str(content or "").strip()
+    if name == "Click":
+        return f"Click [{element}]"
+    if name == "Type":
+        return f"Type [{element}]; {content}"
+    if name == "Scroll":
+        return f"Scroll [{element or 'WINDOW'}]; {content or 'down'}"
+    if name == "ANSWER":
+        return f"ANSWER; {content}"
+    return name
+
+
+def reply_text(content):
+    """LLM 回覆內容的文字；Gemini 等多模態供應商回傳 list 形式的 parts 時串接其中的文字"""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type", "text") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+
+def structured_action_to_text(response):
+    """
+    從 LLM 回覆取得 Thought/Action 文字。
+    依序使用 tool call、內容中的 JSON 物件，最後才是原本的文字格式。
+    回傳 (文字, 來源)
+    """
+    content = reply_text(response.content)
+    tool_calls = getattr(response, "tool_calls", None) or []
+    if tool_calls:
+        args = tool_calls[0].get("args", {})
+        thought = args.get("thought") or content.strip()
+        # 多個 tool call 依序轉為多行 Action，供批次動作模式使用
+        action_lines = "\n".join(
+            "Action: " + format_structured_action(call.get("args", {}).get("action", ""),
+                                                  call.get("args", {}).get("element", ""),
+                                                  call.get("args", {}).get("content", ""))
+            for call in tool_calls
+        )
+        return f"Thought: {thought}\n{action_lines}", "tool_call"
+
+    stripped = content.strip()
+    if stripped.startswith("{") and stripped.endswith("}"):
+        try:
+            data = json.loads(stripped)
+            if isinstance(data, dict) and "action" in data:
+                action_text = format_structured_action(data["action"], data.get("element", ""), data.get("content", ""))
+                return f"Thought: {data.get('thought', '')}\nAction: {action_text}", "json_content"
+        except json.JSONDecodeError:
+            pass
+    return content, "text"
+
+
+def normalize_llm_reply(response, stats=None):
+    """
+    把 LLM 回覆統一為 Thought/Action 文字。
+    stats 為任務的 ActionStats：parse_tool_call / parse_json_content / parse_text 累計回覆來源，
+    parse_failed 累計無法解析的回覆
+    """
+    text, source = structured_action_to_text(response)
+    if stats is not None:
+        stats[f"parse_{source}"] = stats.get(f"parse_{source}", 0) + 1
+    if parse_action_response(text)[0] is None:
+        if stats is not None:
+            stats["parse_failed"] = stats.get("parse_failed", 0) + 1
+        logging.warning(f"Unable to parse action from reply ({source}): {text[:200]}")
+    return text
+
+
 def clip_message(msg, max_img_num):
     clipped_msg = []
     img_num = 0
@@ -436,13 +553,15 @@ def print_message(json_object, save_dir=None):
                 logging.info(str(obj))
                 remove_b64code_obj.append(obj)
             else:
+                # 複製內容後再替換圖片，避免修改仍在使用中的訊息
                 print_obj = {
                     'role': obj['role'],
-                    'content': obj['content']
+                    'content': [
+                        {'type': 'image_url', 'image_url': {"url": "data:image/png;base64,{b64_img}"}}
+                        if item['type'] == 'image_url' else item
+                        for item in obj['content']
+                    ]
                 }
-                for item in print_obj['content']:
-                    if item['type'] == 'image_url':
-                        item['image_url'] =  {"url": "data:image/png;base64,{b64_img}"}
                 
                 # 將物件轉換為 JSON 字串，並設置 ensure_ascii=False 以保留 Unicode 字符
                 try: